@@ -0,0 +1,180 @@
+"""
+Local stand-in of the OpenAI endpoints used by the generator, for benchmarks and CI.
+
+Implements POST /v1/chat/completions (plain text, hashtags and json_schema answers),
+POST /v1/images/generations (urls served by the same app) and GET /stats (calls
+and injected errors). Latency is uniform in [latency * (1 - jitter), latency * (1 + jitter)]
+and error_rate of the requests fail with a 429 or a 500.
+
+Usage:
+    python -m benchmarks.fake_openai_server [--port 8765] [--latency-ms 300] [--error-rate 0.05]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ...
+"""
+import io
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from aiohttp import web
+from PIL import Image
+
+FAKE_TEXT = (
+    "El amor no se mide por los días compartidos sino por la forma en que nos "
+    "acompañamos en los silencios, en las dudas y en cada nuevo comienzo."
+)
+FAKE_HASHTAGS = ["#Amor", "#Reflexión", "#Vida", "#Esperanza", "#Coexistir", "#Empatía", "#Fe", "#Unidad"]
+
+
+def get_text(limit=None):
+    text = FAKE_TEXT
+    if limit:
+        text = text[:max(int(limit) - 1, 1)]
+    return text
+
+
+def get_schema_answer(schema):
+    """A value for every property of a json_schema response format"""
+    answer = {}
+    for name, spec in schema.get("properties", {}).items():
+        if spec.get("type") == "array":
+            answer[name] = random.sample(FAKE_HASHTAGS, 4)
+        else:
+            answer[name] = get_text(200)
+    return answer
+
+
+class FakeOpenaiServer:
+    def __init__(self, latency_ms=300, image_latency_ms=1500, jitter=0.3, error_rate=0.0,
+                 requests_per_minute=10_000, tokens_per_minute=10_000_000, image_size=1024):
+        self.latency_ms = latency_ms
+        self.image_latency_ms = image_latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.image_size = image_size
+        self.stats = {"chat.completions": 0, "images.generate": 0, "image_downloads": 0, "errors_429": 0, "errors_500": 0}
+        self._image = None
+
+    def get_image_bytes(self):
+        if self._image is None:
+            buffer = io.BytesIO()
+            # Noise so the file has the size and compressibility of a real picture
+            size = (self.image_size, self.image_size)
+            Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)).save(buffer, "PNG")
+            self._image = buffer.getvalue()
+        return self._image
+
+    async def wait(self, latency_ms):
+        factor = random.uniform(1 - self.jitter, 1 + self.jitter)
+        await asyncio.sleep(max(latency_ms * factor, 0) / 1000)
+
+    def get_headers(self):
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(self.requests_per_minute - 1),
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-tokens": str(self.tokens_per_minute - 1000),
+        }
+
+    def get_injected_error(self):
+        if random.random() >= self.error_rate:
+            return None
+        if random.random() < 0.5:
+            self.stats["errors_429"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_exceeded"}},
+                status=429, headers={**self.get_headers(), "retry-after-ms": "200"}
+            )
+        self.stats["errors_500"] += 1
+        return web.json_response({"error": {"message": "Server error (fake)", "type": "server_error"}}, status=500)
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        self.stats["chat.completions"] += 1
+        await self.wait(self.latency_ms)
+        error = self.get_injected_error()
+        if error is not None:
+            return error
+
+        messages = body.get("messages", [])
+        prompt = " ".join(str(message.get("content", "")) for message in messages)
+        system = str(messages[0].get("content", "")) if messages else ""
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(get_schema_answer(response_format["json_schema"]["schema"]), ensure_ascii=False)
+        elif "generates hashtags" in system:
+            content = " ".join(random.sample(FAKE_HASHTAGS, 4))
+        else:
+            content = get_text(200)
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }, headers=self.get_headers())
+
+    async def images_generate(self, request):
+        await request.json()
+        self.stats["images.generate"] += 1
+        await self.wait(self.image_latency_ms)
+        error = self.get_injected_error()
+        if error is not None:
+            return error
+        url = f"{request.scheme}://{request.host}/files/{uuid.uuid4().hex}.png"
+        return web.json_response({"created": int(time.time()), "data": [{"url": url}]}, headers=self.get_headers())
+
+    async def image_file(self, request):
+        self.stats["image_downloads"] += 1
+        return web.Response(body=self.get_image_bytes(), content_type="image/png")
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/images/generations", self.images_generate)
+        app.router.add_get("/files/{name}", self.image_file)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Starts serving in the running loop, returns (runner, base_url of the OpenAI client)"""
+        self.get_image_bytes()
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--image-latency-ms", type=float, default=1500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenaiServer(args.latency_ms, args.image_latency_ms, error_rate=args.error_rate)
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1")
+    web.run_app(server.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
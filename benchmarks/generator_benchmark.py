@@ -0,0 +1,207 @@
+"""
+Throughput of PostGeneratorService against the fake OpenAI server, without network
+or costs: generate_posts over synthetic unprocessed posts, then one generate_post per
+post (as the scheduled runs do). Reports posts/min, p50/p95 per stage and the calls
+the server received.
+
+Usage:
+    python -m benchmarks.generator_benchmark [--posts 6] [--latency-ms 300]
+        [--image-latency-ms 1500] [--error-rate 0] [--mode fields|bundled] [--json]
+
+POST_GENERATION_CONCURRENCY, POST_MEDIA_CONCURRENCY, OPENAI_MODEL_CONCURRENCY... are
+read from the environment as usual.
+"""
+import os
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+
+from benchmarks.fake_openai_server import FakeOpenaiServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def prepare_project(root, total_posts):
+    """PROJECT_ROOT with empty post files, total_posts unprocessed phrases and the repo assets"""
+    for folder in ("json/unprocessed", "json/processed", "json/data", "public/uploads"):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    shutil.copy(os.path.join(REPO_DIR, "json", "data", "app-data.json"), os.path.join(root, "json", "data", "app-data.json"))
+    os.symlink(os.path.join(REPO_DIR, "assets"), os.path.join(root, "assets"))
+
+    unprocessed = {"posts": [
+        {"phrase": f"La luz y la sombra bailan juntas, y en esa danza descubrimos quienes somos ({index}).", "topic": "Dualidad"}
+        for index in range(total_posts)
+    ]}
+    files = {
+        "unprocessed/unprocessed-posts.json": unprocessed,
+        "processed/processed-posts.json": {"posts": []},
+        "posts.json": {"posts": []},
+    }
+    for name, data in files.items():
+        with open(os.path.join(root, "json", name), "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+
+
+def set_environment(root, base_url, mode):
+    os.environ.update({
+        "PROJECT_ROOT": root,
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_CONTENT_MODEL": "gpt-4o",
+        "OPENAI_CONTENT_MODEL_2": "gpt-4o-mini",
+        "OPENAI_IMAGE_MODEL": "dall-e-3",
+        "OPENAI_RATE_LIMITS": "",
+        "OPENAI_CACHE_ENABLED": "false",
+        "ALLOW_OPENAI_IMAGE_GENERATION": "true",
+        "ALLOW_REMOTE_UPLOAD": "false",
+        "POST_PREGENERATION_ENABLED": "false",
+        "POST_GENERATION_MODE": mode,
+        "POSTS_JSON_FILE": "posts.json",
+        "PROCESSED_POSTS_JSON_FILE": "processed/processed-posts.json",
+        "UNPROCESSED_POSTS_JSON_FILE": "unprocessed/unprocessed-posts.json",
+        "APP_DATA_JSON_FILE": "data/app-data.json",
+    })
+    # Rendering settings of .env.example, for the assets shipped in the repo
+    for name, value in {
+        "RANDOM_BACKGROUND": "true",
+        "WATERMARK_IMAGE_DARK": "logo_coexist_dark_watermark.png",
+        "WATERMARK_IMAGE_LIGHT": "logo_coexist_light_watermark.png",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+def instrument(durations, stage, owner, name):
+    """Replaces owner.name with a wrapper timing every call into durations[stage]"""
+    func = getattr(owner, name)
+
+    if asyncio.iscoroutinefunction(func):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                durations[stage].append(time.perf_counter() - started)
+    else:
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                durations[stage].append(time.perf_counter() - started)
+
+    setattr(owner, name, timed)
+
+
+async def run_benchmark(total_posts, latency_ms, image_latency_ms, error_rate, mode):
+    server = FakeOpenaiServer(latency_ms, image_latency_ms, error_rate=error_rate)
+    runner, base_url = await server.start()
+    root = tempfile.mkdtemp(prefix="generator-benchmark-")
+    prepare_project(root, total_posts)
+    set_environment(root, base_url, mode)
+
+    # Services read their settings when imported
+    from services.post.post_generator_service import PostGeneratorService
+    from services.ai.openai_service import close_clients
+    from services.ai.openai_rate_limiter import get_rate_limiter_stats
+    from services.image.image_render_service import get_render_service
+
+    try:
+        await get_render_service().start()
+        generator = PostGeneratorService()
+        durations = defaultdict(list)
+        for name in ("generate_post_content", "generate_hashtags", "generate_default_phrase",
+                     "generate_prompt_image_from_idea", "generate_post_fields"):
+            instrument(durations, f"openai.{name}", generator.openai_service, name)
+        image_service = generator.image_service_handler
+        instrument(durations, "openai.generate_image", image_service.openai_service_handler, "generate_image_from_prompt")
+        # Renders run in the render workers, timed from here including the wait for a worker
+        instrument(durations, "image.render", image_service, "generate_image")
+        instrument(durations, "image.render_many", image_service, "generate_images")
+        # Renders optimize inside the workers with IMAGE_OPTIMIZER=pillow, only the
+        # generated images are timed here then
+        instrument(durations, "image.optimize", image_service, "optimize_image")
+        instrument(durations, "media", generator, "generate_media_by_post_type")
+        instrument(durations, "upload", generator.upload_service, "upload_file")
+        instrument(durations, "generate_post", generator, "generate_post")
+
+        started = time.perf_counter()
+        await generator.generate_posts()
+        generate_posts_seconds = time.perf_counter() - started
+
+        processed = 0
+        started = time.perf_counter()
+        for _ in range(total_posts):
+            if not await generator.generate_post():
+                break
+            processed += 1
+        elapsed = time.perf_counter() - started
+
+        rate_limits = get_rate_limiter_stats()
+    finally:
+        await close_clients()
+        get_render_service().shutdown()
+        await runner.cleanup()
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "mode": mode,
+        "posts": processed,
+        "seconds": round(elapsed, 3),
+        "posts_per_minute": round(processed * 60 / elapsed, 2) if elapsed else 0,
+        "generate_posts_seconds": round(generate_posts_seconds, 3),
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "total_s": round(sum(values), 3),
+            }
+            for stage, values in sorted(durations.items())
+        },
+        "server_calls": server.stats,
+        "retries": sum(stats["retries"] for stats in rate_limits.values()),
+    }
+
+
+def print_report(report):
+    print(f"mode: {report['mode']}  posts: {report['posts']}  time: {report['seconds']}s  "
+          f"posts/min: {report['posts_per_minute']}  generate_posts: {report['generate_posts_seconds']}s")
+    print(f"{'stage':<40} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'total s':>9}")
+    for stage, values in report["stages"].items():
+        print(f"{stage:<40} {values['count']:>6} {values['p50_ms']:>9.1f} {values['p95_ms']:>9.1f} {values['total_s']:>9.3f}")
+    print("server calls: " + ", ".join(f"{name}={count}" for name, count in report["server_calls"].items())
+          + f", client retries={report['retries']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PostGeneratorService throughput against the fake OpenAI server")
+    parser.add_argument("--posts", type=int, default=6)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--image-latency-ms", type=float, default=1500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mode", choices=["fields", "bundled"], default=os.getenv("POST_GENERATION_MODE", "fields"))
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args.posts, args.latency_ms, args.image_latency_ms, args.error_rate, args.mode))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
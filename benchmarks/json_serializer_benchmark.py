@@ -0,0 +1,80 @@
+"""
+Load/dump times of the JSON store serializers for 1k, 10k and 100k posts.
+
+Usage:
+    python -m benchmarks.json_serializer_benchmark [sizes...]
+"""
+import sys
+import time
+
+from utils.json_utils import JSONSerializer, orjson
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+REPEAT = 3
+
+
+def build_post(post_id):
+    """Synthetic post shaped like PostGeneratorService.get_base_post, with typical text sizes"""
+    return {
+        "id": post_id,
+        "x_content": "Amar es caminar junto al otro incluso cuando sus pasos no siguen el mismo ritmo. " * 3,
+        "meta_content": "No estás roto, estás formando raíces. Cada caída es una invitación a crecer. " * 10,
+        "prompt_to_media": "",
+        "media_path": f"/app/public/uploads/images/image_file_{post_id}.png",
+        "media_path_remote": f"https://res.cloudinary.com/demo/image/upload/uploads/image_file_{post_id}.png",
+        "default_phrase": "La luz y la sombra bailan juntas y en esa danza descubrimos el amor verdadero.",
+        "hashtags_x": ["#Amor", "#Empatía", "#Unidad"],
+        "hashtags_instagram": ["#Amor", "#Empatía", "#Unidad", "#Reflexión", "#Vida"],
+        "hashtags_facebook": ["#Amor", "#Empatía", "#Unidad"],
+        "metadata_to_media": {"background_path": "", "prompt_to_background": "", "text": ""},
+        "x_links": [],
+        "ig_links": [],
+        "fb_links": [],
+        "theme": "dark" if post_id % 2 == 0 else "light",
+        "post_type": "metadata_to_media",
+        "topic": "Amor sin condiciones",
+        "is_processed": True,
+        "x_status": "not_posted",
+        "ig_status": "not_posted",
+        "fb_status": "not_posted",
+        "is_thread": False,
+        "ai_content": True,
+        "threads": [],
+        "copied": False,
+    }
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes):
+    variants = [
+        ("json pretty (previous)", JSONSerializer("json"), True),
+        ("json compact", JSONSerializer("json"), False),
+    ]
+    if orjson is not None:
+        variants.append(("orjson compact", JSONSerializer("orjson"), False))
+    else:
+        print("orjson is not installed, skipping it.")
+
+    print(f"{'posts':>8}  {'serializer':<24} {'size MB':>8} {'dump ms':>9} {'load ms':>9}")
+    for size in sizes:
+        data = {"name": "Post List", "posts": [build_post(post_id) for post_id in range(size)]}
+        for name, serializer, pretty in variants:
+            content = serializer.dumps(data, pretty=pretty)
+            dump_time = best_of(lambda: serializer.dumps(data, pretty=pretty))
+            load_time = best_of(lambda: serializer.loads(content))
+            print(
+                f"{size:>8}  {name:<24} {len(content) / 1_000_000:>8.2f} "
+                f"{dump_time * 1000:>9.1f} {load_time * 1000:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    run([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
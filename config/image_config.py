@@ -31,6 +31,10 @@ DEFAULT_BACKGROUND_IMAGE_DARK = os.getenv("DEFAULT_BACKGROUND_IMAGE_DARK", "back
 FONT_FAMILY = os.getenv("FONT_FAMILY", "CascadiaMonoPL.ttf")
 FONT_SIZE = int(os.getenv("FONT_SIZE", "36"))
 LINE_SPACING = int(os.getenv("LINE_SPACING", "10"))
+# Opt-in: text too big for the box is rendered at the largest size down to TEXT_MIN_FONT_SIZE that fits
+TEXT_AUTO_FIT = os.getenv("TEXT_AUTO_FIT", "false").lower() == "true"
+TEXT_MIN_FONT_SIZE = int(os.getenv("TEXT_MIN_FONT_SIZE", "18"))
+TEXT_MAX_HEIGHT_RATIO = float(os.getenv("TEXT_MAX_HEIGHT_RATIO", "0.7"))
 
 # Feature toggles
 SHOW_WATERMARK = os.getenv("SHOW_WATERMARK", "true").lower() == "true"
@@ -38,3 +42,22 @@ SHOW_WATERMARK_NAME = os.getenv("SHOW_WATERMARK_NAME", "true").lower() == "true"
 
 RANDOM_BACKGROUND = os.getenv("RANDOM_BACKGROUND", "false").lower() == "true"
 
+# Processes rendering the text images (0: a thread of the app process)
+IMAGE_RENDER_WORKERS = int(os.getenv("IMAGE_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Optimization of the rendered and generated images: pillow (in process), subprocess
+# (pngquant/jpegoptim, needs the binaries) or none
+IMAGE_OPTIMIZER = os.getenv("IMAGE_OPTIMIZER", "pillow").lower()
+# pngquant/jpegoptim processes running at the same time
+IMAGE_OPTIMIZER_CONCURRENCY = int(os.getenv("IMAGE_OPTIMIZER_CONCURRENCY", "2"))
+IMAGE_PNG_COLORS = int(os.getenv("IMAGE_PNG_COLORS", "256"))
+# zlib level of the optimized PNGs, 9 can take seconds on a 1024x1024 image for a few % less
+IMAGE_PNG_COMPRESS_LEVEL = int(os.getenv("IMAGE_PNG_COMPRESS_LEVEL", "6"))
+# pngquant --quality, "min-max" (empty: pngquant's default)
+IMAGE_PNGQUANT_QUALITY = os.getenv("IMAGE_PNGQUANT_QUALITY", "")
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Fonts and watermark layers kept in memory (per kind) by the image service
+IMAGE_ASSET_CACHE_SIZE = int(os.getenv("IMAGE_ASSET_CACHE_SIZE", "32"))
+# Backgrounds kept resized and with the theme overlay, about 4 MB each at 1024x1024
+IMAGE_BACKGROUND_CACHE_SIZE = int(os.getenv("IMAGE_BACKGROUND_CACHE_SIZE", "16"))
@@ -1,13 +1,29 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.staticfiles import StaticFiles
 
 from routers import x_router, instagram_router, facebook_router, whatsapp_router, telegram_router, post_router
+from services.ai.openai_service import close_clients
+from services.post.post_pregeneration_service import get_post_pregeneration
+from services.image.image_render_service import get_render_service
 from utils.auth import validate_token  
 
+@asynccontextmanager
+async def lifespan(app):
+    # Render workers start, with their fonts and watermarks loaded, before the first render
+    await get_render_service().start()
+    get_post_pregeneration().start()
+    yield
+    await get_post_pregeneration().stop()
+    # Shared HTTP clients of the OpenAI service
+    await close_clients()
+    get_render_service().shutdown()
+
 app = FastAPI(
     title="Social Poster API",
     version="1.0.0",
-    dependencies=[Depends(validate_token)] 
+    dependencies=[Depends(validate_token)],
+    lifespan=lifespan
 )
 
 # Include routers
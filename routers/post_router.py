@@ -1,16 +1,24 @@
 import os
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, BackgroundTasks
 from services.post.post_service import PostService
 from services.post.post_generator_service import PostGeneratorService
+from services.post.post_batch_service import PostBatchService
+from services.post.post_pregeneration_service import get_post_pregeneration
 from services.social.x_service import XAPI
 from services.social.instagram_service import InstagramAPI
 from services.social.facebook_service import FacebookAPI
 from services.social.telegram_service import TelegramAPI
+from services.ai.openai_cache import get_openai_cache
+from services.ai.openai_rate_limiter import get_rate_limiter_stats
+from services.image.image_asset_cache import get_image_asset_cache
+from services.image.image_render_service import get_render_service
+from services.image.image_optimizer import get_image_optimizer
 from utils.file_utils import FileHandler
 
 router = APIRouter()
 post_service = PostService()
 post_generator_service = PostGeneratorService()
+post_batch_service = PostBatchService()
 
 x_api = XAPI()
 instagram_api = InstagramAPI()
@@ -33,15 +41,55 @@ async def generate_posts():
     await post_generator_service.generate_post()
     return {"message": "Post generated."}
 
+@router.post("/generate-posts-batch")
+async def generate_posts_batch(background_tasks: BackgroundTasks):
+    # Batches can take hours to complete, the run goes on after the response
+    if post_batch_service.is_running():
+        return {"message": "Batch generation already running."}
+    background_tasks.add_task(post_batch_service.run)
+    return {"message": "Batch generation started."}
+
+@router.post("/archive-posts")
+async def archive_posts():
+    archived_ids = await post_service.archive_published_posts()
+    return {"message": f"{len(archived_ids)} posts archived.", "archived_ids": archived_ids}
+
+@router.get("/openai-cache")
+async def openai_cache_stats():
+    response_cache = get_openai_cache()
+    if not response_cache:
+        return {"enabled": False}
+    return {"enabled": True, **await response_cache.get_stats()}
+
+@router.get("/stats")
+async def generation_stats():
+    stats = await post_service.get_generation_stats(os.getenv("PROCESSED_POSTS_JSON_FILE"))
+    return {
+        **stats,
+        "rate_limits": get_rate_limiter_stats(),
+        # Asset cache of this process, the render workers keep their own
+        "image_assets": get_image_asset_cache().get_stats(),
+        "image_render": get_render_service().get_stats(),
+        "image_optimizer": get_image_optimizer().get_stats(),
+    }
+
+@router.get("/pregeneration")
+async def pregeneration_stats():
+    return await get_post_pregeneration().get_stats()
+
 @router.post("/run-posts")
 async def run():
     result = {}
     errors = []
 
-    await post_generator_service.generate_post()
-
     x_ok = instagram_ok = facebook_ok = True
 
+    # Posts are generated ahead by the pre-generation worker, inline only when it is
+    # off or has nothing ready yet (e.g. right after the first start)
+    await get_post_pregeneration().generate_for_run()
+
+    # No transaction here: each platform writes its "posted" status as soon as it
+    # published, so a crash later in the run can't lose it
     try:
         result["x"] = await x_api.run_posts()
     except Exception as e:
@@ -63,6 +111,9 @@ async def run():
         errors.append(f"Facebook error: {str(e)}")
         facebook_ok = False
 
+    await post_service.archive_published_posts()
+    get_post_pregeneration().trigger()
+
     all_ok = x_ok and instagram_ok and facebook_ok
 
     if all_ok and os.getenv("ALLOW_DELETE_LOCAL_UPLOADS", "false").lower() == "true":
@@ -99,3 +150,10 @@ async def run():
     await telegram_api.send_message(telegram_message.strip())
 
     return response
+
+@router.get("/{post_id}")
+async def get_post(post_id: int):
+    post = await post_service.get_post(post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found.")
+    return post.to_dict()
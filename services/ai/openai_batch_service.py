@@ -0,0 +1,209 @@
+import os
+import json
+import uuid
+import asyncio
+import aiofiles
+from utils.base_utils import get_path_from_base
+from services.ai.openai_service import OpenaiServiceHandler, get_openai_client
+from services.ai.openai_rate_limiter import request_with_limits, estimate_tokens
+
+# openai (Batch API, half price, answers within the completion window) or
+# local (requests answered from files under json/, see LocalBatchBackend)
+OPENAI_BATCH_BACKEND = os.getenv("OPENAI_BATCH_BACKEND", "openai").lower()
+OPENAI_BATCH_COMPLETION_WINDOW = os.getenv("OPENAI_BATCH_COMPLETION_WINDOW", "24h")
+OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "60"))
+OPENAI_BATCH_LOCAL_DIR = os.getenv("OPENAI_BATCH_LOCAL_DIR", "data/batches")
+# local backend: answer the requests itself through the regular client (false: wait for
+# an <id>.output.jsonl written by someone else)
+OPENAI_BATCH_LOCAL_RESPOND = os.getenv("OPENAI_BATCH_LOCAL_RESPOND", "true").lower() == "true"
+OPENAI_BATCH_LOCAL_CONCURRENCY = int(os.getenv("OPENAI_BATCH_LOCAL_CONCURRENCY", "4"))
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class PendingCompletion(Exception):
+    """Raised by BatchCompletionCollector for a completion that has no answer yet"""
+
+    def __init__(self, custom_id):
+        super().__init__(custom_id)
+        self.custom_id = custom_id
+
+
+def get_batch_request(custom_id, model, messages, temperature=0.9, response_format=None):
+    """One line of a batch input file"""
+    body = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format:
+        body["response_format"] = response_format
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def parse_batch_output(lines):
+    """Returns ({custom_id: content}, total_tokens) of the successful lines of a batch output"""
+    answers = {}
+    total_tokens = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            print(f"[openai_batch] Request {result.get('custom_id')} failed: {result.get('error') or response.get('body')}")
+            continue
+        body = response["body"]
+        content = body["choices"][0]["message"]["content"]
+        if content is not None:
+            answers[result["custom_id"]] = content
+            total_tokens += (body.get("usage") or {}).get("total_tokens", 0)
+    return answers, total_tokens
+
+
+class BatchCompletionCollector(OpenaiServiceHandler):
+    """
+    OpenaiServiceHandler that answers completions from the results of previous
+    batches instead of calling the API. A completion without an answer is recorded
+    in `requests` and raises PendingCompletion.
+    Completions are identified by the step being run (see begin_step) and their
+    order inside it, so random parts of a prompt (e.g. the number of hashtags) don't
+    change the id between rounds.
+    """
+
+    def __init__(self, answers=None):
+        super().__init__()
+        self.answers = answers if answers is not None else {}
+        self.requests = {}
+        self.step_id = None
+        self.calls = 0
+
+    def begin_step(self, step_id):
+        self.step_id = step_id
+        self.calls = 0
+
+    async def create_completion(self, method, model, messages, temperature=0.9, cache=True, response_format=None):
+        custom_id = f"{self.step_id}:{self.calls}"
+        self.calls += 1
+        if custom_id in self.answers:
+            return self.answers[custom_id]
+        self.requests[custom_id] = get_batch_request(custom_id, model, messages, temperature, response_format)
+        raise PendingCompletion(custom_id)
+
+
+class OpenaiBatchBackend:
+    """Batch jobs of the OpenAI Batch API"""
+
+    async def submit(self, requests):
+        content = "\n".join(json.dumps(request, ensure_ascii=False) for request in requests).encode("utf-8")
+        client = get_openai_client()
+        input_file = await client.files.create(file=("posts-batch.jsonl", content), purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=OPENAI_BATCH_COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    async def get_status(self, batch_id):
+        batch = await get_openai_client().batches.retrieve(batch_id)
+        return batch.status
+
+    async def get_results(self, batch_id):
+        client = get_openai_client()
+        batch = await client.batches.retrieve(batch_id)
+        lines = []
+        # Failed requests are reported in the error file, with the same line format
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                response = await client.files.content(file_id)
+                lines.extend(response.text.splitlines())
+        return lines
+
+
+class LocalBatchBackend:
+    """
+    File based stand-in of the Batch API: the input is written to
+    <OPENAI_BATCH_LOCAL_DIR>/<id>.input.jsonl and the batch is completed once
+    <id>.output.jsonl exists. With respond=True the requests are answered right away
+    through the regular client (OPENAI_BASE_URL can point it to a fake server).
+    """
+
+    def __init__(self, directory=OPENAI_BATCH_LOCAL_DIR, respond=OPENAI_BATCH_LOCAL_RESPOND):
+        self.directory = get_path_from_base("json", directory)
+        self.respond = respond
+
+    def get_path(self, batch_id, kind):
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    async def _read_lines(self, path):
+        async with aiofiles.open(path, "r", encoding="utf-8") as file:
+            return (await file.read()).splitlines()
+
+    async def _write_lines(self, path, lines):
+        temp_path = f"{path}.tmp"
+        async with aiofiles.open(temp_path, "w", encoding="utf-8") as file:
+            await file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+    async def submit(self, requests):
+        os.makedirs(self.directory, exist_ok=True)
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        await self._write_lines(
+            self.get_path(batch_id, "input"),
+            [json.dumps(request, ensure_ascii=False) for request in requests]
+        )
+        return batch_id
+
+    async def answer(self, batch_id):
+        semaphore = asyncio.Semaphore(OPENAI_BATCH_LOCAL_CONCURRENCY)
+        client = get_openai_client()
+
+        async def answer_request(line):
+            request = json.loads(line)
+            async with semaphore:
+                try:
+                    body = request["body"]
+                    response = await request_with_limits(
+                        body["model"],
+                        lambda: client.chat.completions.with_raw_response.create(**body),
+                        estimate_tokens(body["messages"])
+                    )
+                    result = {"response": {"status_code": 200, "body": response.model_dump()}, "error": None}
+                except Exception as e:
+                    result = {"response": None, "error": {"message": str(e)}}
+            return json.dumps({"id": uuid.uuid4().hex, "custom_id": request["custom_id"], **result}, ensure_ascii=False)
+
+        lines = await self._read_lines(self.get_path(batch_id, "input"))
+        output = await asyncio.gather(*(answer_request(line) for line in lines if line.strip()))
+        await self._write_lines(self.get_path(batch_id, "output"), output)
+
+    async def get_status(self, batch_id):
+        if os.path.exists(self.get_path(batch_id, "output")):
+            return "completed"
+        if not os.path.exists(self.get_path(batch_id, "input")):
+            return "failed"
+        if self.respond:
+            await self.answer(batch_id)
+            return "completed"
+        return "in_progress"
+
+    async def get_results(self, batch_id):
+        return await self._read_lines(self.get_path(batch_id, "output"))
+
+
+def get_batch_backend(backend=None):
+    backend = (backend or OPENAI_BATCH_BACKEND).lower()
+    if backend == "local":
+        return LocalBatchBackend()
+    if backend == "openai":
+        return OpenaiBatchBackend()
+    raise ValueError(f"Unknown OPENAI_BATCH_BACKEND: {backend}")
+
+
+async def wait_for_batch(backend, batch_id, poll_seconds=OPENAI_BATCH_POLL_SECONDS):
+    """Polls the batch until it ends and returns its final status"""
+    while True:
+        status = await backend.get_status(batch_id)
+        if status in BATCH_FINAL_STATUSES:
+            print(f"[openai_batch] Batch {batch_id} {status}")
+            return status
+        print(f"[openai_batch] Batch {batch_id} {status}, checking again in {poll_seconds}s")
+        await asyncio.sleep(poll_seconds)
@@ -0,0 +1,156 @@
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import asyncio
+import threading
+from utils.base_utils import get_path_from_base
+
+# Opt-in: repeated prompts (e.g. a /generate-post retried after a failure) are answered from disk
+OPENAI_CACHE_ENABLED = os.getenv("OPENAI_CACHE_ENABLED", "false").lower() == "true"
+OPENAI_CACHE_DB_FILE = os.getenv("OPENAI_CACHE_DB_FILE", "data/openai-cache.db")
+OPENAI_CACHE_TTL_SECONDS = int(os.getenv("OPENAI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+OPENAI_CACHE_MAX_ENTRIES = int(os.getenv("OPENAI_CACHE_MAX_ENTRIES", "5000"))
+
+
+class OpenaiResponseCache:
+    """
+    SQLite cache of chat completion texts under json/, keyed by a hash of
+    (method, model, messages, temperature and the response format, if any).
+    Entries expire after ttl_seconds and the least recently used ones are evicted
+    past max_entries. Hits, misses and the tokens hits saved are counted in the
+    database, so every worker adds to the same numbers.
+    """
+
+    def __init__(self, db_file=OPENAI_CACHE_DB_FILE, ttl_seconds=OPENAI_CACHE_TTL_SECONDS, max_entries=OPENAI_CACHE_MAX_ENTRIES):
+        self.db_path = get_path_from_base("json", db_file)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    total_tokens INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_last_used_at ON responses (last_used_at);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func, *args):
+        def call():
+            with self._lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(call)
+
+    @staticmethod
+    def get_key(method, model, messages, temperature, response_format=None):
+        key_parts = [method, model, messages, temperature]
+        if response_format:
+            key_parts.append(response_format)
+        payload = json.dumps(key_parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _increment(connection, name, amount=1):
+        connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def _get(self, connection, key):
+        now = time.time()
+        row = connection.execute(
+            "SELECT content, total_tokens, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row and row[2] + self.ttl_seconds < now:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            row = None
+
+        if row is None:
+            self._increment(connection, "misses")
+            return None
+
+        connection.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+        self._increment(connection, "hits")
+        self._increment(connection, "saved_tokens", row[1])
+        return row[0]
+
+    def _set(self, connection, key, method, model, content, total_tokens):
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, method, model, content, total_tokens, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, method, model, content, total_tokens, now, now)
+            )
+            connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _get_stats(self, connection):
+        counters = dict(connection.execute("SELECT name, value FROM counters"))
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "entries": connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0,
+            "saved_tokens": counters.get("saved_tokens", 0),
+        }
+
+    async def get(self, key):
+        """Returns the cached content, or None when missing or expired"""
+        return await self._run(self._get, key)
+
+    async def set(self, key, method, model, content, total_tokens=0):
+        await self._run(self._set, key, method, model, content, total_tokens)
+
+    async def get_stats(self):
+        return await self._run(self._get_stats)
+
+    async def clear(self):
+        def clear(connection):
+            connection.execute("DELETE FROM responses")
+            connection.execute("DELETE FROM counters")
+        await self._run(clear)
+
+
+_cache = None
+
+def get_openai_cache():
+    """Returns the process-wide response cache, or None when OPENAI_CACHE_ENABLED is off"""
+    global _cache
+    if not OPENAI_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = OpenaiResponseCache()
+    return _cache
@@ -0,0 +1,251 @@
+import os
+import re
+import time
+import random
+import asyncio
+import openai
+from contextlib import asynccontextmanager
+
+# Starting limits of every model, corrected by the x-ratelimit-* headers of the answers
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "30000"))
+# Per model overrides: "dall-e-3=7/0,gpt-4o-mini=500/200000" (requests/tokens per minute, 0 = no limit)
+OPENAI_RATE_LIMITS = os.getenv("OPENAI_RATE_LIMITS", "")
+# Requests of the same model in flight at the same time
+OPENAI_MODEL_CONCURRENCY = int(os.getenv("OPENAI_MODEL_CONCURRENCY", "8"))
+# Retries of a request after a 429, a 5xx, a timeout or a connection error
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "1"))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "60"))
+# Completion tokens reserved for an answer until its real usage is known
+OPENAI_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "500"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def parse_rate_limits(value):
+    limits = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        model, numbers = item.split("=", 1)
+        requests, _, tokens = numbers.partition("/")
+        limits[model.strip()] = (int(requests or 0), int(tokens or 0))
+    return limits
+
+
+def parse_reset_seconds(value):
+    """x-ratelimit-reset-* values look like "1s", "6m0s", "120ms" or "1h2m3.5s" """
+    if not value:
+        return None
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+def get_retry_after(error):
+    """Seconds the API asked to wait (retry-after-ms / retry-after headers), if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def get_rate_limit_reset(headers, error=None):
+    """
+    Seconds to block the model after a 429: the reset of the exhausted limit
+    (requests and/or tokens, the longest when both are), or the retry-after of the
+    error when the headers don't say which limit was hit.
+    """
+    resets = [
+        parse_reset_seconds(headers.get(f"x-ratelimit-reset-{kind}")) or 0
+        for kind in ("requests", "tokens")
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+    ]
+    if resets:
+        return max(resets)
+    return (get_retry_after(error) if error is not None else None) or 0
+
+
+def estimate_tokens(messages):
+    """Rough prompt size (4 characters per token) plus the reserved completion tokens"""
+    characters = sum(len(str(message.get("content", ""))) for message in messages)
+    return characters // 4 + OPENAI_COMPLETION_TOKENS_ESTIMATE
+
+
+class TokenBucket:
+    """Refills per_minute units per minute up to per_minute; per_minute 0 means no limit"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.per_minute:
+            self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def get_wait(self, amount):
+        if not self.per_minute:
+            return 0
+        self._refill()
+        amount = min(amount, self.per_minute)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) * 60 / self.per_minute
+
+    def consume(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def update(self, limit=None, remaining=None):
+        self._refill()
+        if limit:
+            self.per_minute = limit
+        if remaining is not None and self.per_minute:
+            self.level = min(float(remaining), self.per_minute)
+
+
+class ModelRateLimiter:
+    """
+    Requests and tokens per minute of one model, plus a semaphore bounding the
+    requests in flight. The buckets follow the x-ratelimit-* headers of every answer
+    and a 429 blocks the model until the reset the API reported.
+    """
+
+    def __init__(self, model, requests_per_minute, tokens_per_minute, concurrency=OPENAI_MODEL_CONCURRENCY):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.blocked_until = 0
+        self._lock = asyncio.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "waited_seconds": 0.0}
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens=0):
+        async with self.semaphore:
+            # Waiting callers queue on the lock so they are served in order
+            async with self._lock:
+                while True:
+                    wait = max(
+                        self.requests.get_wait(1),
+                        self.tokens.get_wait(estimated_tokens),
+                        self.blocked_until - time.monotonic(),
+                    )
+                    if wait <= 0:
+                        break
+                    self.stats["waited_seconds"] += wait
+                    await asyncio.sleep(wait)
+                self.requests.consume(1)
+                self.tokens.consume(estimated_tokens)
+            self.stats["requests"] += 1
+            yield
+
+    def update_from_headers(self, headers):
+        def get_int(name):
+            try:
+                return int(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        self.requests.update(get_int("x-ratelimit-limit-requests"), get_int("x-ratelimit-remaining-requests"))
+        self.tokens.update(get_int("x-ratelimit-limit-tokens"), get_int("x-ratelimit-remaining-tokens"))
+
+    def record_usage(self, estimated_tokens, total_tokens):
+        """Gives back (or takes) the difference between the reserved and the used tokens"""
+        if total_tokens is not None:
+            self.tokens.consume(total_tokens - estimated_tokens)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "waited_seconds": round(self.stats["waited_seconds"], 3),
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute,
+        }
+
+
+# Limiters of the running event loop, one per model
+_limiters = {"loop": None, "models": {}}
+
+
+def get_rate_limiter(model):
+    loop = asyncio.get_running_loop()
+    if _limiters["loop"] is not loop:
+        _limiters.update(loop=loop, models={})
+    models = _limiters["models"]
+    if model not in models:
+        requests_per_minute, tokens_per_minute = parse_rate_limits(OPENAI_RATE_LIMITS).get(
+            model, (OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE)
+        )
+        models[model] = ModelRateLimiter(model, requests_per_minute, tokens_per_minute)
+    return models[model]
+
+
+def get_rate_limiter_stats():
+    return {model: limiter.get_stats() for model, limiter in _limiters["models"].items()}
+
+
+def get_backoff_seconds(attempt, error=None):
+    """Full jitter exponential backoff, or the wait the API asked for"""
+    retry_after = get_retry_after(error) if error is not None else None
+    if retry_after is not None:
+        return min(retry_after, OPENAI_RETRY_MAX_SECONDS)
+    return random.uniform(0, min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+async def request_with_limits(model, create, estimated_tokens=0, max_retries=OPENAI_MAX_RETRIES, call=None):
+    """
+    Runs create() (an SDK `with_raw_response` call) within the limits of the model,
+    retrying the retryable errors with backoff, and returns the parsed response.
+    Retries are counted in call.retries when an OpenaiCall is given.
+    """
+    limiter = get_rate_limiter(model)
+    attempt = 0
+    while True:
+        try:
+            async with limiter.slot(estimated_tokens):
+                raw_response = await create()
+        except RETRYABLE_ERRORS as e:
+            if isinstance(e, openai.RateLimitError):
+                limiter.stats["rate_limited"] += 1
+                response = getattr(e, "response", None)
+                headers = response.headers if response is not None else {}
+                limiter.update_from_headers(headers)
+                limiter.block(get_rate_limit_reset(headers, e))
+            if attempt >= max_retries:
+                raise
+            delay = get_backoff_seconds(attempt, e)
+            attempt += 1
+            limiter.stats["retries"] += 1
+            if call is not None:
+                call.retries += 1
+            print(f"[openai_rate_limiter] {model}: {type(e).__name__}, retry {attempt}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        usage = getattr(response, "usage", None)
+        limiter.record_usage(estimated_tokens, getattr(usage, "total_tokens", None))
+        return response
@@ -1,90 +1,168 @@
 import os
+import json
 import openai
 import aiohttp
+import asyncio
 import uuid
 from dotenv import load_dotenv
 from config.image_config import TEMPS_DIR
+from services.ai.openai_cache import get_openai_cache
+from services.ai.openai_rate_limiter import request_with_limits, estimate_tokens
+from services.ai.openai_usage import OpenaiCall
 
 load_dotenv()
 
+# Connection pool and timeouts of the process-wide OpenAI client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+
+# Connection pool and timeout of the session downloading generated images
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "10"))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "60"))
+
+# Pool limits type of the HTTP library the installed SDK is built on (httpx or httpx2)
+HttpLimits = type(openai.DEFAULT_CONNECTION_LIMITS)
+
+# Shared by every OpenaiServiceHandler, created on first use in the running event loop
+_clients = {"loop": None, "openai": None, "session": None}
+
+
+def _check_loop():
+    """Clients are bound to the loop they were created in (asyncio.run makes a new one)"""
+    loop = asyncio.get_running_loop()
+    if _clients["loop"] is not loop:
+        _clients.update(loop=loop, openai=None, session=None)
+
+
+def get_openai_client():
+    _check_loop()
+    if _clients["openai"] is None:
+        _clients["openai"] = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            # Retries go through request_with_limits, so they wait for the rate limits too
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=HttpLimits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=openai.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            ),
+        )
+    return _clients["openai"]
+
+
+def get_http_session():
+    _check_loop()
+    if _clients["session"] is None or _clients["session"].closed:
+        _clients["session"] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=DOWNLOAD_MAX_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT),
+        )
+    return _clients["session"]
+
+
+async def close_clients():
+    """Closes the shared OpenAI client and download session (FastAPI shutdown)"""
+    client, session = _clients["openai"], _clients["session"]
+    _clients.update(loop=None, openai=None, session=None)
+    if client is not None:
+        await client.close()
+    if session is not None and not session.closed:
+        await session.close()
+
 class OpenaiServiceHandler:
     def __init__(self):
         self.openai_image_model = os.getenv("OPENAI_IMAGE_MODEL")
         self.content_model = os.getenv("OPENAI_CONTENT_MODEL")
         self.image_size = "1024x1024"
 
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+    async def create_completion(self, method, model, messages, temperature=0.9, cache=True, response_format=None):
+        """
+        Returns the text of a chat completion.
+        With OPENAI_CACHE_ENABLED the answer is looked up first in the response cache;
+        cache=False bypasses it for calls that must give a new answer every time.
+        """
+        call = OpenaiCall(method, model)
+        response_cache = get_openai_cache() if cache else None
+        if response_cache:
+            key = response_cache.get_key(method, model, messages, temperature, response_format)
+            content = await response_cache.get(key)
+            if content is not None:
+                print(f"[openai_service] Cache hit for {method} with model: {model}")
+                call.finish(cached=True)
+                return content
 
-    async def generate_prompt_image_from_idea(self, idea, model=None):
+        options = {"response_format": response_format} if response_format else {}
+        client = get_openai_client()
+        try:
+            response = await request_with_limits(model, lambda: client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **options,
+            ), estimate_tokens(messages), call=call)
+        except BaseException:
+            call.finish(error=True)
+            raise
+        call.finish(response.usage)
+        content = response.choices[0].message.content
+
+        if response_cache and content is not None:
+            total_tokens = response.usage.total_tokens if response.usage else 0
+            await response_cache.set(key, method, model, content, total_tokens)
+        return content
+
+    async def generate_prompt_image_from_idea(self, idea, model=None, cache=True):
         """Generates a prompt for DALL·E using the OpenAI API"""
-        if model:
-            self.content_model = model
-
-        print(f"[openai_service] Generating prompt for idea: {idea} with model: {self.content_model}")
-
-        client = openai.AsyncOpenAI()
-        response = await client.chat.completions.create(
-            model=self.content_model,
-            messages=[
-                {"role": "system", "content": "You are a creative assistant that generates prompts for AI-generated images."},
-                {"role": "user", "content": f"Generate a visual prompt from this idea: {idea}"}
-            ],
-            temperature=0.9,
-        )
+        model = model or self.content_model
 
-        return response.choices[0].message.content
+        print(f"[openai_service] Generating prompt for idea: {idea} with model: {model}")
+
+        return await self.create_completion("generate_prompt_image_from_idea", model, [
+            {"role": "system", "content": "You are a creative assistant that generates prompts for AI-generated images."},
+            {"role": "user", "content": f"Generate a visual prompt from this idea: {idea}"}
+        ], cache=cache)
           
-    async def generate_prompt_to_media_post(self, idea, model=None, language="english"):
+    async def generate_prompt_to_media_post(self, idea, model=None, language="english", cache=True):
         """Generates a prompt for prompt_to_media using the OpenAI API"""
-        if model:
-            self.content_model = model
-
-        print(f"[openai_service] Generating prompt_to_media from idea: {idea} with model: {self.content_model}")
-
-        client = openai.AsyncOpenAI()
-        response = await client.chat.completions.create(
-            model=self.content_model,
-            messages=[
-                {"role": "system", "content": "You are a creative assistant that generates prompts for AI-service this prompt is necesary to generate a media according to the idea, not translations, this is a prompt to generate a media post."},
-                {"role": "user", "content": f"Generate a text prompt from this idea: {idea}, without quotation marks and in {language}."}
-            ],
-            temperature=0.9,
-        )
-        print(f"[openai_service] Prompt generated: {response.choices[0].message}")
-        return response.choices[0].message.content
+        model = model or self.content_model
+
+        print(f"[openai_service] Generating prompt_to_media from idea: {idea} with model: {model}")
+
+        content = await self.create_completion("generate_prompt_to_media_post", model, [
+            {"role": "system", "content": "You are a creative assistant that generates prompts for AI-service this prompt is necesary to generate a media according to the idea, not translations, this is a prompt to generate a media post."},
+            {"role": "user", "content": f"Generate a text prompt from this idea: {idea}, without quotation marks and in {language}."}
+        ], cache=cache)
+        print(f"[openai_service] Prompt generated: {content}")
+        return content
     
 
-    async def generate_hashtags(self, idea, total=0, model=None, social_media=None):
+    async def generate_hashtags(self, idea, total=0, model=None, social_media=None, cache=True):
         """Generates hashtags using the OpenAI API"""
         if total == 0:
             return ""
         
-        if model:
-            self.content_model = model
-
-        print(f"[openai_service] Generating hashtags for idea: {idea} with model: {self.content_model}")
-
-        client = openai.AsyncOpenAI()
-        response = await client.chat.completions.create(
-            model=self.content_model,
-            messages=[
-                {"role": "system", "content": f"You are a creative assistant that generates hashtags for {social_media} social media "},
-                {"role": "user", "content": f"Generate {total} hashtags for this idea: {idea} in spanish and include the # symbol and only respond in a text format. The hashtags should be the recommended tendency hashtags for this idea so search in the web for the best hashtags. For the winning hashtags search in the web for the best hashtags for this idea, do not include any other text, just the hashtags."}
-            ],
-            temperature=0.9,
-        )
-        print(f"[openai_service] Hashtags generated: {response.choices[0].message}")
-        return response.choices[0].message.content
+        model = model or self.content_model
+
+        print(f"[openai_service] Generating hashtags for idea: {idea} with model: {model}")
+
+        content = await self.create_completion("generate_hashtags", model, [
+            {"role": "system", "content": f"You are a creative assistant that generates hashtags for {social_media} social media "},
+            {"role": "user", "content": f"Generate {total} hashtags for this idea: {idea} in spanish and include the # symbol and only respond in a text format. The hashtags should be the recommended tendency hashtags for this idea so search in the web for the best hashtags. For the winning hashtags search in the web for the best hashtags for this idea, do not include any other text, just the hashtags."}
+        ], cache=cache)
+        print(f"[openai_service] Hashtags generated: {content}")
+        return content
     
     
-    async def generate_post_content(self, idea, limit=1000, extra_message=None, language="spanish", model=None):
+    async def generate_post_content(self, idea, limit=1000, extra_message=None, language="spanish", model=None, cache=True):
         """Generates content using the OpenAI API"""
-        if model:
-            self.content_model = model
+        model = model or self.content_model
 
-        print(f"[openai_service] Generating content for idea: {idea} with model: {self.content_model}")
+        print(f"[openai_service] Generating content for idea: {idea} with model: {model}")
 
-        client = openai.AsyncOpenAI()
         messages = [
             {"role": "system", "content": "You are a creative assistant that generates content for social media."},
             {"role": "user", "content": f"Generate a post with a maximum of {limit} characters for this idea: {idea} in {language} and do not include hashtags."}
@@ -92,22 +170,16 @@ class OpenaiServiceHandler:
         if extra_message:
             messages.append({"role": "user", "content": f"{extra_message} respect the limit of {limit} characters."})
 
-        response = await client.chat.completions.create(
-            model=self.content_model,
-            messages=messages,
-            temperature=0.9,
-        )
-        print(f"[openai_service] Content generated: {response.choices[0].message}")
-        return response.choices[0].message.content
+        content = await self.create_completion("generate_post_content", model, messages, cache=cache)
+        print(f"[openai_service] Content generated: {content}")
+        return content
     
-    async def generate_default_phrase(self, idea, limit=300, extra_message=None, language="spanish", model=None):
+    async def generate_default_phrase(self, idea, limit=300, extra_message=None, language="spanish", model=None, cache=True):
         """Generates a default phrase using the OpenAI API"""
-        if model:
-            self.content_model = model
+        model = model or self.content_model
 
-        print(f"[openai_service] Generating default phrase for idea: {idea} with model: {self.content_model}")
+        print(f"[openai_service] Generating default phrase for idea: {idea} with model: {model}")
 
-        client = openai.AsyncOpenAI()
         messages = [
             {"role": "system", "content": "You are a creative assistant that generates default phrases for social media."},
             {"role": "user", "content": f"Generate a default phrase with a maximum of {limit} characters for this idea: {idea} in {language} and do not include hashtags, do not include titles"}
@@ -115,26 +187,77 @@ class OpenaiServiceHandler:
         if extra_message:
             messages.append({"role": "user", "content": extra_message})
 
-        response = await client.chat.completions.create(
-            model=self.content_model,
-            messages=messages,
-            temperature=0.9,
-        )
-        print(f"[openai_service] Default phrase generated: {response.choices[0].message}")
-        return response.choices[0].message.content
+        content = await self.create_completion("generate_default_phrase", model, messages, cache=cache)
+        print(f"[openai_service] Default phrase generated: {content}")
+        return content
     
+    async def generate_post_fields(self, idea, fields, language="spanish", model=None, cache=True):
+        """
+        Generates several post fields in one JSON schema constrained completion.
+        fields maps each field name to its spec:
+            {"limit": 280, "instructions": "..."}      text of at most limit characters
+            {"hashtags": 5, "social_media": "x"}      list of hashtags
+        Returns {field: value}, or {} when the answer is not valid JSON.
+        """
+        model = model or self.content_model
+
+        print(f"[openai_service] Generating {', '.join(fields)} for idea: {idea} with model: {model}")
+
+        lines = []
+        properties = {}
+        for name, spec in fields.items():
+            if "hashtags" in spec:
+                lines.append(f"- {name}: {spec['hashtags']} hashtags for {spec['social_media']} social media, the recommended tendency hashtags for this idea, each one including the # symbol.")
+                properties[name] = {"type": "array", "items": {"type": "string"}}
+            else:
+                lines.append(f"- {name}: a post with a maximum of {spec['limit']} characters, without hashtags. {spec.get('instructions', '')}".rstrip())
+                properties[name] = {"type": "string"}
+
+        messages = [
+            {"role": "system", "content": "You are a creative assistant that generates content for social media."},
+            {"role": "user", "content": f"For this idea: {idea} generate in {language} the following fields and respect the limit of characters of each one:\n" + "\n".join(lines)}
+        ]
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "post_fields",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(properties),
+                    "additionalProperties": False,
+                },
+            },
+        }
+
+        content = await self.create_completion("generate_post_fields", model, messages, cache=cache, response_format=response_format)
+        print(f"[openai_service] Fields generated: {content}")
+        try:
+            values = json.loads(content or "")
+        except json.JSONDecodeError:
+            return {}
+        return values if isinstance(values, dict) else {}
+
     async def generate_image_from_prompt(self, prompt, filename=None):
         """Generates an image using DALL·E and saves it locally"""
         try:
             print(f"[openai_service] Requesting image from prompt: {prompt} with model: {self.openai_image_model}")
 
             # Create image with DALL·E
-            response = await openai.AsyncOpenAI().images.generate(
-                model=self.openai_image_model,
-                prompt=prompt,
-                n=1,
-                size=self.image_size,
-            )
+            client = get_openai_client()
+            call = OpenaiCall("generate_image_from_prompt", self.openai_image_model)
+            try:
+                response = await request_with_limits(self.openai_image_model, lambda: client.images.with_raw_response.generate(
+                    model=self.openai_image_model,
+                    prompt=prompt,
+                    n=1,
+                    size=self.image_size,
+                ), call=call)
+            except BaseException:
+                call.finish(error=True)
+                raise
+            call.finish(getattr(response, "usage", None), images=len(response.data))
 
             image_url = response.data[0].url
             print(f"[openai_service] Image URL received: {image_url}")
@@ -146,16 +269,15 @@ class OpenaiServiceHandler:
                 filename = f"temp_{uuid.uuid4().hex}.png"
             temp_file_path = os.path.join(temps_path, filename)
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as img_response:
-                    if img_response.status == 200:
-                        with open(temp_file_path, "wb") as f:
-                            f.write(await img_response.read())
-                        print(f"[openai_service] Image saved to {temp_file_path}")
-                        return temp_file_path
-                    else:
-                        print(f"[openai_service] Failed to download image. Status: {img_response.status}")
-                        return ""
+            async with get_http_session().get(image_url) as img_response:
+                if img_response.status == 200:
+                    with open(temp_file_path, "wb") as f:
+                        f.write(await img_response.read())
+                    print(f"[openai_service] Image saved to {temp_file_path}")
+                    return temp_file_path
+                else:
+                    print(f"[openai_service] Failed to download image. Status: {img_response.status}")
+                    return ""
 
         except Exception as e:
             print(f"[openai_service] Error: {e}")
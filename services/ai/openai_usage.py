@@ -0,0 +1,148 @@
+import os
+import time
+from contextvars import ContextVar
+from contextlib import contextmanager
+
+# USD per 1M prompt/completion tokens, and per image for the image models
+OPENAI_PRICES = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "dall-e-3": 0.04,
+    "dall-e-2": 0.02,
+}
+# Overrides and additions: "gpt-4o=2.5/10,dall-e-3=0.08"
+OPENAI_PRICES_OVERRIDES = os.getenv("OPENAI_PRICES", "")
+
+STAT_KEYS = ("calls", "cached_calls", "errors", "retries", "prompt_tokens", "completion_tokens", "seconds", "cost")
+
+_current_stats = ContextVar("openai_generation_stats", default=None)
+
+
+def get_prices():
+    prices = dict(OPENAI_PRICES)
+    for item in OPENAI_PRICES_OVERRIDES.split(","):
+        if "=" not in item:
+            continue
+        model, value = item.split("=", 1)
+        if "/" in value:
+            prompt_price, completion_price = value.split("/", 1)
+            prices[model.strip()] = (float(prompt_price), float(completion_price))
+        else:
+            prices[model.strip()] = float(value)
+    return prices
+
+
+def get_cost(model, prompt_tokens=0, completion_tokens=0, images=0):
+    price = get_prices().get(model)
+    if price is None:
+        return 0.0
+    if isinstance(price, tuple):
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+    return images * price
+
+
+def add_stats(total, values):
+    for key in STAT_KEYS:
+        total[key] = round(total.get(key, 0) + values.get(key, 0), 6)
+    return total
+
+
+def merge_generation_stats(stats, other):
+    """Adds the totals of other (a generation_stats dict) to stats, in place"""
+    for group in ("by_method", "by_model"):
+        for name, values in other.get(group, {}).items():
+            add_stats(stats.setdefault(group, {}).setdefault(name, {}), values)
+    add_stats(stats.setdefault("total", {}), other.get("total", {}))
+    return stats
+
+
+def summarize_generation_stats(stats_list):
+    """Totals of several generation_stats, with the average per post and per call"""
+    summary = {"total": {}, "by_method": {}, "by_model": {}}
+    posts = 0
+    for stats in stats_list:
+        if stats:
+            merge_generation_stats(summary, stats)
+            posts += 1
+
+    for group in (summary["by_method"], summary["by_model"]):
+        for values in group.values():
+            calls = values.get("calls", 0) - values.get("cached_calls", 0)
+            values["avg_seconds"] = round(values["seconds"] / calls, 3) if calls else 0
+            values["avg_cost"] = round(values["cost"] / calls, 6) if calls else 0
+    summary["posts"] = posts
+    summary["per_post"] = {
+        key: round(value / posts, 6) for key, value in summary["total"].items()
+    } if posts else {}
+    return summary
+
+
+class GenerationStats:
+    """OpenAI calls made while generating one post, totalled per method and per model"""
+
+    def __init__(self):
+        self.data = {"total": {}, "by_method": {}, "by_model": {}}
+
+    def record(self, method, model, seconds, prompt_tokens=0, completion_tokens=0, retries=0, cached=False, images=0, error=False):
+        values = {
+            "calls": 1,
+            "cached_calls": 1 if cached else 0,
+            "errors": 1 if error else 0,
+            "retries": retries,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "seconds": seconds,
+            "cost": 0.0 if cached else get_cost(model, prompt_tokens, completion_tokens, images),
+        }
+        merge_generation_stats(self.data, {
+            "total": values,
+            "by_method": {method: values},
+            "by_model": {model or "unknown": values},
+        })
+
+
+@contextmanager
+def record_generation_stats():
+    """
+    Collects the OpenAI calls made inside the block (tasks started inside included,
+    they inherit the context) into the GenerationStats it yields.
+    """
+    stats = GenerationStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class OpenaiCall:
+    """
+    Times one OpenAI call; request_with_limits counts its retries in `retries`.
+    finish(error=True) records a call that failed after its retries (time and
+    retries spent, no tokens).
+    """
+
+    def __init__(self, method, model):
+        self.method = method
+        self.model = model
+        self.retries = 0
+        self.started = time.perf_counter()
+
+    def finish(self, usage=None, cached=False, images=0, error=False):
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        stats.record(
+            self.method,
+            self.model,
+            time.perf_counter() - self.started,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            retries=self.retries,
+            cached=cached,
+            images=images,
+            error=error,
+        )
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from services.files.cloudinary_service import CloudinaryService
 
 class RemoteUploadService:
@@ -18,4 +19,5 @@ class RemoteUploadService:
         if not self.allow_remote_upload:
             return "" 
 
-        return self.uploader.upload_file(file_path, folder)
+        # The provider SDKs upload synchronously
+        return await asyncio.to_thread(self.uploader.upload_file, file_path, folder)
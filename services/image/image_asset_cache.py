@@ -0,0 +1,179 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+
+from config.image_config import (
+    IMAGE_ASSET_CACHE_SIZE,
+    IMAGE_BACKGROUND_CACHE_SIZE,
+    WATERMARK_NAME,
+    WATERMARK_WIDTH_DIVIDER,
+)
+
+
+class LruCache:
+    """Thread safe LRU of loaded values, with hit/miss/eviction counters"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """Returns the value of key, calling load() to build it on a miss"""
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]
+            self.stats["misses"] += 1
+            # Loaded under the lock so concurrent renders don't read the same file twice
+            value = load()
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            return value
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "size": len(self.entries), "max_entries": self.max_entries}
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+class WatermarkLayer:
+    """Logo (and name) ready to paste: `offset_x` is the logo position inside the image"""
+
+    __slots__ = ("image", "logo_width", "total_height", "offset_x")
+
+    def __init__(self, image, logo_width, total_height, offset_x):
+        self.image = image
+        self.logo_width = logo_width
+        self.total_height = total_height
+        self.offset_x = offset_x
+
+
+class ImageAssetCache:
+    """
+    Fonts keyed by (path, size), watermark layers keyed by (theme, width, show_name)
+    and background canvases keyed by (file, theme, size), shared by every render of
+    the process so assets are read from disk once.
+    """
+
+    BACKGROUND_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+    def __init__(self, max_entries=IMAGE_ASSET_CACHE_SIZE, max_backgrounds=IMAGE_BACKGROUND_CACHE_SIZE):
+        self.fonts = LruCache(max_entries)
+        self.watermarks = LruCache(max_entries)
+        self.backgrounds = LruCache(max_backgrounds)
+        # folder -> (mtime_ns, background file names)
+        self.folders = {}
+        self.folder_stats = {"hits": 0, "misses": 0}
+        self._folders_lock = threading.Lock()
+
+    def get_font(self, font_path, size):
+        def load():
+            try:
+                return ImageFont.truetype(font_path, size=size)
+            except OSError:
+                return ImageFont.load_default()
+        return self.fonts.get((font_path, size), load)
+
+    def get_watermark(self, theme, width, show_name, watermark_path, font_path):
+        """Raises FileNotFoundError when the logo is missing (the miss is not cached)"""
+        return self.watermarks.get(
+            (theme, width, show_name),
+            lambda: self._load_watermark(theme, width, show_name, watermark_path, font_path)
+        )
+
+    def _load_watermark(self, theme, width, show_name, watermark_path, font_path):
+        logo = Image.open(watermark_path).convert('RGBA')
+        logo_width = width // WATERMARK_WIDTH_DIVIDER
+        logo_height = int(logo.height * logo_width / logo.width)
+        logo = logo.resize((logo_width, logo_height))
+        alpha = ImageEnhance.Brightness(logo.split()[3]).enhance(0.8)
+        logo.putalpha(alpha)
+        if not show_name:
+            return WatermarkLayer(logo, logo_width, logo_height, 0)
+
+        font = self.get_font(font_path, width // 40)
+        text_bbox = ImageDraw.Draw(logo).textbbox((0, 0), WATERMARK_NAME, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+        padding = abs(text_bbox[0])
+        layer_width = max(logo_width, text_width) + 2 * padding
+        offset_x = (layer_width - logo_width) // 2
+
+        text_color = (255, 255, 255, int(0.8 * 255)) if theme == 'dark' else (0, 0, 0, int(0.6 * 255))
+        # Transparent pixels carry the text color so the antialiased edges keep it
+        layer = Image.new('RGBA', (layer_width, logo_height + 5 + text_bbox[3]), text_color[:3] + (0,))
+        layer.paste(logo, (offset_x, 0))
+        ImageDraw.Draw(layer).text(
+            ((layer_width - text_width) // 2, logo_height + 5), WATERMARK_NAME, font=font, fill=text_color
+        )
+        return WatermarkLayer(layer, logo_width, logo_height + text_height + 10, offset_x)
+
+    def list_backgrounds(self, folder_path):
+        """Background file names of the folder, listed again only when its mtime changes"""
+        try:
+            mtime = os.stat(folder_path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._folders_lock:
+            cached = self.folders.get(folder_path)
+            if cached and cached[0] == mtime:
+                self.folder_stats["hits"] += 1
+                return cached[1]
+            self.folder_stats["misses"] += 1
+            files = [
+                f for f in os.listdir(folder_path)
+                if os.path.isfile(os.path.join(folder_path, f)) and os.path.splitext(f)[1].lower() in self.BACKGROUND_EXTENSIONS
+            ]
+            self.folders[folder_path] = (mtime, files)
+            return files
+
+    def get_background(self, background_path, theme, width, height):
+        """
+        The background resized to (width, height) with the theme overlay composited,
+        shared: callers draw on a copy(). A file replaced in place gets a new entry.
+        """
+        mtime = os.stat(background_path).st_mtime_ns
+        return self.backgrounds.get(
+            (background_path, mtime, theme, width, height),
+            lambda: self._load_background(background_path, theme, width, height)
+        )
+
+    def _load_background(self, background_path, theme, width, height):
+        with Image.open(background_path) as background:
+            background = background.convert('RGBA').resize((width, height))
+        overlay_color = (0, 0, 0, 150) if theme == 'dark' else (255, 255, 255, 100)
+        return Image.alpha_composite(background, Image.new('RGBA', (width, height), overlay_color))
+
+    def get_stats(self):
+        return {
+            "fonts": self.fonts.get_stats(),
+            "watermarks": self.watermarks.get_stats(),
+            "backgrounds": self.backgrounds.get_stats(),
+            "background_folders": dict(self.folder_stats),
+        }
+
+    def clear(self):
+        self.fonts.clear()
+        self.watermarks.clear()
+        self.backgrounds.clear()
+        with self._folders_lock:
+            self.folders.clear()
+
+
+_asset_cache = None
+
+def get_image_asset_cache():
+    """Returns the process-wide asset cache"""
+    global _asset_cache
+    if _asset_cache is None:
+        _asset_cache = ImageAssetCache()
+    return _asset_cache
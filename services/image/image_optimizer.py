@@ -0,0 +1,222 @@
+import os
+import time
+import asyncio
+import threading
+from PIL import Image
+
+from config.image_config import (
+    IMAGE_OPTIMIZER,
+    IMAGE_OPTIMIZER_CONCURRENCY,
+    IMAGE_PNG_COLORS,
+    IMAGE_PNG_COMPRESS_LEVEL,
+    IMAGE_PNGQUANT_QUALITY,
+    IMAGE_JPEG_QUALITY,
+)
+
+PNG_EXTENSIONS = (".png",)
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+
+
+class ImageOptimizer:
+    """
+    Base of the optimizer backends. optimize(path) is awaited by the app and
+    optimize_file(path) runs inside a render (worker process or thread) for the
+    backends where `in_render` is set. Both return a result dict with the bytes
+    before and after, the bytes saved and the seconds spent (or the reason the file
+    was skipped). optimize() adds it to the stats; the results of optimize_file are
+    sent back by the render and added with add_result, so the stats of the app
+    count the renders of every worker process.
+    """
+
+    name = "none"
+    # Renders are saved with a fast zlib level when the optimizer writes them again
+    reencodes = False
+    in_render = False
+
+    def __init__(self):
+        self.stats = {"images": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def record(self, file_path, bytes_before, bytes_after, seconds):
+        result = {
+            "backend": self.name,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_saved": bytes_before - bytes_after,
+            "seconds": round(seconds, 3),
+        }
+        saved_ratio = result["bytes_saved"] / bytes_before if bytes_before else 0
+        print(f"[image_optimizer] {os.path.basename(file_path)}: {bytes_before // 1024} KB -> "
+              f"{bytes_after // 1024} KB (-{saved_ratio:.0%}) in {seconds:.2f}s with {self.name}")
+        return result
+
+    def skip(self, file_path, reason):
+        print(f"[image_optimizer] {os.path.basename(file_path)} not optimized: {reason}")
+        return {"backend": self.name, "skipped": reason}
+
+    def add_result(self, result):
+        """Counts a result of optimize_file in the stats, returns it"""
+        if not result:
+            return result
+        with self._lock:
+            if "skipped" in result:
+                self.stats["skipped"] += 1
+            else:
+                self.stats["images"] += 1
+                self.stats["bytes_before"] += result["bytes_before"]
+                self.stats["bytes_after"] += result["bytes_after"]
+                self.stats["seconds"] += result["seconds"]
+        return result
+
+    def optimize_file(self, file_path):
+        return None
+
+    async def optimize(self, file_path):
+        return None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["bytes_saved"] = stats["bytes_before"] - stats["bytes_after"]
+        stats["seconds"] = round(stats["seconds"], 3)
+        return {"backend": self.name, **stats}
+
+
+class PillowImageOptimizer(ImageOptimizer):
+    """
+    In process: PNGs are quantized to a palette of png_colors and JPEGs re-encoded at
+    jpeg_quality, both with the encoder's optimize pass. The file is replaced only
+    when the result is smaller.
+    """
+
+    name = "pillow"
+    reencodes = True
+    in_render = True
+
+    def __init__(self, png_colors=IMAGE_PNG_COLORS, png_compress_level=IMAGE_PNG_COMPRESS_LEVEL, jpeg_quality=IMAGE_JPEG_QUALITY):
+        super().__init__()
+        self.png_colors = png_colors
+        self.png_compress_level = png_compress_level
+        self.jpeg_quality = jpeg_quality
+
+    def optimize_file(self, file_path):
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in PNG_EXTENSIONS + JPEG_EXTENSIONS:
+            return self.skip(file_path, f"unsupported format {ext}")
+
+        started = time.perf_counter()
+        bytes_before = os.path.getsize(file_path)
+        temp_path = f"{file_path}.optimized{ext}"
+        try:
+            with Image.open(file_path) as image:
+                if ext in PNG_EXTENSIONS:
+                    self._save_png(image, temp_path)
+                else:
+                    # No exif/icc passed on: metadata is stripped like jpegoptim --strip-all
+                    image.convert("RGB").save(temp_path, format="JPEG", quality=self.jpeg_quality, optimize=True, progressive=True)
+            bytes_after = os.path.getsize(temp_path)
+            if bytes_after < bytes_before:
+                os.replace(temp_path, file_path)
+            else:
+                bytes_after = bytes_before
+        except OSError as e:
+            return self.skip(file_path, str(e))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return self.record(file_path, bytes_before, bytes_after, time.perf_counter() - started)
+
+    def _save_png(self, image, temp_path):
+        if image.mode == "RGBA" and image.getchannel("A").getextrema() == (255, 255):
+            # Opaque renders quantize better (median cut) without the alpha channel
+            image = image.convert("RGB")
+        if image.mode == "RGBA":
+            quantized = image.quantize(self.png_colors, method=Image.Quantize.FASTOCTREE)
+        else:
+            quantized = image.convert("RGB").quantize(self.png_colors, method=Image.Quantize.MEDIANCUT)
+        quantized.save(temp_path, format="PNG", compress_level=self.png_compress_level)
+
+    async def optimize(self, file_path):
+        return self.add_result(await asyncio.to_thread(self.optimize_file, file_path))
+
+
+class SubprocessImageOptimizer(ImageOptimizer):
+    """
+    pngquant / jpegoptim run with asyncio.create_subprocess_exec, at most `concurrency`
+    at a time, after the render (the event loop only waits for them). A missing
+    binary leaves the file as it is.
+    """
+
+    name = "subprocess"
+    reencodes = True
+
+    def __init__(self, concurrency=IMAGE_OPTIMIZER_CONCURRENCY, png_quality=IMAGE_PNGQUANT_QUALITY, jpeg_quality=IMAGE_JPEG_QUALITY):
+        super().__init__()
+        self.concurrency = concurrency
+        self.png_quality = png_quality
+        self.jpeg_quality = jpeg_quality
+        # Semaphores are bound to the loop they are used in
+        self._semaphores = {"loop": None, "semaphore": None}
+
+    def get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphores["loop"] is not loop:
+            self._semaphores.update(loop=loop, semaphore=asyncio.Semaphore(self.concurrency))
+        return self._semaphores["semaphore"]
+
+    def get_command(self, file_path, ext):
+        if ext in PNG_EXTENSIONS:
+            command = ["pngquant", "--force", "--skip-if-larger", "--output", file_path]
+            if self.png_quality:
+                command += ["--quality", self.png_quality]
+            return command + [file_path]
+        return ["jpegoptim", "--strip-all", f"--max={self.jpeg_quality}", file_path]
+
+    async def optimize(self, file_path):
+        return self.add_result(await self._optimize(file_path))
+
+    async def _optimize(self, file_path):
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in PNG_EXTENSIONS + JPEG_EXTENSIONS:
+            return self.skip(file_path, f"unsupported format {ext}")
+
+        command = self.get_command(file_path, ext)
+        async with self.get_semaphore():
+            started = time.perf_counter()
+            bytes_before = os.path.getsize(file_path)
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+            except FileNotFoundError:
+                return self.skip(file_path, f"{command[0]} is not installed")
+            _, stderr = await process.communicate()
+            seconds = time.perf_counter() - started
+
+        # pngquant exits with 98/99 when the result would be larger or below --quality
+        if process.returncode in (98, 99):
+            return self.record(file_path, bytes_before, bytes_before, seconds)
+        if process.returncode != 0:
+            return self.skip(file_path, f"{command[0]} exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+        return self.record(file_path, bytes_before, os.path.getsize(file_path), seconds)
+
+
+def create_image_optimizer(backend=None):
+    backend = (backend or IMAGE_OPTIMIZER).lower()
+    if backend == "pillow":
+        return PillowImageOptimizer()
+    if backend == "subprocess":
+        return SubprocessImageOptimizer()
+    if backend == "none":
+        return ImageOptimizer()
+    raise ValueError(f"Unknown IMAGE_OPTIMIZER: {backend}")
+
+
+_optimizer = None
+
+def get_image_optimizer():
+    """Returns the optimizer of the process, selected by IMAGE_OPTIMIZER"""
+    global _optimizer
+    if _optimizer is None:
+        _optimizer = create_image_optimizer()
+    return _optimizer
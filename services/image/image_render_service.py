@@ -0,0 +1,146 @@
+import time
+import asyncio
+import multiprocessing
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config.image_config import IMAGE_RENDER_WORKERS
+from services.image.image_optimizer import get_image_optimizer
+
+
+@dataclass(slots=True)
+class RenderSpec:
+    """Everything a worker process needs to render one text image (picklable)"""
+
+    text: str
+    theme: str = "light"
+    background_path: str = ""
+    width: int = 1024
+    height: int = 1024
+    font_size: int = None
+    font_ratio: int = 24
+    text_scale: float = 1.0
+
+    def to_dict(self):
+        return asdict(self)
+
+
+# ImageServiceHandler of the worker process, its asset cache lives as long as the worker
+_worker_handler = None
+
+def get_worker_handler():
+    global _worker_handler
+    if _worker_handler is None:
+        # Imported here so the parent process can import this module without a cycle
+        from services.image.image_service import ImageServiceHandler
+        _worker_handler = ImageServiceHandler()
+    return _worker_handler
+
+
+def init_worker():
+    get_worker_handler().warm_up()
+
+
+def render_spec(spec):
+    """
+    Renders spec into an optimized temp file (runs in a worker). Returns its path and
+    the result of the optimizer, whose stats are kept by the app process.
+    """
+    return get_worker_handler().render_image(
+        {"text": spec.text, "background_path": spec.background_path},
+        spec.theme, spec.width, spec.height, spec.font_size, spec.font_ratio, spec.text_scale
+    )
+
+
+class ImageRenderService:
+    """
+    Renders RenderSpecs in a pool of worker processes, so the Pillow work and the
+    optimizers run on other cores and never block the event loop. With workers=0
+    the renders run in a thread of this process instead.
+    """
+
+    def __init__(self, workers=IMAGE_RENDER_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.stats = {"renders": 0, "seconds": 0.0, "pool_restarts": 0}
+        self._restart_lock = asyncio.Lock()
+
+    def get_executor(self):
+        if self.workers and self.executor is None:
+            # spawn: a forked child would inherit the event loop and the client threads
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+            )
+        return self.executor
+
+    async def start(self):
+        """Starts the workers (each warms up its asset cache) before the first render"""
+        if not self.workers:
+            await asyncio.to_thread(get_worker_handler().warm_up)
+            return
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, int) for _ in range(self.workers)))
+
+    async def render(self, spec):
+        started = time.perf_counter()
+        path, optimized = await self._render(spec)
+        self.stats["renders"] += 1
+        self.stats["seconds"] += time.perf_counter() - started
+        get_image_optimizer().add_result(optimized)
+        return path
+
+    async def _render(self, spec):
+        if not self.workers:
+            return await asyncio.to_thread(render_spec, spec)
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        try:
+            return await loop.run_in_executor(executor, render_spec, spec)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): try once more in a new pool
+            executor = await self.restart_executor(executor)
+            return await loop.run_in_executor(executor, render_spec, spec)
+
+    async def restart_executor(self, broken_executor):
+        """
+        Replaces broken_executor, once: every render that was in the broken pool gets
+        here, the first one restarts it and the others retry in the new pool.
+        """
+        async with self._restart_lock:
+            if self.executor is broken_executor:
+                print("[image_render] Render pool broken, restarting it.")
+                self.stats["pool_restarts"] += 1
+                self.shutdown(wait=False)
+            return self.get_executor()
+
+    async def render_many(self, specs):
+        """Renders the specs in parallel, returns their temp file paths in order"""
+        return await asyncio.gather(*(self.render(spec) for spec in specs))
+
+    def get_stats(self):
+        renders = self.stats["renders"]
+        return {
+            **self.stats,
+            "seconds": round(self.stats["seconds"], 3),
+            "avg_seconds": round(self.stats["seconds"] / renders, 3) if renders else 0,
+            "workers": self.workers,
+        }
+
+    def shutdown(self, wait=True):
+        executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_render_service = None
+
+def get_render_service():
+    """Returns the process-wide render service"""
+    global _render_service
+    if _render_service is None:
+        _render_service = ImageRenderService()
+    return _render_service
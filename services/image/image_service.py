@@ -1,7 +1,7 @@
 import os
 import random
-import subprocess
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+import asyncio
+from PIL import Image, ImageDraw
 import uuid
 
 from config.image_config import (
@@ -11,12 +11,13 @@ from config.image_config import (
     DEFAULT_BACKGROUND_IMAGE_DARK,
     DEFAULT_WATERMARK_LIGHT,
     DEFAULT_WATERMARK_DARK,
-    WATERMARK_NAME,
-    WATERMARK_WIDTH_DIVIDER,
     WATERMARK_MARGIN_BOTTOM,
     WATERMARK_IMAGE_CENTER,
     FONT_FAMILY,
     LINE_SPACING,
+    TEXT_AUTO_FIT,
+    TEXT_MIN_FONT_SIZE,
+    TEXT_MAX_HEIGHT_RATIO,
     SHOW_WATERMARK,
     SHOW_WATERMARK_NAME,
     RANDOM_BACKGROUND,
@@ -24,13 +25,36 @@ from config.image_config import (
     LOGOS_DIR
 )
 from utils.file_utils import FileHandler
+from services.image.image_asset_cache import get_image_asset_cache
+from services.image.text_layout import get_font_metrics, layout_text, fit_text
+from services.image.image_render_service import RenderSpec, get_render_service
+from services.image.image_optimizer import get_image_optimizer
 from services.ai.openai_service import OpenaiServiceHandler
 
 class ImageServiceHandler:
     def __init__(self):
         self.file_handler = FileHandler()
         self.openai_service_handler = OpenaiServiceHandler()
-        
+        self.asset_cache = get_image_asset_cache()
+        self.optimizer = get_image_optimizer()
+
+    def get_watermark_path(self, theme):
+        if theme == 'dark':
+            return os.path.join(LOGOS_DIR, DEFAULT_WATERMARK_LIGHT)
+        return os.path.join(LOGOS_DIR, DEFAULT_WATERMARK_DARK)
+
+    def warm_up(self, width=1024, font_ratio=24):
+        """Loads the fonts and watermark layers of the default renders into the asset cache"""
+        font_path = os.path.join(FONTS_DIR, FONT_FAMILY)
+        self.asset_cache.get_font(font_path, int(os.getenv('FONT_SIZE', width // font_ratio)))
+        if not SHOW_WATERMARK:
+            return
+        for theme in ('light', 'dark'):
+            try:
+                self.asset_cache.get_watermark(theme, width, SHOW_WATERMARK_NAME, self.get_watermark_path(theme), font_path)
+            except FileNotFoundError:
+                print(f"[image_service] Watermark for the {theme} theme not found, not warmed up.")
+
     def resolve_background_path(self, theme, data_background):
         if data_background:
             absolute_background_path = self.file_handler.get_file_path(data_background)
@@ -40,123 +64,104 @@ class ImageServiceHandler:
         if RANDOM_BACKGROUND:
             folder = "light" if theme == 'light' else "dark"
             folder_path = os.path.join(BACKGROUNDS_DIR, folder)
-            if os.path.exists(folder_path):
-                valid_extensions = ['.png', '.jpg', '.jpeg']
-                files = [
-                    f for f in os.listdir(folder_path)
-                    if os.path.isfile(os.path.join(folder_path, f)) and os.path.splitext(f)[1].lower() in valid_extensions
-                ]
-                if files:
-                    chosen_file = random.choice(files)
-                    return os.path.join(folder_path, chosen_file)
+            files = self.asset_cache.list_backgrounds(folder_path)
+            if files:
+                chosen_file = random.choice(files)
+                return os.path.join(folder_path, chosen_file)
 
         if theme == 'light':
             return os.path.join(BACKGROUNDS_DIR, 'dark', DEFAULT_BACKGROUND_IMAGE_LIGHT)
         else:
             return os.path.join(BACKGROUNDS_DIR, 'light', DEFAULT_BACKGROUND_IMAGE_DARK)
 
-    def create_text_image(self, text, font_path, font_size, text_color, text_scale=1.0, max_width_ratio=2/3, image_width=1024):
-        line_spacing = LINE_SPACING
-        try:
-            font = ImageFont.truetype(font_path, size=font_size)
-        except:
-            font = ImageFont.load_default()
-
+    def create_text_image(self, text, font_path, font_size, text_color, text_scale=1.0, max_width_ratio=2/3, image_width=1024, max_height=None):
         max_text_width = int(image_width * max_width_ratio)
-        dummy_img = Image.new('RGBA', (10, 10), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(dummy_img)
-        paragraphs = text.split('\n')
-        lines = []
-        for paragraph in paragraphs:
-            words = paragraph.split(' ')
-            current_line = ""
-            for word in words:
-                test_line = current_line + (' ' if current_line else '') + word
-                bbox = draw.textbbox((0, 0), test_line, font=font)
-                test_width = bbox[2] - bbox[0]
-                if test_width <= max_text_width:
-                    current_line = test_line
-                else:
-                    lines.append(current_line)
-                    current_line = word
-            if current_line:
-                lines.append(current_line)
-
-        line_height = (font.getbbox('Ay')[3] - font.getbbox('Ay')[1]) + line_spacing
-        text_img_width = int(max_text_width * text_scale)
-        text_img_height = int(line_height * len(lines) * text_scale)
-        scaled_font_size = max(1, int(font_size * text_scale))
 
-        try:
-            scaled_font = ImageFont.truetype(font_path, size=scaled_font_size)
-        except:
-            scaled_font = ImageFont.load_default()
+        def get_metrics(size):
+            return get_font_metrics(self.asset_cache.get_font(font_path, size))
+
+        if TEXT_AUTO_FIT:
+            layout = fit_text(text, get_metrics, font_size, max_text_width, max_height, TEXT_MIN_FONT_SIZE, LINE_SPACING)
+        else:
+            layout = layout_text(text, get_metrics(font_size), max_text_width, LINE_SPACING)
+
+        layout_font_size = layout.font_size or font_size
+        scaled_font_size = max(1, int(layout_font_size * text_scale))
+        scaled_metrics = get_metrics(scaled_font_size)
+        line_height = int(layout.line_height * text_scale)
+        text_img_width = int(max_text_width * text_scale)
+        text_img_height = line_height * len(layout.lines)
 
         text_img = Image.new('RGBA', (text_img_width, text_img_height), (0, 0, 0, 0))
         text_draw = ImageDraw.Draw(text_img)
         y = 0
-        for line in lines:
-            bbox = text_draw.textbbox((0, 0), line, font=scaled_font)
-            line_width = bbox[2] - bbox[0]
-            x = (text_img_width - line_width) // 2
-            text_draw.text((x, y), line, font=scaled_font, fill=text_color)
+        for line, line_width in zip(layout.lines, layout.line_widths):
+            if scaled_font_size != layout_font_size:
+                line_width = scaled_metrics.get_line_width(line.split(' '))
+            x = int((text_img_width - line_width) // 2)
+            text_draw.text((x, y), line, font=scaled_metrics.font, fill=text_color)
             y += line_height
         return text_img
 
     def add_watermark(self, canvas, watermark_path, width, height, show_watermark_name=False, theme='light'):
         try:
-            watermark_name = WATERMARK_NAME
-            font_path = os.path.join(FONTS_DIR, FONT_FAMILY)
-           
-            watermark_margin_bottom = WATERMARK_MARGIN_BOTTOM
-            watermark = Image.open(watermark_path).convert('RGBA')
-            new_watermark_width = width // WATERMARK_WIDTH_DIVIDER
-            resize_factor = new_watermark_width / watermark.width
-            new_watermark_height = int(watermark.height * resize_factor)
-            watermark = watermark.resize((new_watermark_width, new_watermark_height))
-            alpha = watermark.split()[3]
-            brightness = ImageEnhance.Brightness(alpha)
-            alpha = brightness.enhance(0.8)
-            watermark.putalpha(alpha)
-            watermark_center = WATERMARK_IMAGE_CENTER
-            draw = ImageDraw.Draw(canvas)
-            try:
-                font = ImageFont.truetype(font_path, size=width // 40)
-            except:
-                font = ImageFont.load_default()
-            text_bbox = draw.textbbox((0, 0), watermark_name, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            total_height = new_watermark_height + (text_height + 10 if show_watermark_name else 0)
-            if watermark_center:
-                pos_x = (width - new_watermark_width) // 2
-                pos_y = height - total_height - watermark_margin_bottom
-            else:
-                pos_x = width - new_watermark_width - watermark_margin_bottom
-                pos_y = height - total_height - watermark_margin_bottom
-            canvas.paste(watermark, (pos_x, pos_y), watermark)
-            if show_watermark_name:
-                watermark_text_color = (255, 255, 255, int(0.8 * 255)) if theme == 'dark' else (0, 0, 0, int(0.6 * 255))
-                text_x = (width - text_width) // 2 if watermark_center else (pos_x + (new_watermark_width - text_width) // 2)
-                text_y = pos_y + new_watermark_height + 5
-                draw.text((text_x, text_y), watermark_name, font=font, fill=watermark_text_color)
+            watermark = self.asset_cache.get_watermark(
+                theme, width, show_watermark_name, watermark_path, os.path.join(FONTS_DIR, FONT_FAMILY)
+            )
         except FileNotFoundError:
             print("Watermark not found. Continuing without watermark.")
+            return
+
+        if WATERMARK_IMAGE_CENTER:
+            pos_x = (width - watermark.logo_width) // 2
+        else:
+            pos_x = width - watermark.logo_width - WATERMARK_MARGIN_BOTTOM
+        pos_y = height - watermark.total_height - WATERMARK_MARGIN_BOTTOM
+        canvas.paste(watermark.image, (pos_x - watermark.offset_x, pos_y), watermark.image)
+
+    def get_render_spec(self, data, theme='light', width=1024, height=1024, font_size=None, font_ratio=24, text_scale=1.0):
+        return RenderSpec(
+            text=data["text"],
+            theme=theme,
+            background_path=data.get("background_path") or "",
+            width=width,
+            height=height,
+            font_size=font_size,
+            font_ratio=font_ratio,
+            text_scale=text_scale,
+        )
 
     async def generate_image(self, data, id, theme='light', width=1024, height=1024, font_size=None, font_ratio=24, text_scale=1.0):
+        # Rendered in the render pool, off the event loop and on another core
+        spec = self.get_render_spec(data, theme, width, height, font_size, font_ratio, text_scale)
+        temp_file_path = await get_render_service().render(spec)
+        if not self.optimizer.in_render:
+            await self.optimize_image(temp_file_path)
+        return self.file_handler.move_temp_file_to_folder(temp_file_path, id)
+
+    async def generate_images(self, items):
+        """
+        Renders the (data, id, theme) items in parallel with render_many and returns
+        their moved files in order.
+        """
+        specs = [self.get_render_spec(data, theme) for data, _, theme in items]
+        temp_file_paths = await get_render_service().render_many(specs)
+        if not self.optimizer.in_render:
+            await asyncio.gather(*(self.optimize_image(temp_file_path) for temp_file_path in temp_file_paths))
+        return [
+            self.file_handler.move_temp_file_to_folder(temp_file_path, id)
+            for temp_file_path, (_, id, _) in zip(temp_file_paths, items)
+        ]
+
+    def render_image(self, data, theme='light', width=1024, height=1024, font_size=None, font_ratio=24, text_scale=1.0):
+        """
+        Renders the text image into a temp file and returns (path, optimize result),
+        the result being None unless the optimizer runs in the render.
+        """
         text = data["text"]
         background_path = self.resolve_background_path(theme, data.get("background_path"))
-        background = Image.open(background_path).convert('RGBA')
-        background = background.resize((width, height))
-        canvas = Image.new('RGBA', (width, height))
-        canvas.paste(background, (0, 0))
-        overlay_color = (0, 0, 0, 150) if theme == 'dark' else (255, 255, 255, 100)
-        overlay = Image.new('RGBA', (width, height), overlay_color)
-        canvas = Image.alpha_composite(canvas, overlay)
-        if theme == 'dark':
-            watermark_path = os.path.join(LOGOS_DIR, DEFAULT_WATERMARK_LIGHT)
-        else:
-            watermark_path = os.path.join(LOGOS_DIR, DEFAULT_WATERMARK_DARK)
+        canvas = self.asset_cache.get_background(background_path, theme, width, height).copy()
+        watermark_path = self.get_watermark_path(theme)
         print(f"Watermark path: {watermark_path}")
         text_img = self.create_text_image(
             text,
@@ -165,7 +170,8 @@ class ImageServiceHandler:
             text_color=(255, 255, 255) if theme == 'dark' else (0, 0, 0),
             text_scale=text_scale,
             max_width_ratio=2/3,
-            image_width=width
+            image_width=width,
+            max_height=int(height * TEXT_MAX_HEIGHT_RATIO)
         )
 
         text_width, text_height = text_img.size
@@ -178,16 +184,20 @@ class ImageServiceHandler:
         os.makedirs(TEMPS_DIR, exist_ok=True)
         temp_filename = f"temp_{uuid.uuid4().hex}.png"
         temp_file_path = os.path.join(TEMPS_DIR, temp_filename)
-        canvas.save(temp_file_path, format='PNG')
+        # The optimizer writes the file again, no point in compressing it hard first
+        canvas.save(temp_file_path, format='PNG', compress_level=1 if self.optimizer.reencodes else 6)
 
-        self.optimize_image_file(temp_file_path)
-        result = self.file_handler.move_temp_file_to_folder(temp_file_path, id)
-        return result
+        optimized = None
+        if self.optimizer.in_render:
+            optimized = self.optimize_image_file(temp_file_path)
+        return temp_file_path, optimized
     
     async def generate_media_by_prompt(self, prompt, id, temp_file_name="temp.png", other_name=""):
         print(f"Generating file from prompt: {prompt}")
-        temp_file_path = await self.generate_image_from_prompt(prompt, temp_file_name)
-        self.optimize_image_file(temp_file_path)
+        # Several posts/threads may be generating media at the same time
+        temp_file_path = await self.generate_image_from_prompt(prompt, f"{id}_{temp_file_name}")
+        if temp_file_path:
+            await self.optimize_image(temp_file_path)
         return self.file_handler.move_temp_file_to_folder(temp_file_path, id, other_name)
 
     async def generate_image_from_prompt(self, prompt, filename="temp.png"):
@@ -202,36 +212,14 @@ class ImageServiceHandler:
         
         print(f"[image_service] Service not configured. Skipping image generation for prompt: {prompt}")
         return ""
-    
-    
 
-    import subprocess
-
-    def optimize_image_file(sefl, file_path):
+    def optimize_image_file(self, file_path):
         """
-        Optimiza una imagen PNG o JPEG usando pngquant o jpegoptim.
-        Solo se aplica si las herramientas están disponibles en el sistema.
-        
-        :param file_path: Ruta del archivo a optimizar.
+        Optimizes the file in place, from inside a render (see ImageOptimizer.in_render).
+        The result is not counted here, the render service adds it to the app stats.
         """
-        ext = os.path.splitext(file_path)[1].lower()
+        return self.optimizer.optimize_file(file_path)
 
-        if ext == ".png":
-            try:
-                subprocess.run(["pngquant", "--force", "--output", file_path, file_path], check=True)
-                print(f"✅ PNG optimizado con pngquant: {file_path}")
-            except FileNotFoundError:
-                print("⚠️ pngquant no está instalado, omitiendo optimización PNG.")
-            except subprocess.CalledProcessError as e:
-                print(f"❌ Error optimizando PNG: {e}")
-        
-        elif ext in [".jpg", ".jpeg"]:
-            try:
-                subprocess.run(["jpegoptim", "--strip-all", "--max=85", file_path], check=True)
-                print(f"✅ JPEG optimizado con jpegoptim: {file_path}")
-            except FileNotFoundError:
-                print("⚠️ jpegoptim no está instalado, omitiendo optimización JPEG.")
-            except subprocess.CalledProcessError as e:
-                print(f"❌ Error optimizando JPEG: {e}")
-        else:
-            print("ℹ️ Formato no soportado para optimización:", ext)
\ No newline at end of file
+    async def optimize_image(self, file_path):
+        """Optimizes the file in place with the IMAGE_OPTIMIZER backend"""
+        return await self.optimizer.optimize(file_path)
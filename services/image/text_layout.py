@@ -0,0 +1,120 @@
+from services.image.image_asset_cache import LruCache
+
+# Fonts whose word widths are kept, and words kept per font
+TEXT_METRICS_CACHE_SIZE = 32
+MAX_WORDS_PER_FONT = 5000
+
+
+class FontMetrics:
+    """Advances of the words of one font, each word measured once"""
+
+    def __init__(self, font):
+        self.font = font
+        self.size = getattr(font, "size", None)
+        self.space_width = font.getlength(' ')
+        bbox = font.getbbox('Ay')
+        self.text_height = bbox[3] - bbox[1]
+        self.words = {}
+
+    def get_word_width(self, word):
+        width = self.words.get(word)
+        if width is None:
+            if len(self.words) >= MAX_WORDS_PER_FONT:
+                self.words.clear()
+            width = self.words[word] = self.font.getlength(word)
+        return width
+
+    def get_line_width(self, words):
+        if not words:
+            return 0
+        return sum(self.get_word_width(word) for word in words) + self.space_width * (len(words) - 1)
+
+
+_metrics = LruCache(TEXT_METRICS_CACHE_SIZE)
+
+def get_font_metrics(font):
+    """Metrics shared by every layout using the font (fonts come from the asset cache)"""
+    path = getattr(font, "path", None)
+    key = (path, getattr(font, "size", None)) if path else id(font)
+    return _metrics.get(key, lambda: FontMetrics(font))
+
+
+class TextLayout:
+    """Wrapped lines of a text for one font size, with their widths and the total size"""
+
+    __slots__ = ("lines", "line_widths", "line_height", "font_size", "width", "height")
+
+    def __init__(self, lines, line_widths, line_height, font_size):
+        self.lines = lines
+        self.line_widths = line_widths
+        self.line_height = line_height
+        self.font_size = font_size
+        self.width = max(line_widths, default=0)
+        self.height = line_height * len(lines)
+
+    def fits(self, max_width, max_height=None):
+        return self.width <= max_width and (max_height is None or self.height <= max_height)
+
+
+def layout_text(text, metrics, max_width, line_spacing=0):
+    """
+    Greedy word wrap in one pass: the width of the current line is kept as a running
+    sum of word advances and spaces, so no line is measured twice. Paragraphs
+    (newlines) start a new line, empty lines are dropped and a word wider than
+    max_width gets a line of its own (preceded by an empty line when it opens its
+    paragraph, as the renders always did).
+    """
+    lines = []
+    line_widths = []
+    for paragraph in text.split('\n'):
+        current_words = []
+        current_width = 0
+        for word in paragraph.split(' '):
+            word_width = metrics.get_word_width(word)
+            if not current_words:
+                if word_width > max_width:
+                    lines.append('')
+                    line_widths.append(0)
+                current_words = [word]
+                current_width = word_width
+                continue
+            test_width = current_width + metrics.space_width + word_width
+            if test_width <= max_width:
+                current_words.append(word)
+                current_width = test_width
+            else:
+                lines.append(' '.join(current_words))
+                line_widths.append(current_width)
+                current_words = [word]
+                current_width = word_width
+        line = ' '.join(current_words)
+        if line:
+            lines.append(line)
+            line_widths.append(current_width)
+    return TextLayout(lines, line_widths, metrics.text_height + line_spacing, metrics.size)
+
+
+def fit_text(text, get_metrics, font_size, max_width, max_height=None, min_font_size=1, line_spacing=0):
+    """
+    Layout at font_size when it fits in (max_width, max_height), otherwise at the
+    largest size between min_font_size and font_size that does, found by binary
+    search. get_metrics(size) returns the FontMetrics of the font at that size.
+    """
+    layout = layout_text(text, get_metrics(font_size), max_width, line_spacing)
+    if layout.fits(max_width, max_height):
+        return layout
+
+    low, high = min(min_font_size, font_size), font_size - 1
+    best = None
+    while low <= high:
+        size = (low + high) // 2
+        candidate = layout_text(text, get_metrics(size), max_width, line_spacing)
+        if candidate.fits(max_width, max_height):
+            best = candidate
+            low = size + 1
+        else:
+            high = size - 1
+    if best is None:
+        # Nothing fits, the smallest size overflows the least
+        best = layout_text(text, get_metrics(min(min_font_size, font_size)), max_width, line_spacing)
+    return best
@@ -0,0 +1,117 @@
+import os
+from datetime import datetime
+from utils.json_utils import JSONHandler, thaw
+from utils.base_utils import get_path_from_base
+from utils.lock_utils import FileLock
+from services.post.post_model import PLATFORM_STATUS_KEYS
+
+POST_JSON_FILE = os.getenv("POSTS_JSON_FILE")
+POSTED_DIR = os.path.join("data", "posted")
+POSTED_INDEX_FILE = os.path.join(POSTED_DIR, "index.json")
+# Taken around every read-modify-write of the shards and the index (all workers archive)
+POSTED_LOCK_FILE = os.path.join(POSTED_DIR, "posted.lock")
+
+
+class PostArchiveService:
+    """
+    Moves posts already published on every platform out of the hot posts file into
+    dated shards (json/data/posted/posts-DD-MM-YYYY.json, the naming of the shards
+    archived by hand before) and keeps a small id -> shard index
+    (json/data/posted/index.json) to find them again. The index is built from
+    every existing shard on first use, and posts already in it are not copied again.
+    """
+
+    def __init__(self, post_service):
+        self.post_service = post_service
+        self.json_handler = JSONHandler()
+        self.lock_path = get_path_from_base("json", POSTED_LOCK_FILE)
+
+    def get_shard_file(self, archived_at):
+        return os.path.join(POSTED_DIR, f"posts-{archived_at.strftime('%d-%m-%Y')}.json")
+
+    async def load_index(self):
+        """Read-only index, see _load_index for the one to update"""
+        index = await self.json_handler.load_json(POSTED_INDEX_FILE, readonly=True)
+        if index is None:
+            async with FileLock(self.lock_path):
+                index = await self._load_index()
+        return index
+
+    async def _load_index(self):
+        """load_index for callers already holding the lock"""
+        index = await self.json_handler.load_json(POSTED_INDEX_FILE)
+        if index is None:
+            index = await self._rebuild_index()
+        return index
+
+    async def rebuild_index(self):
+        """Builds the id -> shard index from every shard in json/data/posted"""
+        async with FileLock(self.lock_path):
+            return await self._rebuild_index()
+
+    async def _rebuild_index(self):
+        index = {"posts": {}}
+        posted_path = get_path_from_base("json", POSTED_DIR)
+        if os.path.exists(posted_path):
+            for filename in sorted(os.listdir(posted_path)):
+                if not filename.startswith("posts-") or not filename.endswith(".json"):
+                    continue
+                shard_file = os.path.join(POSTED_DIR, filename)
+                shard = await self.json_handler.load_json(shard_file, readonly=True) or {}
+                for post in shard.get("posts", []):
+                    index["posts"][str(post["id"])] = shard_file
+
+        await self.json_handler.save_json(index, POSTED_INDEX_FILE)
+        return index
+
+    async def get_archived_post(self, post_id):
+        index = await self.load_index()
+        shard_file = index["posts"].get(str(post_id))
+        if not shard_file:
+            return None
+
+        shard = await self.json_handler.load_json(shard_file, readonly=True) or {}
+        for post in shard.get("posts", []):
+            if post["id"] == post_id:
+                return thaw(post)
+        return None
+
+    async def archive_published_posts(self, json_file=POST_JSON_FILE):
+        """Moves the fully published posts of json_file to the shard of the day"""
+        posts = [post.to_dict() for post in await self.post_service.load_posts(json_file) if post.is_fully_posted()]
+        if not posts:
+            return []
+
+        archived_at = datetime.now()
+        shard_file = self.get_shard_file(archived_at)
+        archived_ids = {post["id"] for post in posts}
+
+        # Shard and index are written before the posts leave the hot file, so an
+        # interrupted run is repeated safely (posts are replaced by id)
+        async with FileLock(self.lock_path):
+            index = await self._load_index()
+            # Posts already in a shard (earlier shards, or a run stopped before the
+            # delete) only leave the hot file
+            new_posts = [post for post in posts if str(post["id"]) not in index["posts"]]
+            if new_posts:
+                shard = await self.json_handler.load_json(shard_file) or {
+                    "name": "Post List",
+                    "description": "Posts already published on every platform",
+                    "created_date": archived_at.strftime("%Y-%m-%d"),
+                    "posts": [],
+                }
+                new_ids = {post["id"] for post in new_posts}
+                shard["posts"] = [post for post in shard["posts"] if post["id"] not in new_ids]
+                for post in new_posts:
+                    post["archived_at"] = archived_at.isoformat(timespec="seconds")
+                    shard["posts"].append(post)
+                await self.json_handler.save_json(shard, shard_file)
+
+                for post_id in new_ids:
+                    index["posts"][str(post_id)] = shard_file
+                await self.json_handler.save_json(index, POSTED_INDEX_FILE)
+
+        await self.post_service.delete_posts(archived_ids, json_file)
+        print(f"✅ App: Archived {len(new_posts)} published posts into {shard_file}, "
+              f"{len(archived_ids) - len(new_posts)} were archived already")
+        return sorted(archived_ids)
@@ -0,0 +1,196 @@
+import os
+import asyncio
+from utils.json_utils import JSONHandler
+from services.post.post_service import PostService
+from services.post.post_generator_service import PostGeneratorService, POST_GENERATION_MODE, CONTENT_HASHTAGS
+from services.ai.openai_batch_service import (
+    BatchCompletionCollector,
+    PendingCompletion,
+    get_batch_backend,
+    parse_batch_output,
+    wait_for_batch,
+    OPENAI_BATCH_POLL_SECONDS,
+)
+
+PROCESSED_POSTS_JSON_FILE = os.getenv("PROCESSED_POSTS_JSON_FILE")
+# Answers of the submitted batches, so a restarted run resumes instead of paying again
+POST_BATCH_STATE_JSON_FILE = os.getenv("POST_BATCH_STATE_JSON_FILE", "data/post-batch.json")
+# Each thread continues the previous one, so a post with n threads needs about n + 2 rounds
+POST_BATCH_MAX_ROUNDS = int(os.getenv("POST_BATCH_MAX_ROUNDS", "10"))
+
+# Text fields filled by the batch, media is still generated by /generate-post
+BATCH_TEXT_FIELDS = (
+    "default_phrase",
+    "prompt_to_media",
+    "x_content",
+    "meta_content",
+    "hashtags_x",
+    "hashtags_instagram",
+    "hashtags_facebook",
+)
+
+
+def merge_text_fields(target, source):
+    """Copies the text fields set in source and still empty in target, returns True on changes"""
+    changed = False
+    for name in BATCH_TEXT_FIELDS:
+        if getattr(source, name) and not getattr(target, name):
+            setattr(target, name, getattr(source, name))
+            changed = True
+
+    for name in ("text", "prompt_to_background"):
+        value = getattr(source.metadata_to_media, name)
+        if value and not getattr(target.metadata_to_media, name):
+            setattr(target.metadata_to_media, name, value)
+            changed = True
+    return changed
+
+
+class PostBatchService:
+    """
+    Fills the text of every unprocessed post of PROCESSED_POSTS_JSON_FILE through batch
+    jobs instead of one post at a time during the scheduled runs.
+    Each round replays the generation steps of PostGeneratorService with a
+    BatchCompletionCollector: steps answered by earlier batches fill their fields, the
+    others become the requests of the next batch. Results are merged into the posts
+    after every round, and the posts stay unprocessed, so /generate-post only has
+    the media left to do.
+    """
+
+    def __init__(self, backend=None, json_file=PROCESSED_POSTS_JSON_FILE, state_file=POST_BATCH_STATE_JSON_FILE):
+        self.backend = backend or get_batch_backend()
+        self.json_file = json_file
+        self.state_file = state_file
+        self.json_handler = JSONHandler()
+        self.post_service = PostService()
+        self.collector = BatchCompletionCollector()
+        self.generator = PostGeneratorService()
+        self.generator.openai_service = self.collector
+        self._lock = asyncio.Lock()
+
+    def is_running(self):
+        return self._lock.locked()
+
+    async def load_state(self):
+        state = await self.json_handler.load_json(self.state_file)
+        if not state or state.get("json_file") != self.json_file:
+            state = {"json_file": self.json_file, "round": 0, "batch_id": None, "answers": {}}
+        return state
+
+    async def save_state(self, state):
+        await self.json_handler.save_json(state, self.state_file)
+
+    async def get_pending_posts(self):
+        return [post for post in await self.post_service.load_posts(self.json_file) if not post.is_processed]
+
+    async def run_step(self, step_id, step):
+        """Returns False when the step is waiting for a batch answer"""
+        self.collector.begin_step(step_id)
+        try:
+            await step
+            return True
+        except PendingCompletion:
+            return False
+
+    async def collect_post(self, post):
+        total_threads = len(post.threads)
+        generator = self.generator
+
+        await self.run_step(f"{post.id}:media", generator.generate_media_prompts(post))
+        if POST_GENERATION_MODE == "bundled":
+            await self.run_step(f"{post.id}:bundle", generator.generate_post_bundle(post, total_threads))
+        else:
+            for social_media in ("x", "instagram", "facebook"):
+                await self.run_step(f"{post.id}:hashtags_{social_media}", generator.generate_post_hashtags(post, social_media))
+            for content_type, social_medias in CONTENT_HASHTAGS.items():
+                if all(post.get_hashtags(social_media) for social_media in social_medias):
+                    await self.run_step(
+                        f"{post.id}:{content_type}",
+                        generator.generate_post_content(post, content_type, total_threads=total_threads)
+                    )
+
+        if not post.is_thread:
+            return
+
+        last_post = post
+        for thread in post.threads:
+            if not await self.run_step(f"{thread.id}:phrase", generator.generate_thread_phrase(thread, last_post)):
+                break
+            await self.run_step(f"{thread.id}:media", generator.generate_media_prompts(thread))
+            if not (last_post.x_content and last_post.meta_content):
+                break
+            last_content = {"x_content": last_post.x_content, "meta_content": last_post.meta_content}
+            for content_type in CONTENT_HASHTAGS:
+                await self.run_step(
+                    f"{thread.id}:{content_type}",
+                    generator.generate_post_content(thread, content_type, True, last_content, total_threads)
+                )
+            last_post = thread
+
+    async def merge_posts(self, posts):
+        """Writes the fields answered so far, skipping posts generated meanwhile by /generate-post"""
+        merged_ids = []
+        async with self.post_service.transaction():
+            for post in posts:
+                stored = await self.post_service.get_post(post.id, json_file=self.json_file)
+                if not stored or stored.is_processed:
+                    continue
+
+                changed = merge_text_fields(stored, post)
+                threads = {thread.id: thread for thread in post.threads}
+                for thread in stored.threads:
+                    if thread.id in threads:
+                        changed = merge_text_fields(thread, threads[thread.id]) or changed
+
+                if changed:
+                    await self.post_service.save_updated_post(stored, json_file=self.json_file)
+                    merged_ids.append(post.id)
+        return merged_ids
+
+    async def run(self, max_rounds=POST_BATCH_MAX_ROUNDS, poll_seconds=OPENAI_BATCH_POLL_SECONDS):
+        """
+        Runs rounds until every pending request is answered (or max_rounds batches were
+        submitted) and returns a summary of the run.
+        """
+        async with self._lock:
+            state = await self.load_state()
+            self.collector.answers = state["answers"]
+            merged_ids = set()
+            requests = {}
+
+            while True:
+                if not state["batch_id"]:
+                    posts = await self.get_pending_posts()
+                    self.collector.requests = {}
+                    for post in posts:
+                        await self.collect_post(post)
+                    requests = self.collector.requests
+                    merged_ids.update(await self.merge_posts(posts))
+
+                    if not requests or state["round"] >= max_rounds:
+                        break
+
+                    state["batch_id"] = await self.backend.submit(list(requests.values()))
+                    state["round"] += 1
+                    await self.save_state(state)
+                    print(f"[post_batch] Round {state['round']}: {len(requests)} requests of {len(posts)} posts submitted as {state['batch_id']}")
+
+                status = await wait_for_batch(self.backend, state["batch_id"], poll_seconds)
+                answers, total_tokens = parse_batch_output(await self.backend.get_results(state["batch_id"]))
+                print(f"[post_batch] Batch {state['batch_id']} {status}: {len(answers)} answers, {total_tokens} tokens")
+                state["answers"].update(answers)
+                state["batch_id"] = None
+                await self.save_state(state)
+
+                if not answers:
+                    print("[post_batch] The batch returned no answers, stopping.")
+                    break
+
+            summary = {"rounds": state["round"], "merged_posts": len(merged_ids), "pending_requests": len(requests)}
+            await self.save_state({"json_file": self.json_file, "round": 0, "batch_id": None, "answers": {}})
+            print(f"✅ [post_batch] Batch generation finished: {summary}")
+            return summary
+
+
+if __name__ == "__main__":
+    asyncio.run(PostBatchService().run())
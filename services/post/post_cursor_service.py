@@ -0,0 +1,172 @@
+import os
+import bisect
+import asyncio
+from utils.json_utils import JSONHandler
+from services.post.post_archive_service import PLATFORM_STATUS_KEYS
+
+POST_JSON_FILE = os.getenv("POSTS_JSON_FILE")
+POST_CURSORS_JSON_FILE = os.getenv("POST_CURSORS_JSON_FILE", "data/post-cursors.json")
+
+
+def is_publishable(post, status_key):
+    return post.get("is_processed") is True and post.get(status_key) == "not_posted"
+
+
+class PostCursorService:
+    """
+    Per-platform queues of the post ids that are ready to publish (processed and
+    not_posted), ordered by id and persisted in POST_CURSORS_JSON_FILE.
+    The queues follow every write of the store through its listener, so the next post
+    of a platform is the head of its queue. When the store version differs from the one
+    they were built against (e.g. another process wrote the document), only the posts
+    changed since are read again (see PostStore.get_changed_post_ids); they are rebuilt
+    from the whole document when the store cannot tell which posts changed.
+    Once loaded, the queues are only ever updated in place or swapped for a new dict,
+    never dropped, so a lookup running concurrently always has queues to work on.
+    """
+
+    def __init__(self, store, json_file=POST_JSON_FILE, cursor_file=POST_CURSORS_JSON_FILE):
+        self.store = store
+        self.json_file = json_file
+        self.cursor_file = cursor_file
+        self.json_handler = JSONHandler()
+        self.queues = None
+        self.version = None
+        self._lock = asyncio.Lock()
+        store.add_listener(self.on_store_changes)
+
+    async def _save(self):
+        await self.json_handler.save_json(
+            {"json_file": self.json_file, "version": self.version, "queues": self.queues},
+            self.cursor_file
+        )
+
+    async def rebuild(self):
+        version = await self.store.get_version(self.json_file)
+        data = await self.store.load_document(self.json_file) or {"posts": []}
+        self.queues = {
+            status_key: sorted(post["id"] for post in data["posts"] if is_publishable(post, status_key))
+            for status_key in PLATFORM_STATUS_KEYS
+        }
+        self.version = version
+        print(f"[post_cursor] Rebuilt cursors for {self.json_file}: " + ", ".join(
+            f"{status_key}={len(queue)}" for status_key, queue in self.queues.items()
+        ))
+        await self._save()
+
+    async def ensure_fresh(self):
+        # Outside the lock: importing the document notifies on_store_changes, which takes it
+        await self.store.ensure_document(self.json_file)
+        async with self._lock:
+            version = await self.store.get_version(self.json_file)
+            if self.queues is None:
+                saved = await self.json_handler.load_json(self.cursor_file) or {}
+                if saved.get("json_file") != self.json_file:
+                    await self.rebuild()
+                    return
+                self.queues = saved["queues"]
+                self.version = saved.get("version")
+            if self.version == version:
+                return
+
+            changed_ids = await self.store.get_changed_post_ids(self.json_file, self.version)
+            if changed_ids is None:
+                await self.rebuild()
+                return
+            for post_id in changed_ids:
+                self._set_post(post_id, await self.store.get_post(post_id, self.json_file))
+            self.version = version
+            await self._save()
+
+    def _set_queued(self, status_key, post_id, queued):
+        queue = self.queues[status_key]
+        index = bisect.bisect_left(queue, post_id)
+        present = index < len(queue) and queue[index] == post_id
+        if queued and not present:
+            queue.insert(index, post_id)
+        elif not queued and present:
+            del queue[index]
+
+    def _set_post(self, post_id, post):
+        """Queues or unqueues the post on every platform, post is None when it was deleted"""
+        for status_key in PLATFORM_STATUS_KEYS:
+            self._set_queued(status_key, post_id, bool(post) and is_publishable(post, status_key))
+
+    async def on_store_changes(self, json_file, changes, old_version, new_version):
+        if json_file != self.json_file or self.queues is None:
+            return
+
+        async with self._lock:
+            if changes is None:
+                # Whole document replaced, the queues are rebuilt on next use
+                self.version = None
+                return
+
+            for change in changes:
+                if change["op"] == "delete":
+                    post = None
+                    post_id = change["id"]
+                elif change["op"] == "save":
+                    post = change["post"]
+                    post_id = post["id"]
+                else:
+                    if not {"is_processed", *PLATFORM_STATUS_KEYS} & change["fields"].keys():
+                        continue
+                    post_id = change["id"]
+                    post = await self.store.get_post(post_id, json_file)
+
+                self._set_post(post_id, post)
+
+            # After writes we did not see the version stays behind, ensure_fresh catches up on them
+            if self.version == old_version:
+                self.version = new_version
+            await self._save()
+
+    async def get_next_post(self, status_key, transaction=None, claim_token=None, lease_seconds=None):
+        """
+        Returns the next publishable post for the platform.
+        Changes buffered in a transaction are not in the store yet, so those posts are
+        checked through the transaction. With claim_token the post taken from the store is
+        leased to that token (see PostStore.claim_post) and leased posts are skipped.
+        """
+        await self.ensure_fresh()
+        pending = transaction.changes.get(self.json_file, {}) if transaction else {}
+
+        next_post = None
+        for post_id in sorted(pending):
+            post = await transaction.get_post(post_id, self.json_file)
+            if post and is_publishable(post, status_key):
+                next_post = post
+                break
+
+        for post_id in list(self.queues[status_key]):
+            if next_post and post_id > next_post["id"]:
+                break
+            if post_id in pending:
+                continue
+            post = await self.store.get_post(post_id, self.json_file)
+            if not post or not is_publishable(post, status_key):
+                # Entry out of date (the post was edited outside the store). Read it again
+                # under the lock, so a write that lands meanwhile is not undone
+                async with self._lock:
+                    self._set_post(post_id, await self.store.get_post(post_id, self.json_file))
+                continue
+            if claim_token:
+                post = await self.store.claim_post(
+                    post_id, status_key, "not_posted", {"is_processed": True}, self.json_file, claim_token, lease_seconds
+                )
+                if not post:
+                    continue
+            return post
+
+        return next_post
+
+
+_cursors = {}
+
+def get_post_cursor(store, json_file=POST_JSON_FILE):
+    """Returns the process-wide cursor service for the store and file"""
+    key = (id(store), json_file)
+    if key not in _cursors:
+        _cursors[key] = PostCursorService(store, json_file)
+    return _cursors[key]
@@ -1,9 +1,12 @@
 import os
 import random
+import asyncio
 from utils.json_utils import JSONHandler
 from utils.file_utils import FileHandler
 from services.post.post_service import PostService
+from services.post.post_model import Post, ThreadPost
 from services.ai.openai_service import OpenaiServiceHandler
+from services.ai.openai_usage import record_generation_stats, merge_generation_stats
 from services.files.remote_upload_service import RemoteUploadService
 from services.image.image_service import ImageServiceHandler
 
@@ -20,6 +23,26 @@ SEQUENCE = [
 ]
 
 MODEL_MINI = os.getenv("OPENAI_CONTENT_MODEL_2")
+# Text generation steps (OpenAI calls) running at the same time
+POST_GENERATION_CONCURRENCY = int(os.getenv("POST_GENERATION_CONCURRENCY", "4"))
+# Media steps (image generation, render, optimization and upload) running at the same time
+POST_MEDIA_CONCURRENCY = int(os.getenv("POST_MEDIA_CONCURRENCY", "3"))
+
+# Hashtags counted in the character budget of each content field
+CONTENT_HASHTAGS = {
+    "x_content": ["x"],
+    "meta_content": ["instagram", "facebook"],
+}
+
+# fields: one OpenAI call per content and hashtags field
+# bundled: contents and hashtags of a post in one structured output call
+POST_GENERATION_MODE = os.getenv("POST_GENERATION_MODE", "fields").lower()
+# Calls re-requesting the fields of a bundle that failed validation
+POST_BUNDLE_MAX_RETRIES = int(os.getenv("POST_BUNDLE_MAX_RETRIES", "2"))
+MIN_HASHTAGS = 2
+MAX_HASHTAGS = 8
+# Characters kept per hashtag when a content is generated before its hashtags are known
+HASHTAG_RESERVED_CHARACTERS = 20
 
 class PostGeneratorService:
     def __init__(self):
@@ -29,36 +52,17 @@ class PostGeneratorService:
         self.image_service_handler = ImageServiceHandler()
         self.openai_service = OpenaiServiceHandler()
         self.upload_service = RemoteUploadService()
-
+        self.semaphore = asyncio.Semaphore(POST_GENERATION_CONCURRENCY)
+        self.media_semaphore = asyncio.Semaphore(POST_MEDIA_CONCURRENCY)
 
         self.processed_posts = []
         self.unprocessed_posts = []
 
     def get_base_post(self):
-        return {
-            "id": 0,
-            "x_content": "",
-            "meta_content": "",
-            "prompt_to_media": "",
-            "media_path": "",
-            "media_path_remote": "",
-            "default_phrase": "",
-            "hashtags_x": [],
-            "hashtags_instagram": [],
-            "hashtags_facebook": [],
-            "metadata_to_media": {
-                "background_path": "",
-                "prompt_to_background": "",
-                "text": ""
-            },
-            "x_links": [],
-            "ig_links": [],
-            "fb_links": [],
-            "theme": "",
-        }
+        return Post()
 
     async def get_current_id(self):
-        data = await self.json_handler.load_json(os.getenv("APP_DATA_JSON_FILE"))
+        data = await self.json_handler.load_json(os.getenv("APP_DATA_JSON_FILE"), readonly=True)
 
         if not data:
             return 0
@@ -97,13 +101,8 @@ class PostGeneratorService:
         if is_thread:
             threads = []
             for i in range(total_random_threads):
-                base_post = self.get_base_post()
-                thread_post = base_post.copy()
-
-                thread_post["id"] = self.generate_thread_id(parent_id, i)
-                thread_post["theme"] = self.get_theme(thread_post["id"])
-                thread_post["post_type"] = post_type
-                threads.append(thread_post)
+                thread_id = self.generate_thread_id(parent_id, i)
+                threads.append(ThreadPost(id=thread_id, theme=self.get_theme(thread_id), post_type=post_type))
             return threads
 
         return []
@@ -122,27 +121,24 @@ class PostGeneratorService:
         """
         Process the post and return a new post object.
         """
-        # Implement the logic to process the post
-        base_post = self.get_base_post()
-        processed_post = base_post.copy()
         post_type = self.get_post_type(index)
         is_thread = self.get_is_thread(index)
 
-        processed_post["id"] = new_id
-        processed_post["post_type"] = post_type
-        processed_post["default_phrase"] = post["phrase"]
-        processed_post["topic"] = post["topic"]
-        processed_post["is_processed"] = False
-        processed_post["x_status"] = "not_posted"
-        processed_post["ig_status"] = "not_posted"
-        processed_post["fb_status"] = "not_posted"
-        processed_post["is_thread"] = is_thread
-        processed_post["theme"] = self.get_theme(new_id)
-        processed_post["ai_content"] = True
-        processed_post["threads"] = self.get_generated_threads(is_thread, new_id, post_type)
-        processed_post["copied"] = False
-
-        return processed_post
+        return Post(
+            id=new_id,
+            post_type=post_type,
+            default_phrase=post["phrase"],
+            topic=post["topic"],
+            is_processed=False,
+            x_status="not_posted",
+            ig_status="not_posted",
+            fb_status="not_posted",
+            is_thread=is_thread,
+            theme=self.get_theme(new_id),
+            ai_content=True,
+            threads=self.get_generated_threads(is_thread, new_id, post_type),
+            copied=False,
+        )
 
     async def process_posts(self):
         current_id = await self.get_current_id()
@@ -167,135 +163,270 @@ class PostGeneratorService:
         await self.get_unprocessed_posts_from_json()
         await self.process_posts()
 
-    async def generate_threads_content(self, post_data, total_threads=0):
+    async def generate_threads_content(self, post_data, total_threads=0, with_media=True):
         """
         Generate threads content for a single post.
+        Each thread continues the previous one, so the phrases and contents are generated
+        in order. The media of a thread only needs its phrase: it is rendered and
+        uploaded in the background while the text of the next threads is generated.
         """
-        index = 0
-
-        if post_data["is_thread"]:
-            threads = post_data["threads"]
-            for thread in threads:
-                limit_default_phrase = os.getenv("DEFAULT_PHRASE_LIMIT", "250")
+        if not post_data.is_thread:
+            return post_data
+
+        media_tasks = []
+        last_post = post_data
+        try:
+            for thread in post_data.threads:
+                await self.run_limited(self.generate_thread_phrase(thread, last_post))
+
+                if with_media:
+                    media_tasks.append(asyncio.ensure_future(
+                        self.run_limited(self.generate_media_by_post_type(thread), self.media_semaphore)
+                    ))
+                await self.generate_data_post(thread, is_thread=True, last_content={
+                    "x_content": last_post.x_content,
+                    "meta_content": last_post.meta_content
+                }, total_threads=total_threads, with_media=False)
+                last_post = thread
+
+            await asyncio.gather(*media_tasks)
+        except BaseException:
+            for task in media_tasks:
+                task.cancel()
+            raise
 
-                prompt_default_phrase = f"Generate a phrase with the limit of {limit_default_phrase} characters and that this continues with the idea as thread"
-
-                if(index == 0):
-                    last_phrase = post_data["default_phrase"]
-                    last_content_x = post_data["x_content"]
-                    last_content_meta = post_data["meta_content"]
-                else:
-                    last_phrase = threads[index - 1]["default_phrase"]
-                    last_content_x = threads[index - 1]["x_content"]
-                    last_content_meta = threads[index - 1]["meta_content"]
-
-                if not thread.get("default_phrase"):
-                    thread["default_phrase"] = await self.openai_service.generate_default_phrase(last_phrase, limit_default_phrase, prompt_default_phrase)
+        return post_data
 
-                thread = await self.generate_data_post(thread, is_thread=True, last_content={
-                    "x_content": last_content_x,
-                    "meta_content": last_content_meta
-                }, total_threads=total_threads)
+    async def generate_thread_phrase(self, thread, last_post):
+        """The phrase of a thread continues the phrase of the post before it"""
+        if thread.default_phrase:
+            return thread
 
-        return post_data
+        limit_default_phrase = os.getenv("DEFAULT_PHRASE_LIMIT", "250")
+        prompt_default_phrase = f"Generate a phrase with the limit of {limit_default_phrase} characters and that this continues with the idea as thread"
+        thread.default_phrase = await self.openai_service.generate_default_phrase(
+            last_post.default_phrase, limit_default_phrase, prompt_default_phrase
+        )
+        return thread
 
-    async def generate_data_post(self, post_data, is_thread=False, last_content={}, total_threads=0):
+    async def generate_data_post(self, post_data, is_thread=False, last_content={}, total_threads=0, with_media=True):
         """
         Generate data for a single post.
         """
         if not is_thread:
-            total_threads = len(post_data["threads"])
+            total_threads = len(post_data.threads)
 
-        post_data = await self.generate_media_by_post_type(post_data)
+        # Every step fills fields of post_data in place. The media and the hashtags
+        # only need default_phrase, each content waits for the hashtags in its budget
+        # and the threads continue the contents of the post.
+        if POST_GENERATION_MODE == "bundled" and not is_thread:
+            return await self.generate_bundled_data_post(post_data, total_threads, with_media)
+
+        hashtags = {}
         if not is_thread:
-            post_data = await self.generate_post_hashtags(post_data, "x")
-            post_data = await self.generate_post_hashtags(post_data, "instagram")
-            post_data = await self.generate_post_hashtags(post_data, "facebook")
+            for social_media in ("x", "instagram", "facebook"):
+                hashtags[social_media] = asyncio.ensure_future(
+                    self.run_limited(self.generate_post_hashtags(post_data, social_media))
+                )
+
+        async def generate_content(content_type):
+            await asyncio.gather(*(hashtags[social_media] for social_media in CONTENT_HASHTAGS[content_type] if social_media in hashtags))
+            await self.run_limited(self.generate_post_content(post_data, content_type, is_thread, last_content, total_threads=total_threads))
+
+        contents = [
+            asyncio.ensure_future(generate_content("x_content")),
+            asyncio.ensure_future(generate_content("meta_content")),
+        ]
 
-        post_data = await self.generate_post_content(post_data, "x_content", is_thread, last_content, total_threads=total_threads)
-        post_data = await self.generate_post_content(post_data, "meta_content", is_thread, last_content, total_threads=total_threads)
+        media_step, threads_media = self.get_media_step(post_data, is_thread) if with_media else (None, False)
 
+        async def generate_threads():
+            await asyncio.gather(*contents)
+            await self.generate_threads_content(post_data, total_threads=total_threads, with_media=threads_media)
+
+        steps = [*hashtags.values(), *contents]
+        if media_step:
+            steps.append(media_step)
         if not is_thread:
-            post_data = await self.generate_threads_content(post_data, total_threads=total_threads)
+            steps.append(generate_threads())
+        await self.gather_steps(*steps)
 
         return post_data
 
+    async def generate_bundled_data_post(self, post_data, total_threads=0, with_media=True):
+        """
+        Same as generate_data_post for a parent post, with its contents and hashtags
+        generated by generate_post_bundle.
+        """
+        bundle = asyncio.ensure_future(self.run_limited(self.generate_post_bundle(post_data, total_threads)))
+        media_step, threads_media = self.get_media_step(post_data) if with_media else (None, False)
+
+        async def generate_threads():
+            await bundle
+            await self.generate_threads_content(post_data, total_threads=total_threads, with_media=threads_media)
+
+        steps = [bundle, generate_threads()]
+        if media_step:
+            steps.append(media_step)
+        await self.gather_steps(*steps)
+
+        return post_data
+
+    def get_media_step(self, post_data, is_thread=False):
+        """
+        Returns (media step of the post, whether the threads generate their own media).
+        When the phrases of all the threads are already known (batch generated posts,
+        regenerations) the post and its threads get their media in one step, with the
+        text images rendered together by render_many.
+        """
+        threads = post_data.threads if post_data.is_thread and not is_thread else []
+        if threads and all(thread.default_phrase for thread in threads):
+            return self.generate_media_for_posts([post_data, *threads]), False
+        return self.run_limited(self.generate_media_by_post_type(post_data), self.media_semaphore), True
+
+    async def run_limited(self, step, semaphore=None):
+        """Awaits the step once a slot of the semaphore (text steps by default) is free"""
+        async with semaphore or self.semaphore:
+            return await step
+
+    async def gather_steps(self, *steps):
+        """Runs the steps concurrently, cancelling the others when one fails"""
+        tasks = [asyncio.ensure_future(step) for step in steps]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
     async def process_existing_media(self, data):
-        full_path = self.file_handler.get_media_path(data["media_path"])
+        full_path = self.file_handler.get_media_path(data.media_path)
         if not self.file_handler.file_exists(full_path):
             print(f"File {full_path} does not exist.")
             return False  # archivo no existe, necesita regeneración
-        data["media_path"] = full_path
-        if not data.get("media_path_remote"):
-            remote_url = await self.upload_service.upload_file(data["media_path"])
-            data["media_path_remote"] = remote_url
+        data.media_path = full_path
+        if not data.media_path_remote:
+            data.media_path_remote = await self.upload_service.upload_file(data.media_path)
         return True
     
-    async def generate_media_by_metadata_to_media(self, data):
-        if data["metadata_to_media"].get("prompt_to_background") and not data["metadata_to_media"].get("background_path"):
+    async def generate_media_background(self, data):
+        """Background image of a metadata_to_media_with_background post, generated from its prompt"""
+        metadata = data.metadata_to_media
+        if metadata.prompt_to_background and not metadata.background_path:
             bg_file = await self.image_service_handler.generate_media_by_prompt(
-                data["metadata_to_media"]["prompt_to_background"], data["id"], "background.png", "background_path"
+                metadata.prompt_to_background, data.id, "background.png", "background_path"
             )
             if bg_file:
-                data["metadata_to_media"]["background_path"] = bg_file["full_path"]
+                metadata.background_path = bg_file["full_path"]
+        return data
 
-        img_file = await self.image_service_handler.generate_image(
-            data["metadata_to_media"], data["id"], data.get("theme", "light")
-        )
+    async def finish_media_by_metadata_to_media(self, data, img_file):
+        """Uploads the rendered image and removes the background it was rendered on"""
+        metadata = data.metadata_to_media
         if img_file:
-            data["media_path"] = img_file["full_path"]
-            if not data.get("media_path_remote"):
-                remote_url = await self.upload_service.upload_file(data["media_path"])
-                data["media_path_remote"] = remote_url
+            data.media_path = img_file["full_path"]
+            if not data.media_path_remote:
+                data.media_path_remote = await self.upload_service.upload_file(data.media_path)
 
-        if data["metadata_to_media"].get("background_path"):
-            await self.file_handler.delete_file(data["metadata_to_media"]["background_path"])
-            data["metadata_to_media"]["background_path"] = ""
+        if metadata.background_path:
+            await self.file_handler.delete_file(metadata.background_path)
+            metadata.background_path = ""
 
         return data
 
+    async def generate_media_by_metadata_to_media(self, data):
+        await self.generate_media_background(data)
+        img_file = await self.image_service_handler.generate_image(
+            data.metadata_to_media.to_dict(), data.id, data.theme or "light"
+        )
+        return await self.finish_media_by_metadata_to_media(data, img_file)
+
     async def generate_media_by_prompt_to_media(self, data):
-        file_data = await self.image_service_handler.generate_media_by_prompt(data["prompt_to_media"], data["id"])
+        file_data = await self.image_service_handler.generate_media_by_prompt(data.prompt_to_media, data.id)
 
         if file_data:
-            data["media_path"] = file_data["full_path"]
-            if not data.get("media_path_remote"):
-                remote_url = await self.upload_service.upload_file(data["media_path"])
-                data["media_path_remote"] = remote_url
+            data.media_path = file_data["full_path"]
+            if not data.media_path_remote:
+                data.media_path_remote = await self.upload_service.upload_file(data.media_path)
 
         return data
     
-    async def generate_media_by_post_type(self, post_data):
-        post_type = post_data["post_type"]
+    async def generate_media_prompts(self, post_data):
+        """Text inputs of the media: image prompt, rendered text and background prompt"""
+        post_type = post_data.post_type
+        metadata = post_data.metadata_to_media
 
-        regenerate = False
+        if post_type == "prompt_to_media" and not post_data.prompt_to_media:
+            post_data.prompt_to_media = await self.openai_service.generate_prompt_image_from_idea(post_data.default_phrase)
 
-        if post_type == "prompt_to_media" and not post_data["prompt_to_media"]:
-            post_data["prompt_to_media"] = await self.openai_service.generate_prompt_image_from_idea(post_data["default_phrase"])
+        if (post_type == "metadata_to_media" or post_type == "metadata_to_media_with_background") and not metadata.text:
+            metadata.text = post_data.default_phrase
 
-        if (post_type == "metadata_to_media" or post_type == "metadata_to_media_with_background") and not post_data["metadata_to_media"]["text"]:
-            post_data["metadata_to_media"]["text"] = post_data["default_phrase"]
+        if post_type == "metadata_to_media_with_background" and not metadata.prompt_to_background:
+           metadata.prompt_to_background = await self.openai_service.generate_prompt_image_from_idea(post_data.default_phrase)
 
-        if post_type == "metadata_to_media_with_background" and not post_data["metadata_to_media"]["prompt_to_background"]:
-           post_data["metadata_to_media"]["prompt_to_background"] = await self.openai_service.generate_prompt_image_from_idea(post_data["default_phrase"])
+        return post_data
 
-        if not post_data.get("media_path") and (post_data["metadata_to_media"].get("text") or post_data.get("prompt_to_media")):
-            print(f"Post {post_data['id']} has no media files")
+    async def needs_media(self, post_data):
+        """Generates the media prompts and returns whether the media has to be (re)generated"""
+        await self.generate_media_prompts(post_data)
+        metadata = post_data.metadata_to_media
+
+        regenerate = False
+
+        if not post_data.media_path and (metadata.text or post_data.prompt_to_media):
+            print(f"Post {post_data.id} has no media files")
             regenerate = True
 
-        if post_data.get("media_path"):
+        if post_data.media_path:
             regenerate = not await self.process_existing_media(post_data)
 
-        if regenerate:    
-            print(f"Regenerating media for post {post_data['id']}") 
-            post_data["media_path_remote"] = ""  
-            if post_data.get("metadata_to_media") and post_data["metadata_to_media"].get("text"): 
+        if regenerate:
+            print(f"Regenerating media for post {post_data.id}")
+            post_data.media_path_remote = ""
+
+        return regenerate
+
+    async def generate_media_by_post_type(self, post_data):
+        if await self.needs_media(post_data):
+            if post_data.metadata_to_media.text:
                 post_data = await self.generate_media_by_metadata_to_media(post_data)
-            elif post_data.get("prompt_to_media"):
+            elif post_data.prompt_to_media:
                 post_data = await self.generate_media_by_prompt_to_media(post_data)
 
         return post_data
-    
+
+    async def generate_media_for_posts(self, posts):
+        """
+        Same as generate_media_by_post_type for several posts, with all their text
+        images rendered at once (render_many spreads them over the render workers).
+        """
+        async def prepare(post_data):
+            async with self.media_semaphore:
+                if not await self.needs_media(post_data):
+                    return False
+                if post_data.metadata_to_media.text:
+                    await self.generate_media_background(post_data)
+                    return True
+                if post_data.prompt_to_media:
+                    await self.generate_media_by_prompt_to_media(post_data)
+                return False
+
+        renders = await self.gather_steps(*(prepare(post_data) for post_data in posts))
+        to_render = [post_data for post_data, render in zip(posts, renders) if render]
+        if not to_render:
+            return posts
+
+        img_files = await self.image_service_handler.generate_images([
+            (post_data.metadata_to_media.to_dict(), post_data.id, post_data.theme or "light")
+            for post_data in to_render
+        ])
+        await self.gather_steps(*(
+            self.run_limited(self.finish_media_by_metadata_to_media(post_data, img_file), self.media_semaphore)
+            for post_data, img_file in zip(to_render, img_files)
+        ))
+        return posts
+
     async def generate_post_hashtags(self, post_data, social_media):
         """
         Generate hashtags for a single post.
@@ -304,71 +435,150 @@ class PostGeneratorService:
         max_hasgtags = 8
 
         total_random_hashtags = random.randint(min_hashtags, max_hasgtags)
-        if not len(post_data[f"hashtags_{social_media}"]) > 0:
-            hashtags = await self.openai_service.generate_hashtags(post_data["default_phrase"], total_random_hashtags, model=MODEL_MINI, social_media=social_media)
-            post_data[f"hashtags_{social_media}"] = split_array(hashtags)
+        if not len(post_data.get_hashtags(social_media)) > 0:
+            hashtags = await self.openai_service.generate_hashtags(post_data.default_phrase, total_random_hashtags, model=MODEL_MINI, social_media=social_media)
+            post_data.set_hashtags(social_media, split_array(hashtags))
             
         return post_data
     
-    async def generate_post_content(self, post_data, content_type, is_thread=False, last_content={}, total_threads=0):
+    def get_content_limit(self, post_data, content_type, is_thread=False, total_threads=0):
         """
-        Generate content for a single post.
+        Characters left for content_type once the hashtags published with it are counted.
         """
-        post_type = post_data["post_type"]
-        x_hashtags_string = join_array(post_data["hashtags_x"])
-        instagram_hashtags_string = join_array(post_data["hashtags_instagram"])
-        facebook_hashtags_string = join_array(post_data["hashtags_facebook"])
-        
-        x_characters_hashtags = count_characters(x_hashtags_string) + 3
-        instagram_characters_hashtags = count_characters(instagram_hashtags_string)
-        facebook_characters_hashtags = count_characters(facebook_hashtags_string)
-        meta_characters_hashtags = (instagram_characters_hashtags + facebook_characters_hashtags) + 3
-
         x_content_limit = int(os.getenv("X_CONTENT_LIMIT", "288"))
         meta_content_limit = int(os.getenv("META_CONTENT_LIMIT", "1000"))
 
-        divider_content = total_threads + 1
-        print(f"total_threads {total_threads} post_data {post_data.get('id')} divider_content {divider_content}")
+        if content_type == "x_content":
+            x_characters_hashtags = 0 if is_thread else count_characters(join_array(post_data.hashtags_x)) + 3
+            return x_content_limit - x_characters_hashtags
 
-        if is_thread:
-            x_content_limit = x_content_limit
-            meta_content_limit = int(os.getenv("META_CONTENT_LIMIT", "1000")) / divider_content
-            x_characters_hashtags = 0
-            instagram_characters_hashtags = 0
-            facebook_characters_hashtags = 0
-        
-        message = f"continue with the reflection according to the idea and the idea must be in the in-depth content and respect the limit characters"
-
-        if post_type == "prompt_to_media":
-            if content_type == "x_content" and not post_data["x_content"]:
-                limit = str(x_content_limit - x_characters_hashtags)
-                print(f"Limit: {limit}")
-                last_content_x = last_content.get("x_content", post_data["default_phrase"])
-
-                print(f"Last content x: {last_content_x}")
+        instagram_characters_hashtags = count_characters(join_array(post_data.hashtags_instagram))
+        facebook_characters_hashtags = count_characters(join_array(post_data.hashtags_facebook))
+        meta_characters_hashtags = (instagram_characters_hashtags + facebook_characters_hashtags) + 3
 
-                post_data["x_content"] = await self.openai_service.generate_post_content(last_content_x, limit, message)
+        if is_thread:
+            meta_content_limit = meta_content_limit / (total_threads + 1)
+        if post_data.post_type != "prompt_to_media":
+            meta_content_limit = meta_content_limit / 2
+        return meta_content_limit - meta_characters_hashtags
+
+    def normalize_hashtags(self, hashtags):
+        if isinstance(hashtags, str):
+            hashtags = [hashtags]
+        tags = split_array(" ".join(tag for tag in hashtags if isinstance(tag, str)))
+        return [tag if tag.startswith("#") else f"#{tag}" for tag in tags]
+
+    def get_bundle_fields(self, post_data, pending, total_threads=0):
+        """
+        Specs of the pending fields for OpenaiServiceHandler.generate_post_fields.
+        Hashtags still pending are not in the limits yet, so room is kept for them.
+        """
+        fields = {}
+        for content_type in CONTENT_HASHTAGS:
+            if content_type not in pending:
+                continue
+            limit = self.get_content_limit(post_data, content_type, total_threads=total_threads)
+            for social_media in CONTENT_HASHTAGS[content_type]:
+                limit -= pending.get(f"hashtags_{social_media}", 0) * HASHTAG_RESERVED_CHARACTERS
+            fields[content_type] = {
+                "limit": max(int(limit), 1),
+                "instructions": self.get_content_message(post_data, total_threads),
+            }
+
+        for social_media in ("x", "instagram", "facebook"):
+            name = f"hashtags_{social_media}"
+            if name in pending:
+                fields[name] = {"hashtags": pending[name], "social_media": social_media}
+        return fields
+
+    def apply_bundle(self, post_data, values, fields, total_threads=0):
+        """
+        Sets the valid values of the bundle on post_data and returns the names of the
+        fields that are still missing or invalid.
+        """
+        for name in fields:
+            if name.startswith("hashtags_"):
+                hashtags = self.normalize_hashtags(values.get(name) or [])
+                if MIN_HASHTAGS <= len(hashtags) <= MAX_HASHTAGS:
+                    setattr(post_data, name, hashtags)
+
+        failed = [
+            name for name in fields
+            if name.startswith("hashtags_") and not getattr(post_data, name)
+        ]
+        for content_type in CONTENT_HASHTAGS:
+            if content_type not in fields:
+                continue
+            content = values.get(content_type)
+            limit = self.get_content_limit(post_data, content_type, total_threads=total_threads)
+            if isinstance(content, str) and content.strip() and count_characters(content) <= limit:
+                setattr(post_data, content_type, content.strip())
+            else:
+                failed.append(content_type)
+        return failed
+
+    async def generate_post_bundle(self, post_data, total_threads=0):
+        """
+        Generate the contents and hashtags of a parent post in one structured output call.
+        The answer is checked locally (characters left after the real hashtags, number
+        of hashtags) and only the fields that fail are requested again.
+        """
+        pending = {}
+        for social_media in ("x", "instagram", "facebook"):
+            if not post_data.get_hashtags(social_media):
+                pending[f"hashtags_{social_media}"] = random.randint(MIN_HASHTAGS, MAX_HASHTAGS)
+        for content_type in CONTENT_HASHTAGS:
+            if not getattr(post_data, content_type):
+                pending[content_type] = True
+        if not pending:
+            return post_data
+
+        model = None if post_data.post_type == "prompt_to_media" else MODEL_MINI
+        attempts = 0
+        while pending and attempts <= POST_BUNDLE_MAX_RETRIES:
+            fields = self.get_bundle_fields(post_data, pending, total_threads)
+            values = await self.openai_service.generate_post_fields(
+                post_data.default_phrase, fields, model=model, cache=attempts == 0
+            )
+            failed = self.apply_bundle(post_data, values, fields, total_threads)
+            pending = {name: pending[name] for name in failed}
+            attempts += 1
+            if pending:
+                print(f"[post_generator] Post {post_data.id} bundle attempt {attempts}: invalid {', '.join(pending)}")
+
+        if pending:
+            print(f"[post_generator] ⚠️ Post {post_data.id} left without {', '.join(pending)} after {attempts} attempts")
+        return post_data
 
-            elif content_type == "meta_content" and not post_data["meta_content"]:
-                limit = str(meta_content_limit - meta_characters_hashtags)
-                last_content_meta = last_content.get("meta_content", post_data["default_phrase"])
+    def get_content_message(self, post_data, total_threads=0):
+        if post_data.post_type != "prompt_to_media" and total_threads == 0:
+            return f"Generate an invitation to follow, you can include emojis, or phrases that motivate or invite the user to follow the page"
+        return f"continue with the reflection according to the idea and the idea must be in the in-depth content and respect the limit characters"
 
-                post_data["meta_content"] = await self.openai_service.generate_post_content(last_content_meta, limit, message)
+    async def generate_post_content(self, post_data, content_type, is_thread=False, last_content={}, total_threads=0):
+        """
+        Generate content for a single post.
+        """
+        post_type = post_data.post_type
 
-        elif post_type == "metadata_to_media" or post_type == "metadata_to_media_with_background":
+        divider_content = total_threads + 1
+        print(f"total_threads {total_threads} post_data {post_data.id} divider_content {divider_content}")
 
-            if total_threads == 0:
-                message = f"Generate an invitation to follow, you can include emojis, or phrases that motivate or invite the user to follow the page"
+        if getattr(post_data, content_type):
+            return post_data
 
-            if content_type == "x_content" and not post_data["x_content"]:
-                limit = str(x_content_limit - x_characters_hashtags)
+        message = self.get_content_message(post_data, total_threads)
+        limit = str(self.get_content_limit(post_data, content_type, is_thread, total_threads))
 
-                post_data["x_content"] = await self.openai_service.generate_post_content(post_data["default_phrase"], limit, message, model=MODEL_MINI)
+        if post_type == "prompt_to_media":
+            last_content_value = last_content.get(content_type, post_data.default_phrase)
+            print(f"Limit: {limit}")
+            print(f"Last content: {last_content_value}")
 
-            elif content_type == "meta_content" and not post_data["meta_content"]:
-                limit = str((meta_content_limit/2) - meta_characters_hashtags)
+            setattr(post_data, content_type, await self.openai_service.generate_post_content(last_content_value, limit, message))
 
-                post_data["meta_content"] = await self.openai_service.generate_post_content(post_data["default_phrase"], limit, message, model=MODEL_MINI)
+        elif post_type == "metadata_to_media" or post_type == "metadata_to_media_with_background":
+            setattr(post_data, content_type, await self.openai_service.generate_post_content(post_data.default_phrase, limit, message, model=MODEL_MINI))
 
         return post_data
 
@@ -377,20 +587,30 @@ class PostGeneratorService:
         Process a single post and return the processed data.
         """
         json_file = os.getenv("PROCESSED_POSTS_JSON_FILE")
-        post_data = await self.post_service.get_next_post("is_processed", False, json_file=json_file)
+        post_data = await self.post_service.get_next_post("is_processed", False, json_file=json_file, claim=True)
         if not post_data:
             return None
         
-        post_data = await self.generate_data_post(post_data)
-
-        if not post_data.get("media_path") and not post_data.get("media_path_remote"):
-            print("📷 Post has no media files, regenerating...")
-            post_data = await self.generate_data_post(post_data)
-
-        post_data["is_processed"] = True
-        await self.post_service.save_updated_post(post_data, json_file=json_file)
-        await self.post_service.save_updated_post(post_data)
-        print(f"✅ App: Post {post_data['id']} processed successfully.")
+        try:
+            with record_generation_stats() as stats:
+                post_data = await self.generate_data_post(post_data)
+
+                if not post_data.get_media_path():
+                    print("📷 Post has no media files, regenerating...")
+                    post_data = await self.generate_data_post(post_data)
+        except BaseException:
+            await self.post_service.release_post(post_data, status_key="is_processed", json_file=json_file)
+            raise
+
+        # Added to what earlier generations of the post recorded
+        post_data.generation_stats = merge_generation_stats(post_data.generation_stats, stats.data)
+        post_data.is_processed = True
+        # Saved as a whole below, which also drops the lease
+        post_data.drop_claim("is_processed")
+        async with self.post_service.transaction():
+            await self.post_service.save_updated_post(post_data, json_file=json_file)
+            await self.post_service.save_updated_post(post_data)
+        print(f"✅ App: Post {post_data.id} processed successfully.")
         return post_data
     
     def generate_thread_id(self, parent_id, index):
@@ -400,5 +620,5 @@ class PostGeneratorService:
     
     async def save_processed_posts_to_json(self):
         print("Saving processed posts to JSON file...")
-        await self.json_handler.save_json({"posts": self.processed_posts}, os.getenv("PROCESSED_POSTS_JSON_FILE"))
+        await self.post_service.save_posts(self.processed_posts, json_file=os.getenv("PROCESSED_POSTS_JSON_FILE"))
 
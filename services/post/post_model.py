@@ -0,0 +1,166 @@
+from dataclasses import dataclass, field, fields, MISSING
+
+PLATFORM_STATUS_KEYS = ["x_status", "ig_status", "fb_status"]
+
+# model class -> names of its post fields
+_field_names = {}
+# model class -> {field name: default value}
+_field_defaults = {}
+
+
+class PostModel:
+    """
+    Base of the slotted post models.
+    Keys the model does not know (claims, archived_at, old schemas...) are kept in
+    `extra` and the known keys missing from the source dict in `absent` (left out
+    of to_dict while they keep their default), so from_dict(data).to_dict() == data.
+    """
+
+    __slots__ = ()
+
+    # field name -> model class of the nested value
+    NESTED = {}
+
+    @classmethod
+    def get_field_names(cls):
+        if cls not in _field_names:
+            _field_names[cls] = tuple(f.name for f in fields(cls) if f.name not in ("extra", "absent"))
+        return _field_names[cls]
+
+    @classmethod
+    def get_default(cls, name):
+        if cls not in _field_defaults:
+            _field_defaults[cls] = {
+                f.name: f.default if f.default_factory is MISSING else f.default_factory()
+                for f in fields(cls)
+            }
+        return _field_defaults[cls][name]
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            return None
+        if isinstance(data, cls):
+            return data
+
+        values = {}
+        for name in cls.get_field_names():
+            if name in data:
+                values[name] = cls.load_value(name, data[name])
+        names = set(values)
+        return cls(
+            **values,
+            extra={key: value for key, value in data.items() if key not in names},
+            absent=tuple(name for name in cls.get_field_names() if name not in names),
+        )
+
+    @classmethod
+    def load_value(cls, name, value):
+        model = cls.NESTED.get(name)
+        if model is None:
+            return value
+        if isinstance(value, list):
+            return [model.from_dict(item) if isinstance(item, dict) else item for item in value]
+        if isinstance(value, dict):
+            return model.from_dict(value)
+        return value
+
+    def to_dict(self):
+        data = {}
+        for name in self.get_field_names():
+            value = getattr(self, name)
+            if name in self.absent and value == self.get_default(name):
+                continue
+            if isinstance(value, PostModel):
+                value = value.to_dict()
+            elif isinstance(value, list):
+                value = [item.to_dict() if isinstance(item, PostModel) else item for item in value]
+            data[name] = value
+        data.update(self.extra)
+        return data
+
+
+@dataclass(slots=True)
+class MediaMetadata(PostModel):
+    """Input of the text image rendered for metadata_to_media posts"""
+
+    background_path: str = ""
+    prompt_to_background: str = ""
+    text: str = ""
+    extra: dict = field(default_factory=dict, repr=False)
+    absent: tuple = field(default=(), repr=False)
+
+
+@dataclass(slots=True)
+class ThreadPost(PostModel):
+    """Content shared by posts and the threads hanging from them"""
+
+    NESTED = {"metadata_to_media": MediaMetadata}
+
+    id: int = 0
+    x_content: str = ""
+    meta_content: str = ""
+    prompt_to_media: str = ""
+    media_path: str = ""
+    media_path_remote: str = ""
+    default_phrase: str = ""
+    hashtags_x: list = field(default_factory=list)
+    hashtags_instagram: list = field(default_factory=list)
+    hashtags_facebook: list = field(default_factory=list)
+    metadata_to_media: MediaMetadata = field(default_factory=MediaMetadata)
+    x_links: list = field(default_factory=list)
+    ig_links: list = field(default_factory=list)
+    fb_links: list = field(default_factory=list)
+    theme: str = ""
+    post_type: str = ""
+    extra: dict = field(default_factory=dict, repr=False)
+    absent: tuple = field(default=(), repr=False)
+
+    def get_media_path(self):
+        """Remote url when uploaded, the local path otherwise"""
+        return self.media_path_remote or self.media_path
+
+    def get_hashtags(self, social_media):
+        return getattr(self, f"hashtags_{social_media}")
+
+    def set_hashtags(self, social_media, hashtags):
+        setattr(self, f"hashtags_{social_media}", hashtags)
+
+
+@dataclass(slots=True)
+class Post(ThreadPost):
+    """A post of the posts files, see PostGeneratorService.get_generated_post"""
+
+    NESTED = {"metadata_to_media": MediaMetadata, "threads": ThreadPost}
+
+    topic: str = ""
+    is_processed: bool = False
+    x_status: str = "not_posted"
+    ig_status: str = "not_posted"
+    fb_status: str = "not_posted"
+    is_thread: bool = False
+    ai_content: bool = False
+    threads: list = field(default_factory=list)
+    copied: bool = False
+    # OpenAI calls of the generation per method and model, see services/ai/openai_usage.py
+    generation_stats: dict = field(default_factory=dict)
+
+    def is_fully_posted(self):
+        return all(getattr(self, status_key) == "posted" for status_key in PLATFORM_STATUS_KEYS)
+
+    def get_claim_token(self, status_key):
+        """Token of the lease this post was claimed with for status_key, if any"""
+        return self.extra.get("claimed_by", {}).get(status_key)
+
+    def drop_claim(self, status_key):
+        """Forgets the lease for status_key, so saving the whole post drops it from the store"""
+        for key in ("claimed_by", "claimed_until"):
+            if status_key in self.extra.get(key, {}):
+                self.extra[key] = {k: v for k, v in self.extra[key].items() if k != status_key}
+
+
+def to_post_dict(post):
+    """Accepts a Post (or a raw dict) and returns the dict stored in the posts files"""
+    if isinstance(post, PostModel):
+        return post.to_dict()
+    return post
@@ -0,0 +1,128 @@
+import os
+import asyncio
+from utils.base_utils import get_path_from_base
+from utils.lock_utils import FileLock
+from services.post.post_service import PostService
+from services.post.post_generator_service import PostGeneratorService
+
+POST_PREGENERATION_ENABLED = os.getenv("POST_PREGENERATION_ENABLED", "false").lower() == "true"
+# Posts kept processed (media uploaded) ahead of the publish cursor of every platform
+POST_PREGENERATION_BUFFER = int(os.getenv("POST_PREGENERATION_BUFFER", "3"))
+# The buffer is checked after every publish and at least this often
+POST_PREGENERATION_INTERVAL_SECONDS = float(os.getenv("POST_PREGENERATION_INTERVAL_SECONDS", "900"))
+# Wait after a failed generation before trying again
+POST_PREGENERATION_RETRY_SECONDS = float(os.getenv("POST_PREGENERATION_RETRY_SECONDS", "60"))
+
+
+class PostPregenerationService:
+    """
+    Background worker keeping POST_PREGENERATION_BUFFER processed posts ready to
+    publish, so /run-posts only publishes. It refills after every publish (trigger)
+    and every POST_PREGENERATION_INTERVAL_SECONDS. One uvicorn worker refills at a
+    time (file lock), the others find the buffer full when they get the lock.
+    """
+
+    def __init__(self, buffer_size=POST_PREGENERATION_BUFFER, interval_seconds=POST_PREGENERATION_INTERVAL_SECONDS):
+        self.buffer_size = buffer_size
+        self.interval_seconds = interval_seconds
+        self.post_service = PostService()
+        self.generator = PostGeneratorService()
+        self.lock_path = get_path_from_base("json", "data", "pregeneration.lock")
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.refilling = False
+        self.last_error = None
+
+    async def get_ready_count(self):
+        """Runs covered by the buffer: posts ready on the platform with the fewest"""
+        return await self.post_service.count_ready_posts()
+
+    async def refill(self):
+        """Generates posts until the buffer is full or nothing is left to generate"""
+        generated = 0
+        async with FileLock(self.lock_path):
+            self.refilling = True
+            try:
+                while await self.get_ready_count() < self.buffer_size:
+                    post = await self.generator.generate_post()
+                    if not post:
+                        print("[post_pregeneration] No unprocessed posts left to generate.")
+                        break
+                    generated += 1
+            finally:
+                self.refilling = False
+        if generated:
+            print(f"✅ [post_pregeneration] {generated} posts generated ahead of publishing.")
+        return generated
+
+    async def generate_for_run(self):
+        """
+        Inline generation of /run-posts. With the worker on, only when nothing is ready
+        and under the refill lock: a run arriving during a refill waits for it instead
+        of generating alongside it.
+        """
+        if not POST_PREGENERATION_ENABLED:
+            return await self.generator.generate_post()
+        async with FileLock(self.lock_path):
+            if await self.get_ready_count():
+                return None
+            return await self.generator.generate_post()
+
+    def trigger(self):
+        """Asks the worker to check the buffer now (after a publish)"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            delay = self.interval_seconds
+            try:
+                await self.refill()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                delay = min(delay, POST_PREGENERATION_RETRY_SECONDS)
+                print(f"[post_pregeneration] Error generating posts: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if POST_PREGENERATION_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    async def get_stats(self):
+        return {
+            "enabled": POST_PREGENERATION_ENABLED,
+            "running": self.is_running(),
+            "refilling": self.refilling,
+            "buffer_size": self.buffer_size,
+            "ready": await self.get_ready_count(),
+            "last_error": self.last_error,
+        }
+
+
+_pregeneration = None
+
+def get_post_pregeneration():
+    """Returns the process-wide pre-generation worker"""
+    global _pregeneration
+    if _pregeneration is None:
+        _pregeneration = PostPregenerationService()
+    return _pregeneration
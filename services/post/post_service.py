@@ -4,54 +4,163 @@ from utils.json_utils import JSONHandler
 from utils.file_utils import FileHandler
 from services.image.image_service import ImageServiceHandler
 from services.files.remote_upload_service import RemoteUploadService
+from services.post.post_store import get_post_store
+from services.post.post_transaction import PostTransaction, get_current_transaction
+from services.post.post_archive_service import PostArchiveService
+from services.post.post_model import Post, PLATFORM_STATUS_KEYS, to_post_dict
+from services.post.post_cursor_service import get_post_cursor
+from utils.lock_utils import new_claim_token
+from services.ai.openai_usage import summarize_generation_stats
 
 POST_JSON_FILE = os.getenv("POSTS_JSON_FILE")
+POST_LEASE_SECONDS = int(os.getenv("POST_LEASE_SECONDS", "600"))
 
 class PostService:
-    def __init__(self):
+    def __init__(self, store=None):
         self.json_handler = JSONHandler()
         self.file_handler = FileHandler()
         self.image_service_handler = ImageServiceHandler()
         self.upload_service = RemoteUploadService()
+        self.store = store or get_post_store()
+        self.archive_service = PostArchiveService(self)
+        self.cursor = get_post_cursor(self.store, POST_JSON_FILE)
 
-    async def get_next_post(self, status_key="status", status_value="not_posted", extra_filters=None, json_file=POST_JSON_FILE):
-        data = await self.json_handler.load_json(json_file)
-        if not data:
-            return None
-
-        for post in data["posts"]:
-            if post[status_key] == status_value:
-                if extra_filters:
-                    if all(post.get(k) == v for k, v in extra_filters.items()):
-                        return post
-                else:
-                    return post
+    def transaction(self):
+        """
+        Unit of work: `async with post_service.transaction(): ...`
+        Status updates and saves made inside the block (by any PostService using the same
+        store) are buffered and written once per file when the block exits, or dropped
+        when it raises. Used for bulk generation writes, not for publish statuses.
+        """
+        return self.get_transaction() or PostTransaction(self.store)
+
+    def get_transaction(self):
+        transaction = get_current_transaction()
+        if transaction is not None and transaction.store is self.store:
+            return transaction
         return None
 
+    async def get_next_post(self, status_key="status", status_value="not_posted", extra_filters=None, json_file=POST_JSON_FILE, claim=False):
+        """
+        Returns the first Post matching the filters.
+        With claim=True the post is leased for status_key during POST_LEASE_SECONDS
+        to a token of its own (post.get_claim_token(status_key)), so other workers and
+        other tasks of this one looking for the same status skip it. Hand it back with
+        complete_post or release_post.
+        """
+        transaction = self.get_transaction()
+        claim_token = new_claim_token() if claim else None
+        if (json_file == POST_JSON_FILE and status_key in PLATFORM_STATUS_KEYS
+                and status_value == "not_posted" and extra_filters == {"is_processed": True}):
+            # Publishing lookup, answered by the per-platform cursor
+            return Post.from_dict(await self.cursor.get_next_post(status_key, transaction, claim_token, POST_LEASE_SECONDS))
+
+        if claim:
+            return await self.claim_next_post(status_key, status_value, extra_filters, json_file, claim_token)
+
+        if transaction:
+            return Post.from_dict(await transaction.get_next_post(status_key, status_value, extra_filters, json_file))
+        return Post.from_dict(await self.store.get_next_post(status_key, status_value, extra_filters, json_file))
+
+    async def claim_next_post(self, status_key, status_value, extra_filters, json_file, claim_token):
+        for post_id in await self.store.find_post_ids(status_key, status_value, extra_filters, json_file):
+            post = await self.store.claim_post(
+                post_id, status_key, status_value, extra_filters, json_file, claim_token, POST_LEASE_SECONDS
+            )
+            if post:
+                return Post.from_dict(post)
+        return None
+
+    async def get_post(self, post_id, json_file=POST_JSON_FILE, include_archived=True):
+        """Returns the post by id, looking it up in the posted shards once it left the hot file"""
+        transaction = self.get_transaction()
+        if transaction:
+            post = await transaction.get_post(post_id, json_file)
+        else:
+            post = await self.store.get_post(post_id, json_file)
+
+        if post is None and include_archived and json_file == POST_JSON_FILE:
+            post = await self.archive_service.get_archived_post(post_id)
+        return Post.from_dict(post)
+
+    async def count_ready_posts(self):
+        """Posts processed and waiting on every platform (the shortest publish queue)"""
+        await self.cursor.ensure_fresh()
+        return min(len(self.cursor.queues[status_key]) for status_key in PLATFORM_STATUS_KEYS)
+
+    async def get_generation_stats(self, json_file=POST_JSON_FILE):
+        """OpenAI usage of the generated posts of the file, see summarize_generation_stats"""
+        return summarize_generation_stats(post.generation_stats for post in await self.load_posts(json_file))
+
     async def update_post_status(self, post_id, status="posted", status_key = "status", json_file=POST_JSON_FILE):
-        data = await self.json_handler.load_json(json_file)
-        if not data:
+        transaction = self.get_transaction()
+        if transaction:
+            transaction.record_update(post_id, {status_key: status}, json_file)
             return
+        await self.store.update_post_fields(post_id, {status_key: status}, json_file)
 
-        for post in data["posts"]:
-            if post["id"] == post_id:
-                post[status_key] = status
-                break
+    async def complete_post(self, post, status="posted", status_key="status", json_file=POST_JSON_FILE):
+        """
+        Sets the status of a claimed post and drops its lease in one write. The status
+        is written even when the lease expired meanwhile (the work was done), but a
+        lease another claim took since then is kept.
+        Written to the store right away, also inside a transaction: a published post
+        must be recorded before anything else can fail.
+        """
+        transaction = self.get_transaction()
+        if transaction and post.id in transaction.changes.get(json_file, {}):
+            # Keeps a buffered write of the same post from setting the status back
+            transaction.record_update(post.id, {status_key: status}, json_file)
 
-        await self.json_handler.save_json(data, json_file)
+        claim_token = post.get_claim_token(status_key)
+        if not claim_token:
+            await self.store.update_post_fields(post.id, {status_key: status}, json_file)
+            return
+        if not await self.store.release_claim(post.id, status_key, claim_token, json_file, {status_key: status}):
+            print(f"⚠️ App: Lease of post {post.id} for {status_key} was lost before it was completed.")
+
+    async def release_post(self, post, status_key="status", json_file=POST_JSON_FILE):
+        """Drops the lease of a claimed post that was not completed, so it can be claimed again"""
+        claim_token = post.get_claim_token(status_key)
+        if claim_token:
+            await self.store.release_claim(post.id, status_key, claim_token, json_file)
 
     async def save_updated_post(self, post_data, json_file=POST_JSON_FILE):
         if not post_data:
             return
-        json_data = await self.json_handler.load_json(json_file)
-        if "posts" not in json_data:
-            json_data["posts"] = []
-        for i, existing_post in enumerate(json_data["posts"]):
-            if existing_post["id"] == post_data["id"]:
-                json_data["posts"][i] = post_data
-                break
+        post_data = to_post_dict(post_data)
+        transaction = self.get_transaction()
+        if transaction:
+            transaction.record_save(post_data, json_file)
+            return
+        await self.store.save_post(post_data, json_file)
+
+    async def delete_posts(self, post_ids, json_file=POST_JSON_FILE):
+        transaction = self.get_transaction()
+        if transaction:
+            for post_id in post_ids:
+                transaction.record_delete(post_id, json_file)
+            return
+        await self.store.delete_posts(post_ids, json_file)
+
+    async def archive_published_posts(self, json_file=POST_JSON_FILE):
+        """Moves the posts published on every platform to json/data/posted"""
+        return await self.archive_service.archive_published_posts(json_file)
+
+    async def load_posts(self, json_file=POST_JSON_FILE):
+        transaction = self.get_transaction()
+        if transaction:
+            data = await transaction.load_document(json_file)
         else:
-            json_data["posts"].append(post_data)
-        await self.json_handler.save_json(json_data, json_file)
+            data = await self.store.load_document(json_file)
+        if not data:
+            return []
+        return [Post.from_dict(post) for post in data.get("posts", [])]
 
-   
+    async def save_posts(self, posts, json_file=POST_JSON_FILE):
+        """Replaces every post of the file, keeping the rest of the document as it was"""
+        transaction = self.get_transaction()
+        if transaction:
+            # A full replacement supersedes whatever was buffered for the file
+            transaction.changes.pop(json_file, None)
+        await self.store.replace_posts([to_post_dict(post) for post in posts], json_file)
@@ -0,0 +1,886 @@
+import os
+import copy
+import asyncio
+import sqlite3
+import time
+import threading
+from contextlib import asynccontextmanager
+from utils.json_utils import JSONHandler, get_file_signature, json_serializer
+from utils.base_utils import get_path_from_base
+from utils.lock_utils import FileLock
+
+POST_STORE_BACKEND = os.getenv("POST_STORE_BACKEND", "sqlite").lower()
+POST_STORE_DB_FILE = os.getenv("POST_STORE_DB_FILE", "data/posts.db")
+POST_JOURNAL_COMPACT_BYTES = int(os.getenv("POST_JOURNAL_COMPACT_BYTES", str(256 * 1024)))
+# JSON documents from this size on are streamed from disk instead of kept in memory
+POST_STREAM_MIN_BYTES = int(os.getenv("POST_STREAM_MIN_BYTES", str(8 * 1024 * 1024)))
+# Versions of post changes the SQLite backend remembers, so cursors can catch up on them
+POST_CHANGE_LOG_SIZE = int(os.getenv("POST_CHANGE_LOG_SIZE", "10000"))
+
+# Post fields promoted to real columns so lookups on them hit an index
+INDEXED_FIELDS = ["is_processed", "x_status", "ig_status", "fb_status"]
+
+
+class PostStore:
+    """
+    Storage backend used by PostService.
+    Every document is addressed by the same json_file name used by the JSON files
+    (posts.json, processed/processed-posts.json, ...).
+    """
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Registers `async listener(json_file, changes, old_version, new_version)`, awaited
+        after every write. changes is None when the whole document was replaced.
+        """
+        self.listeners.append(listener)
+
+    async def notify(self, json_file, changes, old_version, new_version):
+        for listener in self.listeners:
+            await listener(json_file, changes, old_version, new_version)
+
+    async def get_version(self, json_file):
+        """Opaque value that changes whenever the document is written (by any process)"""
+        raise NotImplementedError
+
+    async def get_changed_post_ids(self, json_file, since_version):
+        """
+        Ids of the posts written after since_version (a value returned by get_version),
+        or None when they are not known anymore (e.g. the document was replaced since)
+        and the caller has to reload the whole document.
+        """
+        return None
+
+    async def ensure_document(self, json_file):
+        """Prepares the document for use (e.g. imports it), so it does not happen during a later call"""
+
+    async def load_document(self, json_file):
+        """Returns the whole document ({..., "posts": [...]}) or None if it does not exist"""
+        raise NotImplementedError
+
+    async def save_document(self, data, json_file):
+        """Replaces the whole document"""
+        raise NotImplementedError
+
+    async def replace_posts(self, posts, json_file):
+        """Replaces every post of the document in one atomic write, keeping the rest of it"""
+        raise NotImplementedError
+
+    async def get_next_post(self, status_key, status_value, extra_filters, json_file):
+        """Returns the first post (in document order) matching the status and the extra filters"""
+        raise NotImplementedError
+
+    async def get_post(self, post_id, json_file):
+        raise NotImplementedError
+
+    async def update_post_fields(self, post_id, fields, json_file):
+        """Sets the given fields on a single post"""
+        await self.apply_changes([{"op": "update", "id": post_id, "fields": fields}], json_file)
+
+    async def save_post(self, post_data, json_file):
+        """Replaces the post with the same id or appends it at the end"""
+        await self.apply_changes([{"op": "save", "post": post_data}], json_file)
+
+    async def delete_posts(self, post_ids, json_file):
+        await self.apply_changes([{"op": "delete", "id": post_id} for post_id in post_ids], json_file)
+
+    async def apply_changes(self, changes, json_file):
+        """Applies a batch of changes (see apply_change) with a single write"""
+        raise NotImplementedError
+
+    async def find_post_ids(self, status_key, status_value, extra_filters, json_file):
+        """Ids of every post matching the status and the extra filters, in document order"""
+        raise NotImplementedError
+
+    async def claim_post(self, post_id, status_key, status_value, extra_filters, json_file, claim_token, lease_seconds):
+        """
+        Atomically (across processes) leases the post for status_key to claim_token.
+        Returns the claimed post, or None when it no longer matches the filters or
+        another claim holds an unexpired lease on it.
+        """
+        raise NotImplementedError
+
+    async def release_claim(self, post_id, status_key, claim_token, json_file, fields=None):
+        """
+        Atomically applies fields (e.g. the new status) to the post and drops its lease
+        for status_key when claim_token still holds it. Returns whether it did: a lease
+        that expired and was taken by another claim is left alone.
+        """
+        raise NotImplementedError
+
+
+def apply_change(data, change):
+    """
+    Applies one change to a parsed document. Changes are the same dicts written to the
+    journal and passed to apply_changes:
+        {"op": "update", "id": post_id, "fields": {...}}
+        {"op": "save", "post": {...}}
+        {"op": "delete", "id": post_id}
+    """
+    posts = data.setdefault("posts", [])
+    if change["op"] == "update":
+        for post in posts:
+            if post["id"] == change["id"]:
+                post.update(change["fields"])
+                break
+    elif change["op"] == "save":
+        for i, existing_post in enumerate(posts):
+            if existing_post["id"] == change["post"]["id"]:
+                posts[i] = change["post"]
+                break
+        else:
+            posts.append(change["post"])
+    elif change["op"] == "delete":
+        data["posts"] = [post for post in posts if post["id"] != change["id"]]
+
+
+def dump_json_text(value):
+    return json_serializer.dumps(value).decode("utf-8")
+
+
+def is_claimable(post, status_key, claim_token, now=None):
+    """
+    Leases are kept per status key in post["claimed_by"] / post["claimed_until"].
+    Every claim has its own token (see new_claim_token), so a lease held by another
+    task of the same process excludes it too.
+    """
+    now = now or time.time()
+    claimed_by = post.get("claimed_by", {}).get(status_key)
+    claimed_until = post.get("claimed_until", {}).get(status_key, 0)
+    return not claimed_by or claimed_by == claim_token or claimed_until <= now
+
+
+def is_claimed_by(post, status_key, claim_token):
+    return bool(claim_token) and post.get("claimed_by", {}).get(status_key) == claim_token
+
+
+def get_claim_fields(post, status_key, claim_token, lease_seconds):
+    return {
+        "claimed_by": {**post.get("claimed_by", {}), status_key: claim_token},
+        "claimed_until": {**post.get("claimed_until", {}), status_key: time.time() + lease_seconds},
+    }
+
+
+def get_release_fields(post, status_key):
+    return {
+        "claimed_by": {k: v for k, v in post.get("claimed_by", {}).items() if k != status_key},
+        "claimed_until": {k: v for k, v in post.get("claimed_until", {}).items() if k != status_key},
+    }
+
+
+def matches_filters(post, status_key, status_value, extra_filters=None):
+    if post.get(status_key) != status_value:
+        return False
+    if extra_filters:
+        return all(post.get(k) == v for k, v in extra_filters.items())
+    return True
+
+
+class JSONPostStore(PostStore):
+    """
+    Keeps every document as a plain JSON file under json/ (the snapshot) plus an
+    append-only JSONL journal next to it (posts.json -> posts.journal.jsonl).
+    Field updates and single post saves are one fsynced journal line; the journal is
+    folded back into the snapshot in the background once it grows past
+    POST_JOURNAL_COMPACT_BYTES. Loading a document replays snapshot plus journal.
+    Snapshots of POST_STREAM_MIN_BYTES or more are not kept in memory: post lookups
+    stream them (see _iter_posts) and stop at the first match.
+    Posts handed out to callers are copies of the in-memory document.
+    """
+
+    def __init__(self, compact_bytes=POST_JOURNAL_COMPACT_BYTES, stream_min_bytes=POST_STREAM_MIN_BYTES):
+        super().__init__()
+        self.json_handler = JSONHandler()
+        self.compact_bytes = compact_bytes
+        self.stream_min_bytes = stream_min_bytes
+        # json_file -> {"snapshot": (mtime_ns, size), "journal_size": int, "data": dict}
+        self._documents = {}
+        self._locks = {}
+        self._compactions = {}
+
+    def get_journal_path(self, json_file):
+        return get_path_from_base("json", os.path.splitext(json_file)[0] + ".journal.jsonl")
+
+    def _get_version(self, json_file):
+        snapshot = get_file_signature(get_path_from_base("json", json_file))
+        journal = get_file_signature(self.get_journal_path(json_file))
+        return f"{snapshot}:{journal[1] if journal else 0}"
+
+    async def get_version(self, json_file):
+        return self._get_version(json_file)
+
+    async def get_changed_post_ids(self, json_file, since_version):
+        if since_version is None:
+            return None
+        snapshot, _, offset = since_version.rpartition(":")
+        version_snapshot, _, journal_size = self._get_version(json_file).rpartition(":")
+        if snapshot != version_snapshot or int(journal_size) < int(offset):
+            # The snapshot was rewritten (compaction or replace), the journal is gone
+            return None
+
+        entries, _ = await asyncio.to_thread(self._read_journal, self.get_journal_path(json_file), int(offset))
+        return {entry["post"]["id"] if entry["op"] == "save" else entry["id"] for entry in entries}
+
+    def _is_streamed(self, json_file):
+        snapshot = get_file_signature(get_path_from_base("json", json_file))
+        return snapshot is not None and snapshot[1] >= self.stream_min_bytes
+
+    @asynccontextmanager
+    async def _locked(self, json_file):
+        """In-process lock plus the advisory file lock shared with the other workers"""
+        if json_file not in self._locks:
+            self._locks[json_file] = asyncio.Lock()
+        async with self._locks[json_file]:
+            async with FileLock(get_path_from_base("json", json_file) + ".lock"):
+                yield
+
+    @staticmethod
+    def _read_journal(journal_path, offset=0):
+        """Returns the entries written after offset and the offset of the last complete line"""
+        entries = []
+        if not os.path.exists(journal_path):
+            return entries, 0
+
+        with open(journal_path, "rb") as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # Partial line from an interrupted append, ignored until completed
+                    break
+                offset += len(line)
+                if line.strip():
+                    entries.append(json_serializer.loads(line))
+        return entries, offset
+
+    @staticmethod
+    def _append_journal(journal_path, entries):
+        lines = b"".join(json_serializer.dumps(entry) + b"\n" for entry in entries)
+        with open(journal_path, "ab") as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+    async def _load(self, json_file):
+        """
+        Returns the in-memory document (snapshot plus journal), or None.
+        The document is shared with later calls unless the snapshot is streamed.
+        """
+        json_path = get_path_from_base("json", json_file)
+        journal_path = self.get_journal_path(json_file)
+        snapshot = get_file_signature(json_path)
+        journal_size = get_file_signature(journal_path)
+        journal_size = journal_size[1] if journal_size else 0
+
+        state = self._documents.get(json_file)
+        if state and state["snapshot"] == snapshot and state["journal_size"] <= journal_size:
+            if state["journal_size"] < journal_size:
+                # Another writer appended to the journal, replay only the new lines
+                entries, offset = await asyncio.to_thread(self._read_journal, journal_path, state["journal_size"])
+                for entry in entries:
+                    apply_change(state["data"], entry)
+                state["journal_size"] = offset
+            return state["data"]
+
+        data = await self.json_handler.load_json(json_file)
+        entries, offset = await asyncio.to_thread(self._read_journal, journal_path)
+        if data is None and not entries:
+            self._documents.pop(json_file, None)
+            return None
+
+        # load_json returns a fresh parse, the journal can be applied to it in place
+        data = data or {"posts": []}
+        for entry in entries:
+            apply_change(data, entry)
+        if self._is_streamed(json_file):
+            self._documents.pop(json_file, None)
+        else:
+            self._documents[json_file] = {"snapshot": snapshot, "journal_size": offset, "data": data}
+        return data
+
+    async def _iter_posts(self, json_file):
+        """
+        Yields the current posts of the document. Streamed snapshots are read post by
+        post with the journal replayed on the fly, so nothing past the post the caller
+        stops at is read.
+        """
+        if not self._is_streamed(json_file):
+            data = await self._load(json_file)
+            for post in (data or {}).get("posts", []):
+                yield post
+            return
+
+        entries, _ = await asyncio.to_thread(self._read_journal, self.get_journal_path(json_file))
+        # Entries of a post up to its first delete are applied in place; apply_change
+        # appends a post saved again after a delete at the end of the document
+        in_place = {}
+        tail = set()
+        deleted = set()
+        for index, entry in enumerate(entries):
+            post_id = entry["post"]["id"] if entry["op"] == "save" else entry["id"]
+            if post_id in deleted:
+                tail.add(index)
+                continue
+            in_place.setdefault(post_id, []).append(entry)
+            if entry["op"] == "delete":
+                deleted.add(post_id)
+
+        seen = set()
+        async for post in self.json_handler.iter_posts(json_file):
+            seen.add(post["id"])
+            for entry in in_place.get(post["id"], []):
+                if entry["op"] == "update":
+                    post = {**post, **entry["fields"]}
+                elif entry["op"] == "save":
+                    post = entry["post"]
+                else:
+                    post = None
+                    break
+            if post is not None:
+                yield post
+
+        # Posts created through the journal
+        data = {"posts": []}
+        for index, entry in enumerate(entries):
+            post_id = entry["post"]["id"] if entry["op"] == "save" else entry["id"]
+            if index in tail or post_id not in seen:
+                apply_change(data, entry)
+        for post in data["posts"]:
+            yield post
+
+    async def _append(self, json_file, entries):
+        """
+        Appends the entries to the journal, returns (old_version, new_version).
+        Must be called holding _locked(json_file).
+        """
+        # Streamed documents are not in memory, the journal is replayed when read
+        streamed = self._is_streamed(json_file)
+        data = None if streamed else await self._load(json_file)
+        if data is None and not streamed:
+            entries = [entry for entry in entries if entry["op"] == "save"]
+        if not entries:
+            return None
+
+        old_version = self._get_version(json_file)
+        journal_path = self.get_journal_path(json_file)
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        await asyncio.to_thread(self._append_journal, journal_path, entries)
+
+        journal_size = get_file_signature(journal_path)[1]
+        if data is not None:
+            for entry in entries:
+                apply_change(data, entry)
+            self._documents[json_file]["journal_size"] = journal_size
+
+        if journal_size >= self.compact_bytes:
+            self._schedule_compaction(json_file)
+        return old_version, self._get_version(json_file)
+
+    def _schedule_compaction(self, json_file):
+        task = self._compactions.get(json_file)
+        if task and not task.done():
+            return
+        self._compactions[json_file] = asyncio.create_task(self.compact(json_file))
+
+    async def compact(self, json_file):
+        """Folds the journal into the snapshot and empties the journal"""
+        async with self._locked(json_file):
+            data = await self._load(json_file)
+            if data is None:
+                return
+            old_version = self._get_version(json_file)
+            await self._write_snapshot(data, json_file)
+            new_version = self._get_version(json_file)
+            print(f"[post_store] Compacted journal of {json_file}")
+        # Same content, only the version moved
+        await self.notify(json_file, [], old_version, new_version)
+
+    async def _write_snapshot(self, data, json_file):
+        await self.json_handler.save_json(copy.deepcopy(data), json_file)
+        journal_path = self.get_journal_path(json_file)
+        if os.path.exists(journal_path):
+            os.truncate(journal_path, 0)
+        if self._is_streamed(json_file):
+            self._documents.pop(json_file, None)
+            return
+        self._documents[json_file] = {
+            "snapshot": get_file_signature(get_path_from_base("json", json_file)),
+            "journal_size": 0,
+            "data": data,
+        }
+
+    async def load_document(self, json_file):
+        return copy.deepcopy(await self._load(json_file))
+
+    async def save_document(self, data, json_file):
+        async with self._locked(json_file):
+            old_version = self._get_version(json_file)
+            await self._write_snapshot(copy.deepcopy(data), json_file)
+            new_version = self._get_version(json_file)
+        await self.notify(json_file, None, old_version, new_version)
+
+    async def replace_posts(self, posts, json_file):
+        async with self._locked(json_file):
+            # Read under the lock, so no write of another worker lands in between
+            data = await self._load(json_file) or {}
+            data = {**copy.deepcopy({key: value for key, value in data.items() if key != "posts"}), "posts": copy.deepcopy(posts)}
+            old_version = self._get_version(json_file)
+            await self._write_snapshot(data, json_file)
+            new_version = self._get_version(json_file)
+        await self.notify(json_file, None, old_version, new_version)
+
+    async def get_next_post(self, status_key, status_value, extra_filters, json_file):
+        async for post in self._iter_posts(json_file):
+            if matches_filters(post, status_key, status_value, extra_filters):
+                return copy.deepcopy(post)
+        return None
+
+    async def get_post(self, post_id, json_file):
+        async for post in self._iter_posts(json_file):
+            if post["id"] == post_id:
+                return copy.deepcopy(post)
+        return None
+
+    async def apply_changes(self, changes, json_file):
+        async with self._locked(json_file):
+            versions = await self._append(json_file, copy.deepcopy(changes))
+        if versions:
+            await self.notify(json_file, changes, *versions)
+
+    async def find_post_ids(self, status_key, status_value, extra_filters, json_file):
+        return [
+            post["id"] async for post in self._iter_posts(json_file)
+            if matches_filters(post, status_key, status_value, extra_filters)
+        ]
+
+    async def claim_post(self, post_id, status_key, status_value, extra_filters, json_file, claim_token, lease_seconds):
+        async with self._locked(json_file):
+            post = await self.get_post(post_id, json_file)
+            if (post is None or not matches_filters(post, status_key, status_value, extra_filters)
+                    or not is_claimable(post, status_key, claim_token)):
+                return None
+
+            changes = [{"op": "update", "id": post_id, "fields": get_claim_fields(post, status_key, claim_token, lease_seconds)}]
+            versions = await self._append(json_file, copy.deepcopy(changes))
+            post.update(copy.deepcopy(changes[0]["fields"]))
+
+        await self.notify(json_file, changes, *versions)
+        return post
+
+    async def release_claim(self, post_id, status_key, claim_token, json_file, fields=None):
+        async with self._locked(json_file):
+            post = await self.get_post(post_id, json_file)
+            if post is None:
+                return False
+            released = is_claimed_by(post, status_key, claim_token)
+            fields = {**(fields or {}), **(get_release_fields(post, status_key) if released else {})}
+            if not fields:
+                return False
+
+            changes = [{"op": "update", "id": post_id, "fields": fields}]
+            versions = await self._append(json_file, copy.deepcopy(changes))
+
+        await self.notify(json_file, changes, *versions)
+        return released
+
+
+class SQLitePostStore(PostStore):
+    """
+    Keeps every document as rows of a single SQLite database.
+    The post itself is stored as JSON in `data`; the fields used to pick the next
+    post are copied to indexed columns, so lookups and status updates touch one row.
+    Documents that are not in the database yet are imported from their JSON file
+    the first time they are used.
+    """
+
+    def __init__(self, db_file=POST_STORE_DB_FILE, change_log_size=POST_CHANGE_LOG_SIZE):
+        super().__init__()
+        self.db_path = get_path_from_base("json", db_file)
+        self.change_log_size = change_log_size
+        self.json_handler = JSONHandler()
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema(connection)
+            self._connection = connection
+        return self._connection
+
+    def _create_schema(self, connection):
+        columns = ", ".join(INDEXED_FIELDS)
+        connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS documents (
+                json_file TEXT PRIMARY KEY,
+                meta TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                replaced_version INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS posts (
+                json_file TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                {columns},
+                data TEXT NOT NULL,
+                PRIMARY KEY (json_file, id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_posts_id ON posts (id);
+            CREATE INDEX IF NOT EXISTS idx_posts_position ON posts (json_file, position);
+            CREATE TABLE IF NOT EXISTS post_changes (
+                json_file TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                post_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_post_changes_version ON post_changes (json_file, version);
+        """)
+        for field in INDEXED_FIELDS:
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_posts_{field} ON posts (json_file, {field}, position)"
+            )
+
+        document_columns = [row[1] for row in connection.execute("PRAGMA table_info(documents)")]
+        if "version" not in document_columns:
+            connection.execute("ALTER TABLE documents ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        if "replaced_version" not in document_columns:
+            # No change was logged before this column, so nothing is known before the current version
+            connection.execute("ALTER TABLE documents ADD COLUMN replaced_version INTEGER NOT NULL DEFAULT 0")
+            connection.execute("UPDATE documents SET replaced_version = version")
+
+    async def _run(self, func, *args):
+        def call():
+            with self._lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(call)
+
+    async def _ensure_document(self, json_file):
+        exists = await self._run(self._document_exists, json_file)
+        if exists:
+            return True
+
+        # Only one worker imports the file, the others find it imported once they get the lock
+        async with FileLock(self.db_path + ".lock"):
+            if await self._run(self._document_exists, json_file):
+                return True
+
+            data = await self.json_handler.load_json(json_file)
+            if data is None:
+                return False
+
+            print(f"[post_store] Importing {json_file} into {self.db_path}")
+            await self.import_document(data, json_file)
+        return True
+
+    async def ensure_document(self, json_file):
+        await self._ensure_document(json_file)
+
+    async def has_document(self, json_file):
+        """Whether the file was imported into the database already"""
+        return await self._run(self._document_exists, json_file)
+
+    async def import_document(self, data, json_file):
+        """Loads a parsed JSON document into the database, replacing any previous copy"""
+        versions = await self._run(self._replace_document, data, json_file)
+        await self.notify(json_file, None, *versions)
+
+    async def get_version(self, json_file):
+        return await self._run(self._get_version, json_file)
+
+    async def get_changed_post_ids(self, json_file, since_version):
+        if since_version is None:
+            return None
+        return await self._run(self._get_changed_post_ids, json_file, since_version)
+
+    # --- sync helpers, always called through _run ---
+
+    @staticmethod
+    def _column_value(value):
+        if isinstance(value, (dict, list)):
+            return dump_json_text(value)
+        return value
+
+    def _row_values(self, post):
+        return [self._column_value(post.get(field)) for field in INDEXED_FIELDS]
+
+    def _get_version(self, connection, json_file):
+        row = connection.execute("SELECT version FROM documents WHERE json_file = ?", (json_file,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self, connection, json_file):
+        """Increments the document version inside the current transaction, returns (old, new)"""
+        old_version = self._get_version(connection, json_file)
+        connection.execute(
+            "INSERT INTO documents (json_file, meta, version) VALUES (?, '{}', ?) "
+            "ON CONFLICT (json_file) DO UPDATE SET version = excluded.version",
+            (json_file, old_version + 1)
+        )
+        return old_version, old_version + 1
+
+    def _log_changes(self, connection, json_file, version, post_ids):
+        """Records the posts written by a version, dropping the entries past change_log_size versions"""
+        connection.executemany(
+            "INSERT INTO post_changes (json_file, version, post_id) VALUES (?, ?, ?)",
+            [(json_file, version, post_id) for post_id in set(post_ids)]
+        )
+        connection.execute(
+            "DELETE FROM post_changes WHERE json_file = ? AND version <= ?",
+            (json_file, version - self.change_log_size)
+        )
+
+    def _get_changed_post_ids(self, connection, json_file, since_version):
+        row = connection.execute(
+            "SELECT version, replaced_version FROM documents WHERE json_file = ?", (json_file,)
+        ).fetchone()
+        if row is None:
+            return None
+        version, replaced_version = row
+        if since_version < replaced_version or since_version < version - self.change_log_size or since_version > version:
+            return None
+        return {
+            post_id for (post_id,) in connection.execute(
+                "SELECT post_id FROM post_changes WHERE json_file = ? AND version > ?", (json_file, since_version)
+            )
+        }
+
+    def _document_exists(self, connection, json_file):
+        row = connection.execute("SELECT 1 FROM documents WHERE json_file = ?", (json_file,)).fetchone()
+        return row is not None
+
+    def _replace_document(self, connection, data, json_file, keep_meta=False):
+        """Replaces the posts (and, unless keep_meta, the rest of the document) in one transaction"""
+        meta = {key: value for key, value in data.items() if key != "posts"}
+        placeholders = ", ".join("?" for _ in INDEXED_FIELDS)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            versions = self._bump_version(connection, json_file)
+            connection.execute(
+                "UPDATE documents SET replaced_version = ? WHERE json_file = ?", (versions[1], json_file)
+            )
+            connection.execute("DELETE FROM post_changes WHERE json_file = ?", (json_file,))
+            if not keep_meta:
+                connection.execute(
+                    "UPDATE documents SET meta = ? WHERE json_file = ?",
+                    (dump_json_text(meta), json_file)
+                )
+            connection.execute("DELETE FROM posts WHERE json_file = ?", (json_file,))
+            connection.executemany(
+                f"INSERT OR REPLACE INTO posts (json_file, id, position, {', '.join(INDEXED_FIELDS)}, data) "
+                f"VALUES (?, ?, ?, {placeholders}, ?)",
+                [
+                    (json_file, post["id"], position, *self._row_values(post), dump_json_text(post))
+                    for position, post in enumerate(data.get("posts", []))
+                ]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return versions
+
+    def _load_document(self, connection, json_file):
+        row = connection.execute("SELECT meta FROM documents WHERE json_file = ?", (json_file,)).fetchone()
+        if row is None:
+            return None
+        data = json_serializer.loads(row[0])
+        rows = connection.execute(
+            "SELECT data FROM posts WHERE json_file = ? ORDER BY position", (json_file,)
+        ).fetchall()
+        data["posts"] = [json_serializer.loads(post_row[0]) for post_row in rows]
+        return data
+
+    def _build_where(self, status_key, status_value, extra_filters, json_file):
+        where = ["json_file = ?"]
+        params = [json_file]
+        for key, value in [(status_key, status_value), *(extra_filters or {}).items()]:
+            if key in INDEXED_FIELDS:
+                where.append(f"{key} IS ?")
+                params.append(self._column_value(value))
+        return where, params
+
+    def _get_next_post(self, connection, status_key, status_value, extra_filters, json_file):
+        where, params = self._build_where(status_key, status_value, extra_filters, json_file)
+        cursor = connection.execute(
+            f"SELECT data FROM posts WHERE {' AND '.join(where)} ORDER BY position", params
+        )
+        for (raw,) in cursor:
+            post = json_serializer.loads(raw)
+            if matches_filters(post, status_key, status_value, extra_filters):
+                return post
+        return None
+
+    def _get_post(self, connection, post_id, json_file):
+        row = connection.execute(
+            "SELECT data FROM posts WHERE json_file = ? AND id = ?", (json_file, post_id)
+        ).fetchone()
+        return json_serializer.loads(row[0]) if row else None
+
+    def _write_post(self, connection, post, json_file):
+        assignments = ", ".join(f"{field} = ?" for field in INDEXED_FIELDS)
+        updated = connection.execute(
+            f"UPDATE posts SET {assignments}, data = ? WHERE json_file = ? AND id = ?",
+            (*self._row_values(post), dump_json_text(post), json_file, post["id"])
+        ).rowcount
+        if updated:
+            return
+
+        position = connection.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM posts WHERE json_file = ?", (json_file,)
+        ).fetchone()[0]
+        placeholders = ", ".join("?" for _ in INDEXED_FIELDS)
+        connection.execute(
+            f"INSERT INTO posts (json_file, id, position, {', '.join(INDEXED_FIELDS)}, data) "
+            f"VALUES (?, ?, ?, {placeholders}, ?)",
+            (json_file, post["id"], position, *self._row_values(post), dump_json_text(post))
+        )
+
+    def _apply_changes(self, connection, changes, json_file):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            versions = self._bump_version(connection, json_file)
+            for change in changes:
+                if change["op"] == "update":
+                    post = self._get_post(connection, change["id"], json_file)
+                    if post is not None:
+                        post.update(change["fields"])
+                        self._write_post(connection, post, json_file)
+                elif change["op"] == "save":
+                    self._write_post(connection, change["post"], json_file)
+                elif change["op"] == "delete":
+                    connection.execute(
+                        "DELETE FROM posts WHERE json_file = ? AND id = ?", (json_file, change["id"])
+                    )
+            self._log_changes(connection, json_file, versions[1], [
+                change["post"]["id"] if change["op"] == "save" else change["id"] for change in changes
+            ])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return versions
+
+    def _find_post_ids(self, connection, status_key, status_value, extra_filters, json_file):
+        where, params = self._build_where(status_key, status_value, extra_filters, json_file)
+        cursor = connection.execute(
+            f"SELECT data FROM posts WHERE {' AND '.join(where)} ORDER BY position", params
+        )
+        ids = []
+        for (raw,) in cursor:
+            post = json_serializer.loads(raw)
+            if matches_filters(post, status_key, status_value, extra_filters):
+                ids.append(post["id"])
+        return ids
+
+    def _claim_post(self, connection, post_id, status_key, status_value, extra_filters, json_file, claim_token, lease_seconds):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            post = self._get_post(connection, post_id, json_file)
+            if (post is None or not matches_filters(post, status_key, status_value, extra_filters)
+                    or not is_claimable(post, status_key, claim_token)):
+                connection.execute("ROLLBACK")
+                return None, None, None
+
+            versions = self._bump_version(connection, json_file)
+            fields = get_claim_fields(post, status_key, claim_token, lease_seconds)
+            post.update(fields)
+            self._write_post(connection, post, json_file)
+            self._log_changes(connection, json_file, versions[1], [post_id])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return post, fields, versions
+
+    def _release_claim(self, connection, post_id, status_key, claim_token, json_file, fields):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            post = self._get_post(connection, post_id, json_file)
+            released = post is not None and is_claimed_by(post, status_key, claim_token)
+            fields = {**(fields or {}), **(get_release_fields(post, status_key) if released else {})}
+            if post is None or not fields:
+                connection.execute("ROLLBACK")
+                return False, None, None
+
+            versions = self._bump_version(connection, json_file)
+            post.update(fields)
+            self._write_post(connection, post, json_file)
+            self._log_changes(connection, json_file, versions[1], [post_id])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return released, fields, versions
+
+    # --- PostStore API ---
+
+    async def load_document(self, json_file):
+        if not await self._ensure_document(json_file):
+            return None
+        return await self._run(self._load_document, json_file)
+
+    async def save_document(self, data, json_file):
+        await self.import_document(data, json_file)
+
+    async def replace_posts(self, posts, json_file):
+        await self._ensure_document(json_file)
+        versions = await self._run(self._replace_document, {"posts": posts}, json_file, True)
+        await self.notify(json_file, None, *versions)
+
+    async def get_next_post(self, status_key, status_value, extra_filters, json_file):
+        if not await self._ensure_document(json_file):
+            return None
+        return await self._run(self._get_next_post, status_key, status_value, extra_filters, json_file)
+
+    async def get_post(self, post_id, json_file):
+        if not await self._ensure_document(json_file):
+            return None
+        return await self._run(self._get_post, post_id, json_file)
+
+    async def apply_changes(self, changes, json_file):
+        await self._ensure_document(json_file)
+        versions = await self._run(self._apply_changes, changes, json_file)
+        await self.notify(json_file, changes, *versions)
+
+    async def find_post_ids(self, status_key, status_value, extra_filters, json_file):
+        if not await self._ensure_document(json_file):
+            return []
+        return await self._run(self._find_post_ids, status_key, status_value, extra_filters, json_file)
+
+    async def claim_post(self, post_id, status_key, status_value, extra_filters, json_file, claim_token, lease_seconds):
+        if not await self._ensure_document(json_file):
+            return None
+        post, fields, versions = await self._run(
+            self._claim_post, post_id, status_key, status_value, extra_filters, json_file, claim_token, lease_seconds
+        )
+        if post is not None:
+            await self.notify(json_file, [{"op": "update", "id": post_id, "fields": fields}], *versions)
+        return post
+
+    async def release_claim(self, post_id, status_key, claim_token, json_file, fields=None):
+        if not await self._ensure_document(json_file):
+            return False
+        released, fields, versions = await self._run(
+            self._release_claim, post_id, status_key, claim_token, json_file, fields
+        )
+        if fields is not None:
+            await self.notify(json_file, [{"op": "update", "id": post_id, "fields": fields}], *versions)
+        return released
+
+
+_stores = {}
+
+def get_post_store(backend=None):
+    """Returns the process-wide store for the configured backend (POST_STORE_BACKEND)"""
+    backend = (backend or POST_STORE_BACKEND).lower()
+    if backend not in _stores:
+        if backend == "sqlite":
+            _stores[backend] = SQLitePostStore()
+        elif backend == "json":
+            _stores[backend] = JSONPostStore()
+        else:
+            raise ValueError(f"Unsupported post store backend: {backend}")
+    return _stores[backend]
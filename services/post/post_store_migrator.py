@@ -0,0 +1,59 @@
+"""
+One-shot import of the JSON post files into the SQLite post store.
+Once imported the database is the copy that is written, the JSON files are not
+updated anymore, so files already in the database are skipped unless forced.
+
+Usage:
+    python -m services.post.post_store_migrator [--force]
+"""
+import os
+import asyncio
+import argparse
+from dotenv import load_dotenv
+from utils.json_utils import JSONHandler
+from services.post.post_store import SQLitePostStore
+
+load_dotenv()
+
+
+def get_post_json_files():
+    return [
+        json_file for json_file in [
+            os.getenv("POSTS_JSON_FILE"),
+            os.getenv("PROCESSED_POSTS_JSON_FILE"),
+        ] if json_file
+    ]
+
+
+async def migrate_json_to_sqlite(json_files=None, store=None, force=False):
+    """
+    Imports every JSON file into the SQLite store. A file already in the store is
+    skipped, its JSON is older than the database, unless force replaces it.
+    """
+    json_handler = JSONHandler()
+    store = store or SQLitePostStore()
+    migrated = {}
+
+    for json_file in json_files or get_post_json_files():
+        if not force and await store.has_document(json_file):
+            print(f"[post_store_migrator] {json_file} is already in {store.db_path}, skipping "
+                  f"(the JSON file is not updated since, --force replaces the database copy with it).")
+            continue
+
+        data = await json_handler.load_json(json_file)
+        if data is None:
+            print(f"[post_store_migrator] {json_file} not found, skipping.")
+            continue
+
+        await store.import_document(data, json_file)
+        migrated[json_file] = len(data.get("posts", []))
+        print(f"✅ [post_store_migrator] Imported {migrated[json_file]} posts from {json_file}")
+
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports the JSON post files into the SQLite post store")
+    parser.add_argument("--force", action="store_true", help="replace the files already in the database")
+    args = parser.parse_args()
+    asyncio.run(migrate_json_to_sqlite(force=args.force))
@@ -0,0 +1,129 @@
+import copy
+from contextvars import ContextVar
+from services.post.post_store import apply_change, matches_filters
+
+# Unit of work shared by every PostService running in the same request/task
+_current_transaction = ContextVar("post_transaction", default=None)
+
+
+def get_current_transaction():
+    return _current_transaction.get()
+
+
+class PostTransaction:
+    """
+    Buffers post changes and flushes them with one store write per touched file when
+    the block exits, or drops them when it raises (rollback). Reads made through
+    PostService while the transaction is open see the buffered changes. Meant for
+    bulk generation writes: publish completions don't wait for it (see
+    PostService.complete_post).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # json_file -> {post_id: change}, changes use the apply_change format
+        self.changes = {}
+        self._token = None
+        self._depth = 0
+
+    async def __aenter__(self):
+        if self._depth == 0:
+            self._token = _current_transaction.set(self)
+        self._depth += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth > 0:
+            return False
+
+        _current_transaction.reset(self._token)
+        self._token = None
+        if exc_type is not None:
+            self.rollback()
+            return False
+        await self.flush()
+        return False
+
+    def record_update(self, post_id, fields, json_file):
+        pending = self.changes.setdefault(json_file, {})
+        fields = copy.deepcopy(fields)
+        change = pending.get(post_id)
+        if change is None:
+            pending[post_id] = {"op": "update", "id": post_id, "fields": fields}
+        elif change["op"] == "update":
+            change["fields"].update(fields)
+        elif change["op"] == "save":
+            change["post"].update(fields)
+
+    def record_save(self, post_data, json_file):
+        pending = self.changes.setdefault(json_file, {})
+        pending[post_data["id"]] = {"op": "save", "post": copy.deepcopy(post_data)}
+
+    def record_delete(self, post_id, json_file):
+        pending = self.changes.setdefault(json_file, {})
+        pending[post_id] = {"op": "delete", "id": post_id}
+
+    def apply_pending(self, post, json_file):
+        """Returns the post with the buffered changes applied"""
+        if post is None:
+            return None
+        change = self.changes.get(json_file, {}).get(post["id"])
+        if change is None:
+            return post
+        if change["op"] == "save":
+            return copy.deepcopy(change["post"])
+        if change["op"] == "delete":
+            return None
+        post.update(copy.deepcopy(change["fields"]))
+        return post
+
+    def _may_change_match(self, keys, json_file):
+        for change in self.changes.get(json_file, {}).values():
+            if change["op"] != "update" or keys & change["fields"].keys():
+                return True
+        return False
+
+    async def get_post(self, post_id, json_file):
+        change = self.changes.get(json_file, {}).get(post_id)
+        if change and change["op"] == "save":
+            return copy.deepcopy(change["post"])
+        if change and change["op"] == "delete":
+            return None
+        return self.apply_pending(await self.store.get_post(post_id, json_file), json_file)
+
+    async def get_next_post(self, status_key, status_value, extra_filters, json_file):
+        keys = {status_key, *(extra_filters or {})}
+        if not self._may_change_match(keys, json_file):
+            post = await self.store.get_next_post(status_key, status_value, extra_filters, json_file)
+            return self.apply_pending(post, json_file)
+
+        # Buffered changes touch the filtered fields, the store alone can't answer
+        data = await self.store.load_document(json_file)
+        if data is None and not self.changes.get(json_file):
+            return None
+        data = data or {"posts": []}
+        for change in self.changes.get(json_file, {}).values():
+            apply_change(data, copy.deepcopy(change))
+        for post in data["posts"]:
+            if matches_filters(post, status_key, status_value, extra_filters):
+                return post
+        return None
+
+    async def load_document(self, json_file):
+        data = await self.store.load_document(json_file)
+        if not self.changes.get(json_file):
+            return data
+        data = data or {"posts": []}
+        for change in self.changes[json_file].values():
+            apply_change(data, copy.deepcopy(change))
+        return data
+
+    def rollback(self):
+        self.changes = {}
+
+    async def flush(self):
+        changes, self.changes = self.changes, {}
+        for json_file, pending in changes.items():
+            if pending:
+                await self.store.apply_changes(list(pending.values()), json_file)
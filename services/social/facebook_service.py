@@ -6,8 +6,6 @@ from dotenv import load_dotenv
 from services.post.post_service import PostService
 from utils.path_utils import get_public_image_url
 
-KEY_CONTENT = "meta_content"
-
 class FacebookAPI:
     def __init__(self):
         load_dotenv()
@@ -134,9 +132,9 @@ class FacebookAPI:
 
         # Recolectar captions, links y hashtags de threads
         for t in threads:
-            thread_caption = t.get(KEY_CONTENT, "").strip()
-            thread_links = t.get("fb_links", [])
-            thread_hashtags = t.get("hashtags_facebook", [])
+            thread_caption = t.meta_content.strip()
+            thread_links = t.fb_links
+            thread_hashtags = t.hashtags_facebook
 
             if thread_caption:
                 captions.append(thread_caption)
@@ -170,30 +168,35 @@ class FacebookAPI:
         if not self.allow_posting:
             raise HTTPException(status_code=403, detail="Posting is disabled by configuration.")
 
-        post_data = await self.post_service.get_next_post('fb_status', 'not_posted', extra_filters={'is_processed': True})
+        post_data = await self.post_service.get_next_post('fb_status', 'not_posted', extra_filters={'is_processed': True}, claim=True)
 
         if not post_data:
             raise HTTPException(status_code=404, detail="No Facebook posts found to publish.")
 
-        caption = post_data.get(KEY_CONTENT)
-        media_path = post_data.get("media_path_remote") or post_data.get("media_path")
-        is_album = post_data.get("is_thread")
-        threads = post_data.get("threads")
-        links = post_data.get("fb_links", [])
-        hashtags = post_data.get("hashtags_facebook", [])
-
-        if is_album:
-            thread_media_paths = [
-                t.get("media_path_remote") or t.get("media_path")
-                for t in threads
-                if t.get("media_path_remote") or t.get("media_path")
-            ]
-            media_paths = [media_path] + thread_media_paths
-            combined_caption = self.combine_captions(caption, threads, links, hashtags)
-            result = await self.post_album(combined_caption, media_paths)
-        else:
-            combined_caption = self.combine_captions(caption, [], links, hashtags)
-            result = await self.post_photo(combined_caption, media_path)
-
-        await self.post_service.update_post_status(post_data["id"], status_key="fb_status")
+        caption = post_data.meta_content
+        media_path = post_data.get_media_path()
+        is_album = post_data.is_thread
+        threads = post_data.threads
+        links = post_data.fb_links
+        hashtags = post_data.hashtags_facebook
+
+        try:
+            if is_album:
+                thread_media_paths = [
+                    t.get_media_path()
+                    for t in threads
+                    if t.get_media_path()
+                ]
+                media_paths = [media_path] + thread_media_paths
+                combined_caption = self.combine_captions(caption, threads, links, hashtags)
+                result = await self.post_album(combined_caption, media_paths)
+            else:
+                combined_caption = self.combine_captions(caption, [], links, hashtags)
+                result = await self.post_photo(combined_caption, media_path)
+        except BaseException:
+            # Not published: the next run can take the post again right away
+            await self.post_service.release_post(post_data, status_key="fb_status")
+            raise
+
+        await self.post_service.complete_post(post_data, status_key="fb_status")
         return result
@@ -6,8 +6,6 @@ from dotenv import load_dotenv
 from services.post.post_service import PostService
 from utils.file_utils import FileHandler
 
-KEY_CONTENT = "x_content"
-
 class XAPI:
     def __init__(self):
         load_dotenv()
@@ -61,8 +59,8 @@ class XAPI:
         """Builds list of (caption, media) tuples for each thread tweet."""
         return [
             (
-                self.combine_caption(thread[KEY_CONTENT], thread.get("x_links", [])),
-                thread.get("media_path_remote") or thread.get("media_path")
+                self.combine_caption(thread.x_content, thread.x_links),
+                thread.get_media_path()
             )
             for thread in threads
         ]
@@ -132,27 +130,32 @@ class XAPI:
         if not self.allow_posting:
             raise HTTPException(status_code=403, detail="Posting is disabled by configuration.")
         
-        tweet_data = await self.post_service.get_next_post('x_status', 'not_posted', extra_filters={'is_processed': True})
+        tweet_data = await self.post_service.get_next_post('x_status', 'not_posted', extra_filters={'is_processed': True}, claim=True)
 
         if not tweet_data:
             raise HTTPException(status_code=404, detail="No tweets to post.")
 
-        tweet_text = tweet_data.get(KEY_CONTENT)
-        media_path = tweet_data.get("media_path_remote") or tweet_data.get("media_path")
-        is_thread = tweet_data.get("is_thread")
-        threads = tweet_data.get("threads")
-        links = tweet_data.get("x_links", [])
-        hashtags = tweet_data.get("hashtags_x", [])
-
-        if is_thread:
-            first_caption = self.combine_caption(tweet_text, links, hashtags)
-            first_tweet = (first_caption, media_path)
-            thread_list = self.get_thread_list(threads)
-            tweets = [first_tweet] + thread_list
-            result = await self.post_thread(tweets)
-        else:
-            combined_caption = self.combine_caption(tweet_text, links, hashtags)
-            result = await self.post_tweet(combined_caption, media_path)
-
-        await self.post_service.update_post_status(tweet_data["id"], status_key="x_status")
+        tweet_text = tweet_data.x_content
+        media_path = tweet_data.get_media_path()
+        is_thread = tweet_data.is_thread
+        threads = tweet_data.threads
+        links = tweet_data.x_links
+        hashtags = tweet_data.hashtags_x
+
+        try:
+            if is_thread:
+                first_caption = self.combine_caption(tweet_text, links, hashtags)
+                first_tweet = (first_caption, media_path)
+                thread_list = self.get_thread_list(threads)
+                tweets = [first_tweet] + thread_list
+                result = await self.post_thread(tweets)
+            else:
+                combined_caption = self.combine_caption(tweet_text, links, hashtags)
+                result = await self.post_tweet(combined_caption, media_path)
+        except BaseException:
+            # Not published: the next run can take the post again right away
+            await self.post_service.release_post(tweet_data, status_key="x_status")
+            raise
+
+        await self.post_service.complete_post(tweet_data, status_key="x_status")
         return result
@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import pytest
+
+# Settings read when the services are imported, set before the tests import them
+os.environ.setdefault("POSTS_JSON_FILE", "posts.json")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.post.post_store import JSONPostStore, SQLitePostStore
+
+
+def make_post(post_id, **fields):
+    """A processed post waiting on every platform"""
+    return {
+        "id": post_id,
+        "is_processed": True,
+        "x_status": "not_posted",
+        "ig_status": "not_posted",
+        "fb_status": "not_posted",
+        **fields,
+    }
+
+
+@pytest.fixture
+def project_root(tmp_path, monkeypatch):
+    """Empty PROJECT_ROOT, so the JSON files, the database and the locks live in tmp_path"""
+    os.makedirs(tmp_path / "json" / "data")
+    monkeypatch.setenv("PROJECT_ROOT", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def write_posts(project_root):
+    def write(posts, json_file=os.environ["POSTS_JSON_FILE"]):
+        with open(project_root / "json" / json_file, "w") as file:
+            json.dump({"posts": posts}, file)
+    return write
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def make_store(request, project_root):
+    """Builds stores of the backend; each one stands for another worker process"""
+    def make():
+        return JSONPostStore() if request.param == "json" else SQLitePostStore()
+    return make
@@ -0,0 +1,103 @@
+import asyncio
+from conftest import make_post
+from services.post.post_service import POST_JSON_FILE
+from services.post.post_cursor_service import PostCursorService
+
+
+def count_rebuilds(cursor):
+    rebuilds = []
+    rebuild = cursor.rebuild
+
+    async def counted_rebuild():
+        rebuilds.append(1)
+        await rebuild()
+
+    cursor.rebuild = counted_rebuild
+    return rebuilds
+
+
+def test_first_use_rebuilds_once(make_store, write_posts):
+    write_posts([make_post(1), make_post(2)])
+
+    async def run():
+        cursor = PostCursorService(make_store(), POST_JSON_FILE)
+        rebuilds = count_rebuilds(cursor)
+        await cursor.ensure_fresh()
+        await cursor.ensure_fresh()
+        return cursor, rebuilds
+
+    cursor, rebuilds = asyncio.run(run())
+    assert len(rebuilds) == 1
+    assert cursor.queues["x_status"] == [1, 2]
+
+
+def test_other_workers_writes_are_applied_without_rebuild(make_store, write_posts):
+    write_posts([make_post(1), make_post(2), make_post(3)])
+
+    async def run():
+        store, other_worker = make_store(), make_store()
+        cursor = PostCursorService(store, POST_JSON_FILE)
+        await cursor.ensure_fresh()
+        rebuilds = count_rebuilds(cursor)
+
+        await other_worker.update_post_fields(1, {"x_status": "posted"}, POST_JSON_FILE)
+        await other_worker.delete_posts([3], POST_JSON_FILE)
+        await other_worker.save_post(make_post(4), POST_JSON_FILE)
+        # Seen by the listener while the writes above are not, caught up on next use
+        await store.update_post_fields(2, {"ig_status": "posted"}, POST_JSON_FILE)
+        await cursor.ensure_fresh()
+        return cursor, rebuilds
+
+    cursor, rebuilds = asyncio.run(run())
+    assert rebuilds == []
+    assert cursor.queues == {"x_status": [2, 4], "ig_status": [1, 4], "fb_status": [1, 2, 4]}
+
+
+def test_saved_cursors_are_caught_up(make_store, write_posts):
+    write_posts([make_post(1), make_post(2)])
+
+    async def run():
+        await PostCursorService(make_store(), POST_JSON_FILE).ensure_fresh()
+        store = make_store()
+        await store.update_post_fields(1, {"fb_status": "posted"}, POST_JSON_FILE)
+
+        cursor = PostCursorService(store, POST_JSON_FILE)
+        rebuilds = count_rebuilds(cursor)
+        await cursor.ensure_fresh()
+        return cursor, rebuilds
+
+    cursor, rebuilds = asyncio.run(run())
+    assert rebuilds == []
+    assert cursor.queues["fb_status"] == [2]
+
+
+def test_document_replaced_during_lookup(make_store, write_posts):
+    write_posts([make_post(1), make_post(2), make_post(3)])
+
+    async def run():
+        store, other_worker = make_store(), make_store()
+        cursor = PostCursorService(store, POST_JSON_FILE)
+        await cursor.ensure_fresh()
+        # Post 1 is stale in the queues, the lookup drops it after the replace below
+        await other_worker.update_post_fields(1, {"x_status": "posted"}, POST_JSON_FILE)
+        cursor.version = await store.get_version(POST_JSON_FILE)
+
+        get_post = store.get_post
+        replaced = []
+
+        async def get_post_then_replace(post_id, json_file):
+            post = await get_post(post_id, json_file)
+            if not replaced:
+                replaced.append(post_id)
+                await store.replace_posts([make_post(1, x_status="posted"), make_post(3)], json_file)
+            return post
+
+        store.get_post = get_post_then_replace
+        next_post = await cursor.get_next_post("x_status")
+        store.get_post = get_post
+        await cursor.ensure_fresh()
+        return next_post, cursor
+
+    next_post, cursor = asyncio.run(run())
+    assert next_post["id"] == 3
+    assert cursor.queues["x_status"] == [3]
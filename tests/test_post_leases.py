@@ -0,0 +1,85 @@
+import asyncio
+from conftest import make_post
+from services.post import post_service
+from services.post.post_service import PostService, POST_JSON_FILE
+
+PUBLISH_FILTERS = {"is_processed": True}
+
+
+async def claim_next(service, status_key="x_status"):
+    return await service.get_next_post(status_key, "not_posted", PUBLISH_FILTERS, claim=True)
+
+
+def test_concurrent_claims_get_different_posts(make_store, write_posts):
+    write_posts([make_post(1), make_post(2), make_post(3)])
+
+    async def run():
+        workers = [PostService(make_store()) for _ in range(3)]
+        posts = await asyncio.gather(*(claim_next(worker) for worker in workers))
+        return sorted(post.id for post in posts)
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_claims_are_per_status_key(make_store, write_posts):
+    write_posts([make_post(1)])
+
+    async def run():
+        service = PostService(make_store())
+        x_post = await claim_next(service, "x_status")
+        ig_post = await claim_next(service, "ig_status")
+        return x_post, ig_post, await claim_next(service, "x_status")
+
+    x_post, ig_post, other = asyncio.run(run())
+    assert x_post.id == ig_post.id == 1
+    assert other is None
+
+
+def test_complete_post_sets_status_and_drops_lease(make_store, write_posts):
+    write_posts([make_post(1), make_post(2)])
+
+    async def run():
+        service = PostService(make_store())
+        post = await claim_next(service)
+        await service.complete_post(post, status_key="x_status", json_file=POST_JSON_FILE)
+        stored = await service.store.get_post(post.id, POST_JSON_FILE)
+        return post, stored, await claim_next(service)
+
+    post, stored, next_post = asyncio.run(run())
+    assert post.id == 1
+    assert stored["x_status"] == "posted"
+    assert "x_status" not in stored.get("claimed_by", {})
+    assert next_post.id == 2
+
+
+def test_release_post_makes_it_claimable_again(make_store, write_posts):
+    write_posts([make_post(1), make_post(2)])
+
+    async def run():
+        service = PostService(make_store())
+        post = await claim_next(service)
+        await service.release_post(post, status_key="x_status", json_file=POST_JSON_FILE)
+        stored = await service.store.get_post(post.id, POST_JSON_FILE)
+        return stored, await claim_next(service)
+
+    stored, claimed_again = asyncio.run(run())
+    assert stored["x_status"] == "not_posted"
+    assert claimed_again.id == 1
+
+
+def test_completion_after_lost_lease_keeps_the_new_lease(make_store, write_posts, monkeypatch):
+    write_posts([make_post(1)])
+    # Leases expire right away, so the second worker takes the post over
+    monkeypatch.setattr(post_service, "POST_LEASE_SECONDS", 0)
+
+    async def run():
+        first, second = PostService(make_store()), PostService(make_store())
+        first_post = await claim_next(first)
+        second_post = await claim_next(second)
+        await first.complete_post(first_post, status_key="x_status", json_file=POST_JSON_FILE)
+        return first_post, second_post, await first.store.get_post(1, POST_JSON_FILE)
+
+    first_post, second_post, stored = asyncio.run(run())
+    assert first_post.id == second_post.id == 1
+    assert stored["x_status"] == "posted"
+    assert stored["claimed_by"]["x_status"] == second_post.get_claim_token("x_status")
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from conftest import make_post
+from services.post.post_service import PostService, POST_JSON_FILE
+
+
+def test_transaction_flushes_on_exit(make_store, write_posts):
+    write_posts([make_post(1)])
+
+    async def run():
+        service = PostService(make_store())
+        async with service.transaction():
+            await service.update_post_status(1, "posted", "ig_status", POST_JSON_FILE)
+            await service.save_updated_post(make_post(2), POST_JSON_FILE)
+            # Buffered: visible through the service, not written to the store yet
+            buffered = await service.get_post(1, POST_JSON_FILE)
+            before_flush = await service.store.get_post(1, POST_JSON_FILE)
+        return buffered, before_flush, await service.store.load_document(POST_JSON_FILE)
+
+    buffered, before_flush, data = asyncio.run(run())
+    assert buffered.ig_status == "posted"
+    assert before_flush["ig_status"] == "not_posted"
+    assert [post["id"] for post in data["posts"]] == [1, 2]
+    assert data["posts"][0]["ig_status"] == "posted"
+
+
+def test_transaction_rolls_back_on_error(make_store, write_posts):
+    write_posts([make_post(1)])
+
+    async def run():
+        service = PostService(make_store())
+        with pytest.raises(RuntimeError):
+            async with service.transaction():
+                await service.update_post_status(1, "posted", "ig_status", POST_JSON_FILE)
+                await service.save_updated_post(make_post(2), POST_JSON_FILE)
+                raise RuntimeError("generation failed")
+        return await service.store.load_document(POST_JSON_FILE)
+
+    data = asyncio.run(run())
+    assert [post["id"] for post in data["posts"]] == [1]
+    assert data["posts"][0]["ig_status"] == "not_posted"
+
+
+def test_completion_inside_transaction_is_written_right_away(make_store, write_posts):
+    write_posts([make_post(1)])
+
+    async def run():
+        service = PostService(make_store())
+        with pytest.raises(RuntimeError):
+            async with service.transaction():
+                # Buffered save of the post, then its publication
+                await service.save_updated_post(make_post(1, x_content="edited"), POST_JSON_FILE)
+                post = await service.get_next_post("x_status", "not_posted", {"is_processed": True}, claim=True)
+                await service.complete_post(post, status_key="x_status", json_file=POST_JSON_FILE)
+                raise RuntimeError("next platform failed")
+        return await service.store.get_post(1, POST_JSON_FILE)
+
+    stored = asyncio.run(run())
+    assert stored["x_status"] == "posted"
+    assert "x_content" not in stored
+
+
+def test_flush_does_not_revert_a_completion(make_store, write_posts):
+    write_posts([make_post(1)])
+
+    async def run():
+        service = PostService(make_store())
+        async with service.transaction():
+            await service.save_updated_post(make_post(1, x_content="edited"), POST_JSON_FILE)
+            post = await service.get_next_post("x_status", "not_posted", {"is_processed": True}, claim=True)
+            await service.complete_post(post, status_key="x_status", json_file=POST_JSON_FILE)
+        return await service.store.get_post(1, POST_JSON_FILE)
+
+    stored = asyncio.run(run())
+    assert stored["x_status"] == "posted"
+    assert stored["x_content"] == "edited"
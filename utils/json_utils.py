@@ -1,20 +1,270 @@
 import json
 import os
+import uuid
+import fnmatch
 import aiofiles
 from utils.base_utils import get_path_from_base
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# auto (orjson when installed), orjson or json
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "auto").lower()
+
+# Files edited by hand keep the indented output, everything else is written compact.
+# Comma separated json_filename patterns (relative to json/).
+PRETTY_JSON_FILES = [
+    pattern.strip() for pattern in os.getenv(
+        "PRETTY_JSON_FILES",
+        ",".join(filter(None, [
+            os.getenv("UNPROCESSED_POSTS_JSON_FILE", "unprocessed/unprocessed-posts.json"),
+            os.getenv("APP_DATA_JSON_FILE", "data/app-data.json"),
+            "data/options/*.json",
+        ]))
+    ).split(",") if pattern.strip()
+]
+
+# Bytes read at a time by JSONHandler.iter_posts
+JSON_STREAM_CHUNK_SIZE = int(os.getenv("JSON_STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+# Process-wide cache of file contents: json_path -> [(mtime_ns, size), content bytes,
+# read-only parsed document or None until a readonly load asks for it]
+_json_cache = {}
+
+
+def get_file_signature(json_path):
+    """Returns (mtime_ns, size) for the file or None if it does not exist"""
+    try:
+        stat = os.stat(json_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def clear_json_cache():
+    _json_cache.clear()
+
+
+class FrozenDict(dict):
+    """dict of a cached document, shared by every reader so it can't be changed"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Cached JSON documents are read-only, load_json(readonly=False) returns a copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+class FrozenList(list):
+    """list of a cached document, see FrozenDict"""
+
+    __slots__ = ()
+
+    _readonly = FrozenDict._readonly
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Plain (mutable) copy of a value taken from a read-only document"""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
+
+
+def is_pretty_json_file(json_filename):
+    return any(fnmatch.fnmatch(json_filename, pattern) for pattern in PRETTY_JSON_FILES)
+
+
+class JSONSerializer:
+    """Parses and dumps JSON with orjson when available, falling back to the stdlib json"""
+
+    def __init__(self, backend=JSON_SERIALIZER):
+        if backend == "orjson" and orjson is None:
+            raise ValueError("JSON_SERIALIZER=orjson but orjson is not installed")
+        self.use_orjson = orjson is not None and backend in ("auto", "orjson")
+
+    def loads(self, content):
+        if self.use_orjson:
+            return orjson.loads(content)
+        return json.loads(content)
+
+    def dumps(self, data, pretty=False):
+        """Returns UTF-8 bytes; pretty output keeps the historical 4-space indentation"""
+        if pretty:
+            return json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8")
+        if self.use_orjson:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+json_serializer = JSONSerializer()
+
+
+class JSONStreamReader:
+    """
+    Reads a JSON text file incrementally, decoding one value at a time, so only the
+    value being decoded (plus one chunk) is held in memory.
+    """
+
+    def __init__(self, file, chunk_size=JSON_STREAM_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    async def _fill(self):
+        chunk = await self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    async def peek(self):
+        """Skips whitespace and returns the next character ("" at the end of the file)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not await self._fill():
+                return ""
+
+    async def expect(self, chars):
+        char = await self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON stream: expected one of {chars!r}, got {char!r}")
+        self.pos += 1
+        return char
+
+    async def read_value(self):
+        await self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value touching the end of the buffer may be cut (e.g. a number)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            await self._fill()
+
+    async def iter_array(self, key):
+        """Yields the items of the array stored under key in the top-level object"""
+        await self.expect("{")
+        if await self.peek() == "}":
+            return
+
+        while True:
+            name = await self.read_value()
+            await self.expect(":")
+            if name != key:
+                await self.read_value()
+            else:
+                await self.expect("[")
+                if await self.peek() == "]":
+                    return
+                while True:
+                    yield await self.read_value()
+                    if await self.expect(",]") == "]":
+                        return
+            if await self.expect(",}") == "}":
+                return
+
+
 class JSONHandler:
-    async def load_json(self, json_filename):
-        """Asynchronously loads the JSON file"""
+    def __init__(self, serializer=None):
+        self.serializer = serializer or json_serializer
+
+    async def load_json(self, json_filename, readonly=False):
+        """
+        Asynchronously loads the JSON file.
+        The content is cached per path and reused while the file mtime and size do
+        not change. By default the returned object belongs to the caller (parsed from
+        the cached bytes). With readonly=True every caller gets the same parsed
+        document, frozen (FrozenDict/FrozenList raise on writes), so repeated reads
+        cost nothing; thaw() gives a mutable copy of any part of it.
+        """
         json_path = get_path_from_base("json", json_filename)
-        if os.path.exists(json_path):
-            async with aiofiles.open(json_path, "r", encoding="utf-8") as file:
+        signature = get_file_signature(json_path)
+        if signature is None:
+            _json_cache.pop(json_path, None)
+            return None
+
+        cached = _json_cache.get(json_path)
+        if not cached or cached[0] != signature:
+            async with aiofiles.open(json_path, "rb") as file:
                 content = await file.read()
-                return json.loads(content)
-        return None
+            cached = _json_cache[json_path] = [signature, content, None]
+            if not readonly:
+                return self.serializer.loads(content)
+
+        if not readonly:
+            return self.serializer.loads(cached[1])
+        if cached[2] is None:
+            cached[2] = freeze(self.serializer.loads(cached[1]))
+        return cached[2]
+
+    async def iter_posts(self, json_filename, chunk_size=JSON_STREAM_CHUNK_SIZE):
+        """
+        Asynchronously yields the posts of the JSON file one at a time.
+        The file is read in chunks and stops being read when the caller stops
+        iterating, so finding the first matching post does not parse the whole file.
+        A document already cached by load_json is parsed from the cached content.
+        """
+        json_path = get_path_from_base("json", json_filename)
+        signature = get_file_signature(json_path)
+        if signature is None:
+            return
+
+        cached = _json_cache.get(json_path)
+        if cached and cached[0] == signature:
+            for post in (self.serializer.loads(cached[1]) or {}).get("posts", []):
+                yield post
+            return
+
+        async with aiofiles.open(json_path, "r", encoding="utf-8") as file:
+            async for post in JSONStreamReader(file, chunk_size).iter_array("posts"):
+                yield post
 
     async def save_json(self, data, json_filename):
-        """Asynchronously saves the JSON file"""
+        """
+        Asynchronously and atomically saves the JSON file (temp file + os.replace).
+        Compact unless the file is listed in PRETTY_JSON_FILES.
+        """
         json_path = get_path_from_base("json", json_filename)
-        async with aiofiles.open(json_path, "w", encoding="utf-8") as file:
-            await file.write(json.dumps(data, indent=4, ensure_ascii=False))
\ No newline at end of file
+        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        content = self.serializer.dumps(data, pretty=is_pretty_json_file(json_filename))
+        temp_path = f"{json_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(temp_path, "wb") as file:
+                await file.write(content)
+                await file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, json_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        # The written bytes, not data: the caller may keep changing its objects
+        _json_cache[json_path] = [get_file_signature(json_path), content, None]
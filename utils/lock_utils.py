@@ -0,0 +1,61 @@
+import os
+import uuid
+import socket
+import asyncio
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, locks become no-ops there
+    fcntl = None
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+def get_worker_id():
+    """Identifies this process among the uvicorn workers (and hosts)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def new_claim_token():
+    """Owner of one lease: unique per claim, so tasks of the same worker exclude each other"""
+    return f"{get_worker_id()}:{uuid.uuid4().hex}"
+
+
+class FileLock:
+    """
+    Advisory cross-process lock (fcntl.flock) on lock_path, used as
+    `async with FileLock(path): ...`. Not reentrant: flock locks belong to the open
+    file, so nesting the same path in one process would wait forever.
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self._file = None
+
+    async def __aenter__(self):
+        if fcntl is None:
+            return self
+
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self._file = open(self.lock_path, "a")
+        try:
+            while True:
+                try:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return self
+                except BlockingIOError:
+                    # Polled instead of blocking a thread so a cancelled request can't
+                    # leave the lock taken behind it
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+        except BaseException:
+            self._file.close()
+            self._file = None
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        return False